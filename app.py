@@ -4,15 +4,19 @@ iLearnHow Flask Backend
 Universal Lesson Player with User Authentication and Progress Tracking
 """
 
-from flask import Flask, request, jsonify, session, render_template
+from flask import Flask, Response, request, jsonify, session, render_template, g
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
 import json
 import os
 from datetime import datetime, timedelta
 import uuid
 
+from db_pool import DB_POOL_SIZE, get_connection, get_pool
+from habit_streaks import ActivityBitmap, backfill, ensure_schema, record_activity
+from lesson_service import LessonService
+from progress_buffer import WriteBehindBuffer
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production
@@ -21,10 +25,13 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 
 CORS(app, supports_credentials=True)
 
+# Largest replay POST /api/lessons/progress/bulk accepts (a year of 5-phase lessons)
+PROGRESS_BULK_MAX = int(os.environ.get('PROGRESS_BULK_MAX', '2000'))
+
 # Database setup
 def init_db():
     """Initialize SQLite database with tables"""
-    conn = sqlite3.connect('ilearnhow.db')
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Users table
@@ -85,12 +92,17 @@ def init_db():
             daily_goal_met BOOLEAN DEFAULT FALSE,
             weekly_goal_met BOOLEAN DEFAULT FALSE,
             monthly_goal_met BOOLEAN DEFAULT FALSE,
+            activity_bitmap BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     ''')
     
+    # Databases from before the streak bitmap get the column, filled from their lesson history
+    if ensure_schema(cursor):
+        backfill(cursor)
+    
     conn.commit()
     conn.close()
 
@@ -98,11 +110,18 @@ def init_db():
 init_db()
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect('ilearnhow.db')
-    conn.row_factory = sqlite3.Row
+    """Get a pooled database connection; close() hands it back for the next request"""
+    conn = get_connection()
+    g.setdefault('db_connections', []).append(conn)
     return conn
 
+@app.teardown_appcontext
+def release_db(error=None):
+    """Return connections a request left open, e.g. when a handler raised before closing"""
+    for conn in g.pop('db_connections', []):
+        if not getattr(conn, 'closed', False):
+            conn.close()
+
 @app.route('/')
 def index():
     """Serve the main application"""
@@ -115,7 +134,10 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'version': '1.0.0',
-        'backend': 'Flask'
+        'backend': 'Flask',
+        'database': get_pool().stats() if DB_POOL_SIZE > 0 else None,
+        'progress_buffer': PROGRESS_BUFFER.stats(),
+        'lessons': LESSON_SERVICE.stats()
     })
 
 # User Authentication Endpoints
@@ -281,10 +303,61 @@ def get_lesson_progress():
     progress = cursor.fetchall()
     conn.close()
     
+    # Overlay updates still waiting in the write-behind buffer so learners read their own writes
+    rows = {(row['lesson_day'], row['phase']): dict(row) for row in progress}
+    pending = PROGRESS_BUFFER.pending(
+        lambda key: key[0] == user_id and (not lesson_day or key[1] == lesson_day)
+    )
+    for (_, day, phase), event in pending.items():
+        rows[(day, phase)] = {
+            'lesson_day': day,
+            'phase': phase,
+            'completed': int(bool(event['completed'])),
+            'answers': event['answers'],
+            'time_spent': event['time_spent'],
+            'completed_at': event['completed_at']
+        }
+    
     return jsonify({
-        'progress': [dict(row) for row in progress]
+        'progress': [rows[key] for key in sorted(rows)]
     })
 
+def _whole_number(value):
+    """An int from an int or a string of digits, None for anything else (bools included)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+def progress_event(data, now):
+    """(lesson_day, phase) and the buffered event for one progress update completed at `now`
+    
+    Raises ValueError for input the database would reject, so a bad update fails its own request
+    instead of the batch it would be committed in.
+    """
+    lesson_day = _whole_number(data['lesson_day'])
+    if lesson_day is None or not 1 <= lesson_day <= 366:
+        raise ValueError('lesson_day must be a whole number from 1 to 366')
+    phase = _whole_number(data['phase'])
+    if phase is None or not 1 <= phase <= 5:
+        raise ValueError('phase must be a whole number from 1 to 5')
+    completed = data.get('completed', False)
+    if not isinstance(completed, bool):
+        raise ValueError('completed must be true or false')
+    time_spent = data.get('time_spent', 0)
+    if isinstance(time_spent, bool) or not isinstance(time_spent, (int, float)) or time_spent < 0:
+        raise ValueError('time_spent must be a non-negative number of seconds')
+    return (lesson_day, phase), {
+        'completed': completed,
+        'answers': json.dumps(data.get('answers', [])),
+        'time_spent': time_spent,
+        'completed_at': now.isoformat() if completed else None,
+        'completed_on': {now.date()} if completed else set()
+    }
+
 @app.route('/api/lessons/progress', methods=['POST'])
 def update_lesson_progress():
     """Update lesson progress"""
@@ -297,67 +370,90 @@ def update_lesson_progress():
     if not data or 'lesson_day' not in data or 'phase' not in data:
         return jsonify({'error': 'Lesson day and phase required'}), 400
     
-    lesson_day = data['lesson_day']
-    phase = data['phase']
-    completed = data.get('completed', False)
-    answers = json.dumps(data.get('answers', []))
-    time_spent = data.get('time_spent', 0)
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Update or insert progress
-    cursor.execute('''
-        INSERT OR REPLACE INTO lesson_progress 
-        (user_id, lesson_day, phase, completed, answers, time_spent, completed_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, lesson_day, phase, completed, answers, time_spent, 
-          datetime.now().isoformat() if completed else None))
+    try:
+        (lesson_day, phase), event = progress_event(data, datetime.now())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Update habit formation if lesson completed
-    if completed:
-        update_habit_formation(user_id, lesson_day, cursor)
-    
-    conn.commit()
-    conn.close()
+    # Queued for the next batched commit (written through with PROGRESS_FLUSH_MS=0)
+    PROGRESS_BUFFER.record((user_id, lesson_day, phase), event)
     
     return jsonify({'message': 'Progress updated successfully'})
 
-def update_habit_formation(user_id, lesson_day, cursor):
-    """Update habit formation metrics"""
-    # Get current habit data
-    cursor.execute('SELECT * FROM habit_formation WHERE user_id = ?', (user_id,))
-    habit = cursor.fetchone()
-    
-    if not habit:
-        return
-    
-    today = datetime.now().date()
-    last_activity = datetime.strptime(habit['last_activity_date'], '%Y-%m-%d').date() if habit['last_activity_date'] else None
-    
-    # Update streak
-    if last_activity is None or (today - last_activity).days == 1:
-        # Continue streak
-        new_streak = habit['streak_days'] + 1
-        streak_start = habit['current_streak_start'] or today.isoformat()
-    elif (today - last_activity).days == 0:
-        # Same day, no change
-        new_streak = habit['streak_days']
-        streak_start = habit['current_streak_start']
-    else:
-        # Break in streak
-        new_streak = 1
-        streak_start = today.isoformat()
+@app.route('/api/lessons/progress/bulk', methods=['POST'])
+def bulk_update_lesson_progress():
+    """Apply an ordered batch of progress updates, e.g. a session replayed after being offline
+    
+    Takes {"events": [...]} (or the bare list) of the bodies POST /api/lessons/progress accepts, each
+    optionally with the ISO "completed_at" it happened at so replayed completions count on the right day.
+    Every field of every event is checked before any is applied; the first bad one fails the request
+    with its index. The batch is committed in one transaction before responding.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
     
-    # Update longest streak
-    longest_streak = max(habit['longest_streak'], new_streak)
+    data = request.get_json(silent=True)
+    user_id = session['user_id']
+    events = data.get('events') if isinstance(data, dict) else data
+    
+    if not isinstance(events, list) or not events:
+        return jsonify({'error': 'A list of progress events required'}), 400
+    if len(events) > PROGRESS_BULK_MAX:
+        return jsonify({'error': f'At most {PROGRESS_BULK_MAX} progress events per request'}), 413
+    
+    now = datetime.now()
+    items = []
+    for index, event in enumerate(events):
+        if not isinstance(event, dict) or 'lesson_day' not in event or 'phase' not in event:
+            return jsonify({'error': 'Lesson day and phase required', 'index': index}), 400
+        happened = now
+        if event.get('completed_at') is not None:
+            try:
+                happened = datetime.fromisoformat(event['completed_at'].replace('Z', '+00:00'))
+            except (AttributeError, ValueError):
+                return jsonify({'error': 'Invalid completed_at', 'index': index}), 400
+            if happened.tzinfo is not None:
+                happened = happened.astimezone().replace(tzinfo=None)
+            # Client clocks run ahead; a completion cannot be in the future
+            happened = min(happened, now)
+        try:
+            (lesson_day, phase), progress = progress_event(event, happened)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'index': index}), 400
+        items.append(((user_id, lesson_day, phase), progress))
+    
+    # Later events for the same phase replace earlier ones; streaks update once per day of activity
+    PROGRESS_BUFFER.record_many(items)
+    PROGRESS_BUFFER.flush()
     
-    cursor.execute('''
-        UPDATE habit_formation 
-        SET streak_days = ?, longest_streak = ?, current_streak_start = ?, 
-            last_activity_date = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE user_id = ?
-    ''', (new_streak, longest_streak, streak_start, today.isoformat(), user_id))
+    return jsonify({
+        'message': 'Progress updated successfully',
+        'applied': len(items),
+        'phases': len({key for key, _ in items})
+    })
+
+def write_progress(cursor, events):
+    """Persist a batch of buffered progress events: one executemany, then one habit update per learner"""
+    cursor.executemany('''
+        INSERT OR REPLACE INTO lesson_progress 
+        (user_id, lesson_day, phase, completed, answers, time_spent, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (user_id, lesson_day, phase, event['completed'], event['answers'], event['time_spent'], event['completed_at'])
+        for (user_id, lesson_day, phase), event in events
+    ])
+    
+    # Streaks count days, so the batch's completions update each learner's activity bitmap once
+    activity = {}
+    for (user_id, _, _), event in events:
+        activity.setdefault(user_id, set()).update(event['completed_on'])
+    record_activity(cursor, activity)
+
+def merge_progress(previous, event):
+    """Latest state of a phase wins, but a completion it replaced still counts toward the streak"""
+    return dict(event, completed_on=previous['completed_on'] | event['completed_on'])
+
+PROGRESS_BUFFER = WriteBehindBuffer(write_progress, merge=merge_progress).start()
 
 # Habit Formation Endpoints
 @app.route('/api/habits/status')
@@ -368,6 +464,9 @@ def get_habit_status():
     
     user_id = session['user_id']
     
+    # Streaks are updated when buffered completions are written
+    PROGRESS_BUFFER.flush()
+    
     conn = get_db()
     cursor = conn.cursor()
     
@@ -380,15 +479,9 @@ def get_habit_status():
     
     conn.close()
     
-    return jsonify({
-        'streak_days': habit['streak_days'],
-        'longest_streak': habit['longest_streak'],
-        'current_streak_start': habit['current_streak_start'],
-        'last_activity_date': habit['last_activity_date'],
-        'daily_goal_met': bool(habit['daily_goal_met']),
-        'weekly_goal_met': bool(habit['weekly_goal_met']),
-        'monthly_goal_met': bool(habit['monthly_goal_met'])
-    })
+    # Derived for today from the activity bitmap, so a streak lapses and goals reset without a write
+    activity = ActivityBitmap.from_row(habit['activity_bitmap'], habit['last_activity_date'], habit['streak_days'])
+    return jsonify(activity.status(longest_streak=habit['longest_streak']))
 
 # User Preferences Endpoints
 @app.route('/api/user/preferences', methods=['GET'])
@@ -438,31 +531,29 @@ def update_user_preferences():
     return jsonify({'message': 'Preferences updated successfully'})
 
 # Lesson Data Endpoints (for 5-phase system)
+# Curriculum and lesson DNA, parsed once at startup and re-parsed off the request path when files change
+LESSON_SERVICE = LessonService().start()
+
 @app.route('/api/lessons/<int:day>')
 def get_lesson_data(day):
-    """Get lesson data for specific day"""
+    """Get lesson data for a specific day, in the variant picked by ?age=, ?tone= and ?language="""
     if day < 1 or day > 366:
         return jsonify({'error': 'Invalid lesson day'}), 400
     
-    # This would integrate with your existing curriculum system
-    # For now, return basic structure for 5-phase system
-    lesson_data = {
-        'day': day,
-        'phases': {
-            1: {'type': 'welcome', 'content': 'Welcome to today\'s lesson'},
-            2: {'type': 'question_1', 'content': 'First question content', 'choices': ['A', 'B']},
-            3: {'type': 'question_2', 'content': 'Second question content', 'choices': ['A', 'B']},
-            4: {'type': 'question_3', 'content': 'Third question content', 'choices': ['A', 'B']},
-            5: {'type': 'daily_fortune', 'content': 'Your daily fortune'}
-        },
-        'variants': {
-            'age_groups': ['age_2', 'age_5', 'age_8', 'age_12', 'age_16', 'age_25', 'age_40', 'age_60', 'age_80', 'age_102'],
-            'tones': ['grandmother', 'fun', 'neutral'],
-            'languages': ['english', 'spanish', 'french', 'german', 'chinese', 'japanese']
-        }
-    }
-    
-    return jsonify(lesson_data)
+    lesson = LESSON_SERVICE.lookup(
+        day,
+        age=request.args.get('age') or request.args.get('age_group'),
+        tone=request.args.get('tone'),
+        language=request.args.get('language')
+    )
+    if lesson is None:
+        return jsonify({'error': 'Lesson not found'}), 404
+    
+    # Bodies are pre-rendered per variant, so this only copies bytes
+    body, etag, _ = lesson
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
@@ -8,14 +8,25 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 import base64
-import json
-import time
 import wave
-import tempfile
-import subprocess
 import re
 
+from tts_alignment import align_text, wav_envelope
+from tts_bundle import BUNDLE_KEY, BundleError
+from tts_cache import AudioCache, cached_bundle, cached_encoding, cached_synthesis
+from tts_encoding import EncoderPool, requested_format
+from tts_engine import VoiceEnginePool, wav_duration
+from tts_http import (
+    AUDIO_EXPOSE_HEADERS, AUDIO_MIMETYPES, audio_response, bundle_response, busy_response, install_metrics,
+    install_timing, negotiate_audio, negotiate_bundle, readiness_response, tag_request
+)
+from tts_metrics import register_cache, register_scheduler
+from tts_profiling import mark, stage
+from tts_scheduler import SchedulerBusy, SynthesisScheduler
+
 app = Flask(__name__)
+install_metrics(app)
+install_timing(app)
 
 # CORS configuration - matches your Railway setup
 ALLOWED_ORIGINS_RAW = os.environ.get(
@@ -46,7 +57,8 @@ for origin in ALLOWED_ORIGINS_RAW:
 CORS(app, resources={r"/*": {
     "origins": allowed_origins,
     "methods": ["GET", "POST", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization"]
+    "allow_headers": ["Content-Type", "Authorization", "Range", "If-Range"],
+    "expose_headers": AUDIO_EXPOSE_HEADERS
 }})
 
 # Custom voice models - these should point to your trained models
@@ -63,6 +75,16 @@ VOICE_MODELS = {
     }
 }
 
+# Piper fallback voices are loaded once and stay resident between requests
+SCHEDULER = SynthesisScheduler()
+VOICE_ENGINES = VoiceEnginePool(scheduler=SCHEDULER)
+AUDIO_CACHE = AudioCache()
+ENCODERS = EncoderPool()
+register_cache(AUDIO_CACHE)
+register_scheduler(SCHEDULER)
+# Models load and warm up in the background; /ready gates traffic until they are hot
+WARMUP = VOICE_ENGINES.warm_up((voice["fallback"], None) for voice in VOICE_MODELS.values())
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({
@@ -73,9 +95,18 @@ def health():
         "voices": list(VOICE_MODELS.keys()),
         "custom_models": True,
         "cloudflare_pages_support": True,
-        "cors_enabled": True
+        "cors_enabled": True,
+        "cache": AUDIO_CACHE.stats(),
+        "scheduler": SCHEDULER.stats(),
+        "encoders": ENCODERS.stats(),
+        "warmup": WARMUP.stats()
     })
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: fails until every voice model is loaded and warmed up"""
+    return readiness_response(WARMUP)
+
 @app.route('/api/tts', methods=['POST'])
 def tts():
     try:
@@ -93,25 +124,49 @@ def tts():
         
         include_phonemes = data.get('include_phonemes', True)
         
+        # Accept: audio/* skips the base64 JSON envelope entirely
+        binary_format = negotiate_audio(request.accept_mimetypes)
+        if binary_format and binary_format not in ENCODERS.formats():
+            return jsonify({
+                "error": "Not Acceptable",
+                "allowed": [AUDIO_MIMETYPES[f] for f in ENCODERS.formats()] + ["application/json"]
+            }), 406
+        audio_format = binary_format or requested_format(data.get('format'))
+        # Accept: application/vnd.ilearnhow.tts-bundle gets audio and visemes in one seekable binary file
+        wants_bundle = negotiate_bundle(request.accept_mimetypes)
+        tag_request(audio_format=audio_format)
+        if audio_format not in ENCODERS.formats():
+            return jsonify({"error": "Unsupported format", "allowed": ENCODERS.formats()}), 415
+        mark("validate")
+        
         print(f"🎤 Custom TTS: {speaker} - '{text[:50]}...'")
         
         # Try custom voice first, fallback to Piper
-        audio_data, duration, engine_used = generate_custom_voice(speaker, text)
+        audio_data, duration, engine_used, timeline = generate_custom_voice(speaker, text)
+        tag_request(speaker, engine_used)
         
         if not audio_data:
             return jsonify({"error": "Voice generation failed"}), 500
         
+        payload = encode_audio(speaker, text, audio_data, audio_format, engine_used)
+        
+        if binary_format:
+            print(f"✅ Custom TTS: Generated {duration:.2f}s using {engine_used}")
+            return audio_response(payload, binary_format, duration, speaker, engine_used)
+        if wants_bundle:
+            key, bundle = bundle_audio(speaker, text, audio_data, payload, audio_format, timeline, duration, engine_used)
+            return bundle_response(bundle, key, speaker, engine_used)
+        
         # Encode audio to base64
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+        with stage("serialize"):
+            audio_base64 = base64.b64encode(payload).decode('utf-8')
         
-        # Generate phonemes for avatar sync
-        phonemes = []
-        if include_phonemes:
-            phonemes = generate_phonemes(text, duration)
+        # Viseme timeline for avatar sync
+        phonemes = timeline if include_phonemes else []
         
         response = {
             "audio": audio_base64,
-            "audio_format": "wav",
+            "audio_format": audio_format,
             "duration": duration,
             "speaker": speaker,
             "text": text,
@@ -120,10 +175,68 @@ def tts():
         
         if phonemes:
             response["phonemes"] = phonemes
+        if data.get('include_envelope', False):
+            response["envelope"] = wav_envelope(audio_data)
         
         print(f"✅ Custom TTS: Generated {duration:.2f}s using {engine_used}")
-        return jsonify(response)
+        with stage("serialize"):
+            return jsonify(response)
         
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"❌ TTS Error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/tts/bundle/<key>', methods=['GET'])
+def tts_bundle(key):
+    """A bundle /api/tts or scripts/prerender-audio.py made, by content key; Range requests let players seek"""
+    bundle = AUDIO_CACHE.get(key) if BUNDLE_KEY.fullmatch(key) else None
+    if bundle is None:
+        return jsonify({"error": "Bundle not found"}), 404
+    tag_request(audio_format="bundle")
+    try:
+        return bundle_response(bundle, key)
+    except BundleError:
+        # A content key for plain audio or visemes, not a bundle
+        return jsonify({"error": "Bundle not found"}), 404
+
+@app.route('/api/tts/phonemes', methods=['POST'])
+def tts_phonemes():
+    """Phoneme timeline for a /api/tts request, for clients fetching binary audio"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Invalid JSON"}), 400
+        
+        text = data.get('text', '').strip()
+        if not text:
+            return jsonify({"error": "Text is required"}), 400
+        
+        speaker = data.get('speaker', 'kelly').lower()
+        if speaker not in VOICE_MODELS:
+            return jsonify({"error": f"Unsupported speaker. Use: {list(VOICE_MODELS.keys())}"}), 400
+        mark("validate")
+        
+        audio_data, duration, engine_used, timeline = generate_custom_voice(speaker, text)
+        tag_request(speaker, engine_used)
+        if not audio_data:
+            return jsonify({"error": "Voice generation failed"}), 500
+        
+        result = {
+            "duration": duration,
+            "speaker": speaker,
+            "text": text,
+            "engine": engine_used,
+            "phonemes": timeline
+        }
+        if data.get('include_envelope', False):
+            result["envelope"] = wav_envelope(audio_data)
+        with stage("serialize"):
+            return jsonify(result)
+        
+    except SchedulerBusy as e:
+        return busy_response(e)
     except Exception as e:
         print(f"❌ TTS Error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -145,6 +258,20 @@ def generate_custom_voice(speaker, text):
     print(f"🔄 Using Piper fallback for {speaker}")
     return generate_with_piper(speaker, text, voice_config["fallback"])
 
+def encode_audio(speaker, text, audio_data, audio_format, engine_used):
+    """Compress generated audio; Piper output is cached next to its WAV"""
+    if engine_used == "piper_fallback":
+        return cached_encoding(
+            AUDIO_CACHE, ENCODERS, speaker, text, VOICE_MODELS[speaker]["fallback"], audio_data, audio_format
+        )
+    return ENCODERS.encode(audio_data, audio_format)
+
+def bundle_audio(speaker, text, audio_data, payload, audio_format, timeline, duration, engine_used):
+    """(key, playback bundle) for generated audio, cached so the player can fetch it again in ranges"""
+    voice_config = VOICE_MODELS[speaker]
+    model = voice_config["fallback"] if engine_used == "piper_fallback" else voice_config["model_path"]
+    return cached_bundle(AUDIO_CACHE, speaker, text, model, audio_data, payload, audio_format, timeline, duration)
+
 def generate_with_custom_model(speaker, text, voice_config):
     """Generate voice using your custom trained model"""
     
@@ -164,12 +291,15 @@ def generate_with_custom_model(speaker, text, voice_config):
             audio_data = f.read()
         
         # Get duration
-        with wave.open(reference_files[speaker], 'rb') as wav:
+        with stage("duration"), wave.open(reference_files[speaker], 'rb') as wav:
             frames = wav.getnframes()
             rate = wav.getframerate()
             duration = frames / float(rate)
+            pcm = wav.readframes(frames) if wav.getsampwidth() == 2 and wav.getnchannels() == 1 else None
         
-        return audio_data, duration, "custom_trained"
+        # Only spelling is known for reference audio; bound it by where the clip is voiced
+        timeline = align_text(text, pcm, rate) if pcm is not None else align_text(text, duration=duration)
+        return audio_data, duration, "custom_trained", timeline
     
     # If no reference audio, fall back to Piper
     raise Exception("Custom model not yet implemented")
@@ -177,71 +307,14 @@ def generate_with_custom_model(speaker, text, voice_config):
 def generate_with_piper(speaker, text, piper_model):
     """Generate voice using Piper TTS as fallback"""
     
-    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-        output_path = tmp_file.name
-    
-    try:
-        # Use Piper to generate speech
-        cmd = ['piper', '--model', piper_model, '--output_file', output_path]
-        
-        process = subprocess.Popen(
-            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, text=True
-        )
-        
-        stdout, stderr = process.communicate(input=text)
-        
-        if process.returncode != 0:
-            raise Exception(f"Piper failed: {stderr}")
-        
-        # Read generated audio
-        with open(output_path, 'rb') as audio_file:
-            audio_data = audio_file.read()
-        
-        # Get duration
-        with wave.open(output_path, 'rb') as wav_file:
-            frames = wav_file.getnframes()
-            rate = wav_file.getframerate()
-            duration = frames / float(rate)
-        
-        return audio_data, duration, "piper_fallback"
-        
-    finally:
-        # Clean up
-        if os.path.exists(output_path):
-            os.unlink(output_path)
-
-def generate_phonemes(text, duration):
-    """Generate simple phoneme timing for avatar sync"""
-    # Simple phoneme generation - you can enhance this
-    words = text.split()
-    word_count = len(words)
-    
-    if word_count == 0:
-        return []
-    
-    phonemes = []
-    time_per_word = duration / word_count
-    
-    for i, word in enumerate(words):
-        start_time = i * time_per_word
-        end_time = (i + 1) * time_per_word
-        
-        # Simple phoneme mapping (you can enhance this)
-        phoneme = "A" if any(v in word.lower() for v in "aeiou") else "E"
-        
-        phonemes.append({
-            "phoneme": phoneme,
-            "start": start_time,
-            "end": end_time,
-            "word": word
-        })
+    audio_data, timeline = cached_synthesis(AUDIO_CACHE, VOICE_ENGINES, speaker, text, piper_model)
     
-    return phonemes
+    return audio_data, wav_duration(audio_data), "piper_fallback", timeline
 
 if __name__ == '__main__':
     print("🎤 Starting Custom Voice TTS Server...")
     print(f"Available voices: {list(VOICE_MODELS.keys())}")
-    print("Server will start on port 8080")
+    port = int(os.environ.get('PORT', 8080))
+    print(f"Server will start on port {port}")
     
-    app.run(host='0.0.0.0', port=8080, debug=False)
+    app.run(host='0.0.0.0', port=port, debug=False)
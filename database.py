@@ -71,6 +71,7 @@ def init_database(db_path='ilearnhow.db'):
             daily_goal_met BOOLEAN DEFAULT FALSE,
             weekly_goal_met BOOLEAN DEFAULT FALSE,
             monthly_goal_met BOOLEAN DEFAULT FALSE,
+            activity_bitmap BLOB,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
@@ -219,6 +220,19 @@ def seed_test_data(db_path='ilearnhow.db'):
     conn.close()
     print("✅ Test data seeded")
 
+def backfill_habit_streaks(db_path='ilearnhow.db'):
+    """Rebuild every learner's activity bitmap, streaks and goals from their completed lessons"""
+    from habit_streaks import backfill, ensure_schema
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    ensure_schema(cursor)
+    updated = backfill(cursor)
+    conn.commit()
+    conn.close()
+    print(f"✅ Habit streaks backfilled for {updated} learners")
+    return updated
+
 def backup_database(db_path='ilearnhow.db'):
     """Create a backup of the database"""
     import shutil
@@ -285,6 +299,10 @@ if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == '--seed':
         seed_test_data()
     
+    # Recompute streaks from lesson_progress (e.g. after an import)
+    if '--backfill-streaks' in sys.argv[1:]:
+        backfill_habit_streaks()
+    
     # Show stats
     stats = get_database_stats()
     print("\n📊 Database Statistics:")
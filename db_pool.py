@@ -0,0 +1,160 @@
+"""
+Pooled SQLite Connections for the iLearnHow Flask backend
+Long-lived WAL-mode connections reused across requests, so readers never wait on the progress writers
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+
+DB_PATH = os.environ.get("ILEARNHOW_DB_PATH", "ilearnhow.db")
+# Connections kept open per worker process; 0 opens a fresh rollback-journal connection per request as before
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+# How long a writer waits on another's lock before "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_MB = int(os.environ.get("DB_MMAP_MB", "64"))
+# Prepared statements each connection keeps compiled, keyed by SQL text
+DB_STATEMENT_CACHE = int(os.environ.get("DB_STATEMENT_CACHE", "256"))
+
+# WAL lets readers run alongside the single writer; NORMAL only fsyncs at checkpoints, which is
+# durable against application crashes and loses at most the last commits on power loss
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    f"PRAGMA mmap_size={DB_MMAP_MB * 1024 * 1024}",
+    "PRAGMA temp_store=MEMORY"
+]
+
+
+def connect(path=DB_PATH):
+    """A tuned connection: WAL, synchronous=NORMAL, busy timeout, mmap and a statement cache"""
+    conn = sqlite3.connect(
+        path, timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_STATEMENT_CACHE, check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class PooledConnection:
+    """A pooled sqlite3 connection; close() hands it back to the pool instead of closing it"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+
+class ConnectionPool:
+    """Up to `size` open connections per process, handed to one request at a time
+
+    Connections opened before a fork are never reused in the child, so each worker of a pre-forking
+    server (gunicorn) builds its own pool.
+    """
+
+    def __init__(self, path=DB_PATH, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.opened = 0
+        self.acquired = 0
+        self.waits = 0
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    # The parent's connections (and their locks) belong to the parent
+                    self._idle = queue.LifoQueue()
+                    self._pid = os.getpid()
+                    self.opened = 0
+
+    def acquire(self, timeout=None):
+        """A connection from the pool, opening one while under `size` and otherwise waiting for one"""
+        self._check_fork()
+        with self._lock:
+            self.acquired += 1
+        try:
+            return PooledConnection(self, self._idle.get_nowait())
+        except queue.Empty:
+            pass
+        with self._lock:
+            opening = self.opened < self.size
+            if opening:
+                self.opened += 1
+        if opening:
+            try:
+                return PooledConnection(self, connect(self.path))
+            except Exception:
+                with self._lock:
+                    self.opened -= 1
+                raise
+        with self._lock:
+            self.waits += 1
+        timeout = DB_BUSY_TIMEOUT_MS / 1000 if timeout is None else timeout
+        try:
+            return PooledConnection(self, self._idle.get(timeout=timeout))
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"No database connection free after {timeout:.1f}s") from None
+
+    def release(self, conn):
+        if os.getpid() != self._pid:
+            return
+        if conn.in_transaction:
+            # Whatever the request left uncommitted is dropped, as closing the connection used to
+            conn.rollback()
+        self._idle.put(conn)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "size": self.size,
+            "open": self.opened,
+            "idle": self._idle.qsize(),
+            "acquired": self.acquired,
+            "waits": self.waits
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_connection():
+    """A pooled connection, or with DB_POOL_SIZE=0 a plain per-call connection as the backend used to open"""
+    if DB_POOL_SIZE <= 0:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return get_pool().acquire()
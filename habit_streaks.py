@@ -0,0 +1,194 @@
+"""
+Habit Streak Engine for the iLearnHow backend
+Daily activity kept as a bitmap per learner, from which streaks and goal flags are derived with bit operations
+"""
+
+import os
+from datetime import date, datetime, timedelta
+
+# One bit per day: a year of the curriculum, leap day included
+STREAK_WINDOW_DAYS = 366
+BITMAP_BYTES = (STREAK_WINDOW_DAYS + 7) // 8
+WINDOW_MASK = (1 << STREAK_WINDOW_DAYS) - 1
+
+# Active days out of the last 7 / 30 that meet the weekly and monthly goals
+WEEKLY_GOAL_DAYS = int(os.environ.get("HABIT_WEEKLY_GOAL_DAYS", "5"))
+MONTHLY_GOAL_DAYS = int(os.environ.get("HABIT_MONTHLY_GOAL_DAYS", "20"))
+
+
+def as_date(value):
+    """A date from a DATE column, an ISO timestamp or a datetime; None stays None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def trailing_ones(bits):
+    return (bits ^ (bits + 1)).bit_length() - 1
+
+
+def longest_run(bits):
+    """Longest run of set bits: each step shortens every run by one"""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+class ActivityBitmap:
+    """Days a learner was active, bit k set for last_day - k days
+
+    Anchoring bit 0 at the latest active day keeps marking today a shift and an OR, and the current
+    streak the count of trailing ones. Days older than STREAK_WINDOW_DAYS fall off; longest streaks
+    reaching back further survive in the stored longest_streak.
+    """
+
+    __slots__ = ("bits", "last_day")
+
+    def __init__(self, bits=0, last_day=None):
+        self.bits = bits & WINDOW_MASK if last_day is not None else 0
+        self.last_day = last_day
+
+    @classmethod
+    def from_row(cls, bitmap, last_activity_date, streak_days=0):
+        """Bitmap from a habit_formation row; rows that predate the bitmap are seeded from their streak"""
+        last_day = as_date(last_activity_date)
+        if bitmap is not None:
+            return cls(int.from_bytes(bitmap, "little"), last_day)
+        return cls((1 << min(streak_days or 0, STREAK_WINDOW_DAYS)) - 1, last_day)
+
+    @classmethod
+    def from_days(cls, days):
+        activity = cls()
+        for day in sorted(days):
+            activity.mark(day)
+        return activity
+
+    def to_blob(self):
+        return self.bits.to_bytes(BITMAP_BYTES, "little")
+
+    def mark(self, day):
+        """Record activity on `day`; returns the length of the streak it is part of"""
+        if self.last_day is None or day > self.last_day:
+            shift = (day - self.last_day).days if self.last_day is not None else STREAK_WINDOW_DAYS
+            self.bits = ((self.bits << shift) | 1) & WINDOW_MASK if shift < STREAK_WINDOW_DAYS else 1
+            self.last_day = day
+            return trailing_ones(self.bits)
+        offset = (self.last_day - day).days
+        if offset >= STREAK_WINDOW_DAYS:
+            return 0
+        self.bits |= 1 << offset
+        # A late day can join two runs: the ones from it back in time, and the newer ones above it
+        newer = offset - (~self.bits & ((1 << offset) - 1)).bit_length()
+        return trailing_ones(self.bits >> offset) + newer
+
+    def aligned(self, today):
+        """The bitmap re-anchored so bit 0 is `today`"""
+        if self.last_day is None:
+            return 0
+        offset = (today - self.last_day).days
+        if offset >= STREAK_WINDOW_DAYS:
+            return 0
+        return (self.bits << offset) & WINDOW_MASK if offset >= 0 else self.bits >> -offset
+
+    def current_streak(self, today):
+        """Consecutive active days up to today, or up to yesterday while today is still open"""
+        bits = self.aligned(today)
+        return trailing_ones(bits) if bits & 1 else trailing_ones(bits >> 1)
+
+    def status(self, today=None, longest_streak=0):
+        """habit_formation fields as of `today`"""
+        today = today or datetime.now().date()
+        bits = self.aligned(today)
+        streak = self.current_streak(today)
+        end = today if bits & 1 else today - timedelta(days=1)
+        return {
+            "streak_days": streak,
+            "longest_streak": max(longest_streak or 0, streak),
+            "current_streak_start": (end - timedelta(days=streak - 1)).isoformat() if streak else None,
+            "last_activity_date": self.last_day.isoformat() if self.last_day else None,
+            "daily_goal_met": bool(bits & 1),
+            "weekly_goal_met": (bits & 0x7F).bit_count() >= WEEKLY_GOAL_DAYS,
+            "monthly_goal_met": (bits & ((1 << 30) - 1)).bit_count() >= MONTHLY_GOAL_DAYS
+        }
+
+
+HABIT_COLUMNS = (
+    "streak_days", "longest_streak", "current_streak_start", "last_activity_date",
+    "daily_goal_met", "weekly_goal_met", "monthly_goal_met"
+)
+
+
+def _update_rows(cursor, updates):
+    cursor.executemany(f'''
+        UPDATE habit_formation
+        SET activity_bitmap = ?, {", ".join(f"{column} = ?" for column in HABIT_COLUMNS)},
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = ?
+    ''', updates)
+
+
+def record_activity(cursor, activity, today=None):
+    """Mark active days for many learners: {user_id: days}, one SELECT and one executemany for the lot"""
+    activity = {user_id: days for user_id, days in activity.items() if days}
+    if not activity:
+        return
+    today = today or datetime.now().date()
+    cursor.execute(f'''
+        SELECT user_id, activity_bitmap, last_activity_date, streak_days, longest_streak
+        FROM habit_formation WHERE user_id IN ({", ".join("?" * len(activity))})
+    ''', list(activity))
+    updates = []
+    for user_id, bitmap, last_activity_date, streak_days, longest_streak in cursor.fetchall():
+        bits = ActivityBitmap.from_row(bitmap, last_activity_date, streak_days)
+        for day in sorted(activity[user_id]):
+            longest_streak = max(longest_streak or 0, bits.mark(day))
+        status = bits.status(max(today, bits.last_day), longest_streak)
+        updates.append((bits.to_blob(), *(status[column] for column in HABIT_COLUMNS), user_id))
+    _update_rows(cursor, updates)
+
+
+def backfill(cursor, user_ids=None, today=None):
+    """Rebuild bitmaps, streaks and goals from completed lesson_progress rows; returns learners updated"""
+    today = today or datetime.now().date()
+    query = '''
+        SELECT DISTINCT h.user_id, date(p.completed_at)
+        FROM habit_formation h JOIN lesson_progress p ON p.user_id = h.user_id
+        WHERE p.completed AND p.completed_at IS NOT NULL
+    '''
+    params = []
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        query += f' AND h.user_id IN ({", ".join("?" * len(user_ids))})'
+        params = user_ids
+    cursor.execute(query, params)
+    days = {}
+    for user_id, day in cursor.fetchall():
+        if day:
+            days.setdefault(user_id, set()).add(as_date(day))
+    updates = []
+    for user_id, active in days.items():
+        bits = ActivityBitmap.from_days(active)
+        # Progress rows reach back past the window, so the longest run comes from the full history
+        first = min(active)
+        longest = longest_run(sum(1 << (day - first).days for day in active))
+        status = bits.status(max(today, bits.last_day), longest)
+        updates.append((bits.to_blob(), *(status[column] for column in HABIT_COLUMNS), user_id))
+    _update_rows(cursor, updates)
+    return len(updates)
+
+
+def ensure_schema(cursor):
+    """Add habit_formation.activity_bitmap to databases created before it; True when it was added"""
+    cursor.execute('PRAGMA table_info(habit_formation)')
+    if any(row[1] == 'activity_bitmap' for row in cursor.fetchall()):
+        return False
+    cursor.execute('ALTER TABLE habit_formation ADD COLUMN activity_bitmap BLOB')
+    return True
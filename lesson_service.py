@@ -0,0 +1,309 @@
+"""
+Lesson Content Service for the iLearnHow Flask backend
+Loads the curriculum month files and lesson DNA into an immutable day index, rebuilt in the background on change
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+
+BASE_DIR = Path(__file__).resolve().parent
+LESSON_DATA_DIR = Path(os.environ.get("LESSON_DATA_DIR", BASE_DIR / "data"))
+# How often the watcher checks the data files' mtimes; 0 loads once and never reloads
+LESSON_RELOAD_SECONDS = float(os.environ.get("LESSON_RELOAD_SECONDS", "5"))
+
+CURRICULUM_GLOB = "*_curriculum.json"
+DNA_GLOB = "*_normalized.json"
+CURRICULUM_DAYS = 366
+QUESTIONS = ("question_1", "question_2", "question_3")
+
+DEFAULT_AGE = "25"
+DEFAULT_TONE = "neutral"
+DEFAULT_LANGUAGE = "english"
+# Ages in years resolve to the oldest group not older than them; older ages count as MAX_AGE
+MAX_AGE = 120
+
+
+class LessonIndex:
+    """One immutable snapshot of the curriculum: every response body pre-rendered, keyed for O(1) lookup
+
+    days[day] is the curriculum entry (or None). Each day's rendered bodies live in bodies[day], keyed by
+    (age group, tone, language) for days with lesson DNA and by None for curriculum-only days.
+    """
+
+    __slots__ = ("days", "bodies", "age_groups", "ages", "tones", "languages", "signature", "loaded_at", "lessons")
+
+    def __init__(self, days, bodies, age_groups, tones, languages, signature, lessons):
+        self.days = days
+        self.bodies = bodies
+        self.age_groups = age_groups
+        self.tones = tones
+        self.languages = languages
+        self.signature = signature
+        self.lessons = lessons
+        self.loaded_at = time.time()
+        # Any age from 0 to MAX_AGE -> the oldest group not older than it
+        groups = sorted(age_groups, key=int)
+        self.ages = tuple(
+            max((g for g in groups if int(g) <= age), key=int, default=groups[0]) if groups else None
+            for age in range(MAX_AGE + 1)
+        )
+
+    def resolve_age(self, value):
+        """Age group for "age_25", "25" or any age in years; None when unparseable"""
+        if value is None or value == "":
+            return DEFAULT_AGE if DEFAULT_AGE in self.age_groups else (self.ages[0] if self.ages else None)
+        value = str(value)
+        if value.startswith("age_"):
+            value = value[len("age_"):]
+        if value in self.age_groups:
+            return value
+        try:
+            age = int(float(value))
+        except ValueError:
+            return None
+        return self.ages[max(0, min(age, MAX_AGE))]
+
+    def lookup(self, day, age=None, tone=None, language=None):
+        """(body, etag, variant) for a day, or None when the curriculum has no such day"""
+        bodies = self.bodies[day] if 0 < day < len(self.bodies) else None
+        if bodies is None:
+            return None
+        if None in bodies:
+            return bodies[None]
+        variant = (
+            self.resolve_age(age) or DEFAULT_AGE,
+            tone if tone in self.tones else DEFAULT_TONE,
+            language if language in self.languages else DEFAULT_LANGUAGE
+        )
+        return bodies.get(variant) or bodies.get((DEFAULT_AGE, DEFAULT_TONE, DEFAULT_LANGUAGE)) \
+            or next(iter(bodies.values()))
+
+
+def _text(entry, tone=None):
+    """display_text / voice_over_script of a {tone: {...}} or plain {...} DNA entry"""
+    if tone is not None and isinstance(entry, dict) and tone in entry:
+        entry = entry[tone]
+    entry = entry or {}
+    return entry.get("display_text"), entry.get("voice_over_script")
+
+
+def _render(payload):
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+def _dna_for_day(lessons, entry):
+    """The DNA lesson for a curriculum day: the one whose id the day's title starts with, else the first"""
+    if not lessons:
+        return None
+    title = (entry or {}).get("title", "").lower()
+    return next((dna for dna in lessons if title.startswith(dna["lesson_metadata"]["lesson_id"].replace("-", " "))),
+                lessons[0])
+
+
+def _phases(dna, age, tone, language):
+    meta = dna["lesson_metadata"]
+    expression = dna["age_expressions"].get(age, {})
+    title, title_voice = _text(expression.get("concept_name"), tone)
+    phrases = dna.get("language_translations", {}).get(language, {}).get("key_phrases", {})
+    patterns = dna.get("tone_delivery_dna", {}).get(tone, {}).get("language_patterns", {})
+    phases = {
+        1: {
+            "type": "welcome",
+            "content": title,
+            "voice_over": title_voice,
+            "greeting": phrases.get("greeting"),
+            "opening": (patterns.get("openings") or [None])[0],
+            "concept": meta.get("universal_concept")
+        }
+    }
+    for number, name in enumerate(QUESTIONS, start=2):
+        question = dna["core_lesson_structure"].get(name, {})
+        ask = question.get("ages", {}).get(age, {})
+        content, voice_over = _text(ask.get("question"), tone)
+        phases[number] = {
+            "type": name,
+            "content": content,
+            "voice_over": voice_over,
+            "intro": phrases.get("question_intro"),
+            "concept_focus": question.get("concept_focus"),
+            "choices": [_text(ask.get("option_a"))[0], _text(ask.get("option_b"))[0]],
+            "correct_option": ask.get("correct_option"),
+            "teaching_moments": ask.get("teaching_moments", {}),
+            "validation": phrases.get("validation_positive")
+        }
+    fortune, fortune_voice = _text(dna.get("wisdom_phase_content", {}).get("fortune"), tone)
+    phases[5] = {
+        "type": "daily_fortune",
+        "content": fortune,
+        "voice_over": fortune_voice,
+        "closing": (patterns.get("closings") or [None])[0]
+    }
+    return phases
+
+
+def build_index(directory=LESSON_DATA_DIR, signature=None):
+    """Parse every month file and DNA lesson under directory into a LessonIndex"""
+    directory = Path(directory)
+    days = [None] * (CURRICULUM_DAYS + 1)
+    for path in sorted(directory.glob(CURRICULUM_GLOB)):
+        with open(path, encoding="utf-8") as f:
+            month = json.load(f)
+        for entry in month.get("days", []):
+            if 0 < entry.get("day", 0) <= CURRICULUM_DAYS:
+                days[entry["day"]] = MappingProxyType(dict(entry, month=month.get("month")))
+
+    lessons_by_day = {}
+    lessons = {}
+    for path in sorted(directory.glob(DNA_GLOB)):
+        with open(path, encoding="utf-8") as f:
+            dna = json.load(f)
+        meta = dna.get("lesson_metadata", {})
+        lessons[meta.get("lesson_id", path.stem)] = path.name
+        lessons_by_day.setdefault(meta.get("day"), []).append(dna)
+
+    age_groups = sorted({age for dnas in lessons_by_day.values() for dna in dnas for age in dna["age_expressions"]},
+                        key=int)
+    tones = sorted({tone for dnas in lessons_by_day.values() for dna in dnas
+                    for tone in dna.get("wisdom_phase_content", {}).get("fortune", {})})
+    languages = sorted({language for dnas in lessons_by_day.values() for dna in dnas
+                        for language in dna.get("language_translations", {})})
+
+    bodies = [None] * (CURRICULUM_DAYS + 1)
+    for day, entry in enumerate(days[1:], start=1):
+        dna = _dna_for_day(lessons_by_day.get(day), entry)
+        if entry is None and dna is None:
+            continue
+        lesson = {
+            "day": day,
+            "title": entry.get("title") if entry else None,
+            "date": entry.get("date") if entry else None,
+            "learning_objective": entry.get("learning_objective") if entry else None,
+            "lesson_id": dna["lesson_metadata"]["lesson_id"] if dna else None
+        }
+        if dna is None:
+            # Curriculum only: one body whatever variant is asked for
+            body, etag = _render(dict(lesson, phases={1: {"type": "welcome", "content": lesson["title"]}},
+                                      variant=None, variants=None))
+            bodies[day] = MappingProxyType({None: (body, etag, None)})
+            continue
+        available = {
+            "age_groups": [f"age_{age}" for age in sorted(dna["age_expressions"], key=int)],
+            "tones": sorted(dna.get("wisdom_phase_content", {}).get("fortune", {})),
+            "languages": sorted(dna.get("language_translations", {}))
+        }
+        rendered = {}
+        for age in dna["age_expressions"]:
+            for tone in available["tones"]:
+                for language in available["languages"]:
+                    variant = {"age_group": f"age_{age}", "tone": tone, "language": language}
+                    body, etag = _render(dict(lesson, phases=_phases(dna, age, tone, language),
+                                              variant=variant, variants=available))
+                    rendered[(age, tone, language)] = (body, etag, variant)
+        bodies[day] = MappingProxyType(rendered)
+
+    return LessonIndex(
+        tuple(days), tuple(bodies), frozenset(age_groups), frozenset(tones), frozenset(languages),
+        signature, MappingProxyType(lessons)
+    )
+
+
+def data_signature(directory=LESSON_DATA_DIR):
+    """(name, mtime_ns, size) of every file the index is built from"""
+    directory = Path(directory)
+    signature = []
+    for pattern in (CURRICULUM_GLOB, DNA_GLOB):
+        for path in sorted(directory.glob(pattern)):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            signature.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class LessonService:
+    """The current LessonIndex, swapped for a fresh one by a watcher thread when the data files change
+
+    Requests only read self.index, a single reference assignment away from the next snapshot, so they
+    never parse JSON or wait on a reload. A reload that fails (e.g. a file caught mid-write) keeps the
+    previous index and is retried once the files change again.
+    """
+
+    def __init__(self, directory=LESSON_DATA_DIR, reload_seconds=LESSON_RELOAD_SECONDS):
+        self.directory = Path(directory)
+        self.reload_seconds = reload_seconds
+        self.index = None
+        self._thread = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._failed_signature = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_load_ms = None
+
+    def load(self):
+        """Build and install a new index if the files changed; True when one was installed"""
+        with self._lock:
+            signature = data_signature(self.directory)
+            if self.index is not None and signature in (self.index.signature, self._failed_signature):
+                return False
+            started = time.perf_counter()
+            try:
+                index = build_index(self.directory, signature)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.failures += 1
+                self._failed_signature = signature
+                print(f"❌ Lesson service: could not load {self.directory}: {e}")
+                if self.index is None:
+                    raise
+                return False
+            self.last_load_ms = round(1000 * (time.perf_counter() - started), 2)
+            if self.index is not None:
+                self.reloads += 1
+                print(f"✅ Lesson service: reloaded {self.directory} in {self.last_load_ms} ms")
+            self.index = index
+            return True
+
+    def start(self):
+        self.load()
+        if self.reload_seconds > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="lesson-reload", daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_seconds)
+            try:
+                self.load()
+            except Exception as e:
+                print(f"❌ Lesson service: reload check failed: {e}")
+
+    def lookup(self, day, age=None, tone=None, language=None):
+        if self._thread is not None and os.getpid() != self._pid:
+            # Pre-forked workers inherit the index but not the watcher
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._thread = None
+            self.start()
+        return self.index.lookup(day, age, tone, language)
+
+    def stats(self):
+        index = self.index
+        return {
+            "directory": str(self.directory),
+            "days": sum(1 for entry in index.days if entry is not None) if index else 0,
+            "lessons": len(index.lessons) if index else 0,
+            "variants": sum(len(bodies) for bodies in index.bodies if bodies is not None) if index else 0,
+            "loaded_at": index.loaded_at if index else None,
+            "reload_seconds": self.reload_seconds,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_load_ms": self.last_load_ms
+        }
@@ -4,11 +4,13 @@ SQLAlchemy models for user authentication, lesson progress, and habit formation
 """
 
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import json
 
+from habit_streaks import ActivityBitmap, HABIT_COLUMNS
+
 Base = declarative_base()
 
 class User(Base):
@@ -91,6 +93,7 @@ class HabitFormation(Base):
     daily_goal_met = Column(Boolean, default=False)
     weekly_goal_met = Column(Boolean, default=False)
     monthly_goal_met = Column(Boolean, default=False)
+    activity_bitmap = Column(LargeBinary)  # bit k: active k days before last_activity_date
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -195,31 +198,18 @@ def update_habit_formation(user_id, lesson_day):
     
     today = datetime.utcnow().date()
     
-    if habit.last_activity_date:
-        last_activity = habit.last_activity_date.date()
-        days_diff = (today - last_activity).days
-        
-        if days_diff == 1:
-            # Continue streak
-            habit.streak_days += 1
-            if not habit.current_streak_start:
-                habit.current_streak_start = datetime.utcnow()
-        elif days_diff == 0:
-            # Same day, no change
-            pass
-        else:
-            # Break in streak
-            habit.streak_days = 1
-            habit.current_streak_start = datetime.utcnow()
-    else:
-        # First activity
-        habit.streak_days = 1
-        habit.current_streak_start = datetime.utcnow()
-    
-    # Update longest streak
-    habit.longest_streak = max(habit.longest_streak, habit.streak_days)
-    habit.last_activity_date = datetime.utcnow()
+    # Mark today in the activity bitmap and derive streaks and goals from it
+    activity = ActivityBitmap.from_row(habit.activity_bitmap, habit.last_activity_date, habit.streak_days)
+    longest_streak = max(habit.longest_streak or 0, activity.mark(today))
+    status = activity.status(today, longest_streak)
+    
+    habit.activity_bitmap = activity.to_blob()
+    for column in HABIT_COLUMNS:
+        value = status[column]
+        if column in ('current_streak_start', 'last_activity_date') and value:
+            value = datetime.fromisoformat(value)
+        setattr(habit, column, value)
     
     session.commit()
     session.close()
-    return habit 
\ No newline at end of file
+    return habit 
@@ -11,7 +11,18 @@ import numpy as np
 import io
 import os
 
+from tts_alignment import align_text, wav_envelope
+from tts_bundle import wav_bundle
+from tts_encoding import EncoderPool, requested_format
+from tts_http import (
+    AUDIO_EXPOSE_HEADERS, AUDIO_MIMETYPES, audio_response, bundle_response, install_metrics, install_timing,
+    negotiate_audio, negotiate_bundle, tag_request
+)
+from tts_profiling import mark, stage
+
 app = Flask(__name__)
+install_metrics(app)
+install_timing(app)
 
 # Enable CORS for production
 CORS(app, origins=[
@@ -19,13 +30,15 @@ CORS(app, origins=[
     "https://*.ilearnhow.com", 
     "http://localhost:*",
     "http://127.0.0.1:*"
-])
+], expose_headers=AUDIO_EXPOSE_HEADERS)
 
 print("🚀 iLearn How TTS Server Starting...")
 print("✅ This is the ONLY server we need")
 print("✅ Returns mock audio with phoneme timing")
 print("✅ Ken & Kelly voices only")
 
+ENCODERS = EncoderPool()
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -36,6 +49,49 @@ def health():
         "voices": ["ken", "kelly"]
     })
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe; mock audio needs no models, so this server is ready as soon as it answers"""
+    return jsonify({"status": "ready", "ready": True})
+
+def estimate_duration(text):
+    """Speaking time in seconds (roughly 150 words per minute)"""
+    words = len(text.split())
+    return max(1.0, (words / 150) * 60)
+
+def generate_audio(text):
+    """Generate placeholder WAV audio sized to the text, returning (wav bytes, duration)"""
+    duration = estimate_duration(text)
+    
+    # Generate silent audio (we care about timing, not actual audio yet)
+    sample_rate = 16000
+    samples = int(sample_rate * duration)
+    audio = np.zeros(samples, dtype=np.int16)
+    
+    # Create WAV file
+    wav_io = io.BytesIO()
+    # WAV header
+    wav_io.write(b'RIFF')
+    wav_io.write((36 + len(audio) * 2).to_bytes(4, 'little'))
+    wav_io.write(b'WAVE')
+    wav_io.write(b'fmt ')
+    wav_io.write((16).to_bytes(4, 'little'))
+    wav_io.write((1).to_bytes(2, 'little'))  # PCM
+    wav_io.write((1).to_bytes(2, 'little'))  # Mono
+    wav_io.write(sample_rate.to_bytes(4, 'little'))
+    wav_io.write((sample_rate * 2).to_bytes(4, 'little'))
+    wav_io.write((2).to_bytes(2, 'little'))
+    wav_io.write((16).to_bytes(2, 'little'))  # 16-bit
+    wav_io.write(b'data')
+    wav_io.write((len(audio) * 2).to_bytes(4, 'little'))
+    wav_io.write(audio.tobytes())
+    
+    return wav_io.getvalue(), duration
+
+def generate_phonemes(text, duration):
+    """Viseme timing from the spelling of the text, spread over the mock audio"""
+    return align_text(text, duration=duration)
+
 @app.route('/api/tts', methods=['POST'])
 def generate_speech():
     """Generate speech with phoneme timing"""
@@ -47,67 +103,76 @@ def generate_speech():
         # Validate speaker
         if speaker not in ['ken', 'kelly']:
             speaker = 'kelly'
+        
+        # Accept: audio/wav skips the base64 JSON envelope entirely
+        binary_format = negotiate_audio(request.accept_mimetypes)
+        if binary_format and binary_format not in ENCODERS.formats():
+            return jsonify({
+                "error": "Not Acceptable",
+                "allowed": [AUDIO_MIMETYPES[f] for f in ENCODERS.formats()] + ["application/json"]
+            }), 406
+        audio_format = binary_format or requested_format(data.get('format'))
+        tag_request(speaker, "mock", audio_format)
+        if audio_format not in ENCODERS.formats():
+            return jsonify({"error": "Unsupported format", "allowed": ENCODERS.formats()}), 415
+        mark("validate")
             
         print(f"🎤 Generating speech for {speaker}: '{text[:50]}...'")
         
-        # Calculate duration (roughly 150 words per minute)
-        words = len(text.split())
-        duration = max(1.0, (words / 150) * 60)
+        with stage("synth"):
+            audio_data, duration = generate_audio(text)
+        payload = ENCODERS.encode(audio_data, audio_format)
         
-        # Generate silent audio (we care about timing, not actual audio yet)
-        sample_rate = 16000
-        samples = int(sample_rate * duration)
-        audio = np.zeros(samples, dtype=np.int16)
-        
-        # Create WAV file
-        wav_io = io.BytesIO()
-        # WAV header
-        wav_io.write(b'RIFF')
-        wav_io.write((36 + len(audio) * 2).to_bytes(4, 'little'))
-        wav_io.write(b'WAVE')
-        wav_io.write(b'fmt ')
-        wav_io.write((16).to_bytes(4, 'little'))
-        wav_io.write((1).to_bytes(2, 'little'))  # PCM
-        wav_io.write((1).to_bytes(2, 'little'))  # Mono
-        wav_io.write(sample_rate.to_bytes(4, 'little'))
-        wav_io.write((sample_rate * 2).to_bytes(4, 'little'))
-        wav_io.write((2).to_bytes(2, 'little'))
-        wav_io.write((16).to_bytes(2, 'little'))  # 16-bit
-        wav_io.write(b'data')
-        wav_io.write((len(audio) * 2).to_bytes(4, 'little'))
-        wav_io.write(audio.tobytes())
+        if binary_format:
+            print(f"✅ Generated {duration:.1f}s duration")
+            return audio_response(payload, binary_format, duration, speaker, "mock")
         
         # Generate phoneme timing
-        phonemes = []
-        if text:
-            # Simple phoneme generation - one phoneme per syllable estimate
-            syllables = max(1, int(words * 1.5))  # Rough estimate
-            time_per_phoneme = duration / syllables
-            
-            visemes = ['REST', 'A', 'E', 'I', 'O', 'U', 'MBP', 'FV', 'TH', 
-                      'DNTL', 'KG', 'S', 'WQ', 'R']
-            
-            current_time = 0
-            for i in range(syllables):
-                viseme = visemes[i % len(visemes)]
-                phonemes.append({
-                    "phoneme": viseme,
-                    "start": round(current_time, 3),
-                    "end": round(current_time + time_per_phoneme * 0.8, 3)
-                })
-                current_time += time_per_phoneme
+        phonemes = generate_phonemes(text, duration)
+        
+        if negotiate_bundle(request.accept_mimetypes):
+            # Audio, visemes and text in one binary file; nothing is cached here, so no ranged re-fetch
+            with stage("serialize"):
+                bundle = wav_bundle(audio_data, payload, audio_format, phonemes, text, duration)
+            return bundle_response(bundle, None, speaker, "mock")
                 
         # Return response
+        with stage("serialize"):
+            audio_base64 = base64.b64encode(payload).decode('utf-8')
         response = {
-            "audio": base64.b64encode(wav_io.getvalue()).decode('utf-8'),
-            "audio_format": "wav",
+            "audio": audio_base64,
+            "audio_format": audio_format,
             "speaker": speaker,
             "duration": duration,
             "phonemes": phonemes
         }
+        if data.get('include_envelope', False):
+            response["envelope"] = wav_envelope(audio_data)
         
         print(f"✅ Generated {len(phonemes)} phonemes, {duration:.1f}s duration")
-        return jsonify(response)
+        with stage("serialize"):
+            return jsonify(response)
+        
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/tts/phonemes', methods=['POST'])
+def generate_speech_phonemes():
+    """Phoneme timing for a /api/tts request, for clients fetching binary audio"""
+    try:
+        data = request.json
+        text = data.get('text', '')
+        speaker = data.get('speaker', 'kelly').lower()
+        if speaker not in ['ken', 'kelly']:
+            speaker = 'kelly'
+        
+        duration = estimate_duration(text)
+        return jsonify({
+            "speaker": speaker,
+            "duration": duration,
+            "phonemes": generate_phonemes(text, duration)
+        })
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -120,7 +185,8 @@ def index():
         "service": "iLearn How TTS Server",
         "endpoints": {
             "health": "/health",
-            "tts": "/api/tts"
+            "tts": "/api/tts",
+            "phonemes": "/api/tts/phonemes"
         }
     })
 
@@ -0,0 +1,220 @@
+"""
+Write-Behind Progress Buffer for the iLearnHow Flask backend
+Absorbs lesson progress events in memory, coalesces repeats per key and commits them in batches
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+from db_pool import get_connection
+
+# Longest an acknowledged update waits in memory: the most a crash can lose. 0 writes every update through
+PROGRESS_FLUSH_MS = int(os.environ.get("PROGRESS_FLUSH_MS", "250"))
+# Pending keys that trigger a flush before the interval is up
+PROGRESS_FLUSH_EVENTS = int(os.environ.get("PROGRESS_FLUSH_EVENTS", "200"))
+
+
+def last_wins(previous, event):
+    return event
+
+
+class WriteBehindBuffer:
+    """Events keyed by e.g. (user_id, lesson_day, phase), flushed together in one transaction
+
+    write(cursor, events) persists a batch; merge(previous, event) folds a newer event for the same key into
+    the pending one. A flush happens flush_ms after the first pending event or once max_events keys are
+    pending, whichever is sooner, and on close() / interpreter exit.
+
+    When a batch fails, its events are committed one at a time so a single bad event cannot hold back the
+    rest: one that fails with a `transient` error (the database locked or unavailable) goes back into the
+    buffer for the next flush, newer events for its key taking precedence; one that fails otherwise is
+    dropped and logged.
+    """
+
+    def __init__(self, write, merge=last_wins, flush_ms=PROGRESS_FLUSH_MS, max_events=PROGRESS_FLUSH_EVENTS,
+                 connect=get_connection, name="progress", transient=(sqlite3.OperationalError,)):
+        self.write = write
+        self.merge = merge
+        self.flush_ms = flush_ms
+        self.max_events = max_events
+        self.connect = connect
+        self.name = name
+        self.transient = transient
+        self._pending = {}
+        self._first_pending = None
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Serializes flushes so batches commit in the order they were taken
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+        self._pid = os.getpid()
+        self._exit_registered = False
+        self.events = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = None
+
+    @property
+    def write_through(self):
+        return self.flush_ms <= 0
+
+    def start(self):
+        if not self.write_through and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-flush", daemon=True)
+            self._thread.start()
+            if not self._exit_registered:
+                # Forked workers inherit the registration
+                atexit.register(self.close)
+                self._exit_registered = True
+        return self
+
+    def _check_fork(self):
+        if self._thread is not None and os.getpid() != self._pid:
+            # A pre-forked worker (gunicorn --preload) inherits neither the flush thread nor the parent's
+            # lock state; events the parent still held are the parent's to flush
+            self._pid = os.getpid()
+            self._pending = {}
+            self._first_pending = None
+            self._lock = threading.Lock()
+            self._wake = threading.Condition(self._lock)
+            self._flush_lock = threading.Lock()
+            self._thread = None
+            self.start()
+
+    def record(self, key, event):
+        """Queue an event; returns once it is pending (or, in write-through mode, committed)"""
+        self.record_many([(key, event)])
+
+    def record_many(self, items):
+        self._check_fork()
+        if self.write_through or self._closed:
+            events = {}
+            with self._lock:
+                self.events += len(items)
+            for key, event in items:
+                events[key] = self.merge(events[key], event) if key in events else event
+            self._commit(events)
+            return
+        with self._lock:
+            for key, event in items:
+                self.events += 1
+                if key in self._pending:
+                    self._pending[key] = self.merge(self._pending[key], event)
+                    self.coalesced += 1
+                else:
+                    self._pending[key] = event
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+            if len(self._pending) >= self.max_events:
+                self._wake.notify()
+
+    def pending(self, match=None):
+        """Pending events whose key satisfies match(key), for reads that must see their own writes"""
+        with self._lock:
+            return {key: event for key, event in self._pending.items() if match is None or match(key)}
+
+    def _commit(self, events):
+        started = time.perf_counter()
+        conn = self.connect()
+        try:
+            self.write(conn.cursor(), list(events.items()))
+            conn.commit()
+        finally:
+            conn.close()
+        self.flushes += 1
+        self.flushed += len(events)
+        self.last_flush_ms = round(1000 * (time.perf_counter() - started), 2)
+
+    def flush(self):
+        """Commit everything pending now; raises if events had to be re-queued after a transient failure"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = self._pending, {}
+                self._first_pending = None
+            if not events:
+                return 0
+            try:
+                self._commit(events)
+                return len(events)
+            except Exception as e:
+                self.failures += 1
+                print(f"❌ Write-behind {self.name}: flush of {len(events)} events failed, committing one by one: {e}")
+            committed, retry, error = 0, {}, None
+            for key, event in events.items():
+                if error is not None:
+                    # The database itself is failing; the rest waits for the next flush too
+                    retry[key] = event
+                    continue
+                try:
+                    self._commit({key: event})
+                    committed += 1
+                except self.transient as e:
+                    retry[key], error = event, e
+                except Exception as e:
+                    self.dropped += 1
+                    print(f"❌ Write-behind {self.name}: dropping event {key!r}: {e}")
+            if retry:
+                self._requeue(retry)
+                raise error
+            return committed
+
+    def _requeue(self, events):
+        with self._lock:
+            # Anything recorded meanwhile is newer than the failed events
+            for key, event in events.items():
+                self._pending[key] = self.merge(event, self._pending[key]) if key in self._pending else event
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if self._first_pending is not None:
+                        due = self._first_pending + self.flush_ms / 1000
+                        if len(self._pending) >= self.max_events or time.monotonic() >= due:
+                            break
+                        self._wake.wait(due - time.monotonic())
+                    else:
+                        self._wake.wait()
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Back off for one interval before retrying what was re-queued
+                time.sleep(self.flush_ms / 1000)
+
+    def close(self):
+        """Stop the flush thread and commit what is left; later events are written through"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "flush_ms": self.flush_ms,
+            "max_events": self.max_events,
+            "pending": pending,
+            "events": self.events,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": self.last_flush_ms
+        }
@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""
+Async Railway TTS Server using Custom Trained Ken & Kelly Voices
+Same API as railway-piper-server-custom-voices.py on asyncio (Starlette + uvicorn):
+synthesis runs on an executor, so /health answers immediately while every voice slot is busy
+"""
+
+import asyncio
+import base64
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from tts_alignment import wav_envelope
+from tts_batch import MAX_TTS_BATCH_ITEMS, batch_events, batch_items, batch_manifest, run_batch, started_batch
+from tts_bundle import BUNDLE_KEY, BUNDLE_MIMETYPE, BundleError, bundle_url, byte_range, read_header
+from tts_cache import AudioCache, cached_bundle, cached_encoding, cached_synthesis
+from tts_encoding import EncoderPool, requested_format
+from tts_engine import VoiceEnginePool, wav_duration
+from tts_http import AUDIO_EXPOSE_HEADERS, AUDIO_MIMETYPES, negotiate_audio, negotiate_bundle
+from tts_metrics import (
+    CONTENT_TYPE, QUEUE_REJECTED, REGISTRY, REQUEST_SECONDS, REQUESTS, RESPONSE_BYTES, register_cache,
+    register_scheduler
+)
+from tts_profiling import (
+    RequestProfile, current_timings, finish_request, mark, profile_requested, stage, start_request
+)
+from tts_scheduler import SchedulerBusy, SynthesisScheduler
+from tts_streaming import audio_stream, sse_stream, started_synthesis
+from tts_custom_voices import (
+    VOICE_DIRS, VOICE_MODELS, get_voice_paths, invalid_batch_item, parse_origins, preferred_voices, select_voice,
+    validate_tts_request
+)
+from tts_voices import VoiceRegistry
+
+# Starlette takes literal origins and a single regex, so valid patterns are OR-ed together
+allowed_origins, origin_patterns = parse_origins()
+
+# Each voice model loads on first use and stays resident, least recently used evicted past TTS_VOICE_MEMORY_MB
+SCHEDULER = SynthesisScheduler()
+VOICE_ENGINES = VoiceEnginePool(scheduler=SCHEDULER)
+# Trained models dropped next to the server or into dist/configs are picked up without a restart
+VOICE_REGISTRY = VoiceRegistry(VOICE_DIRS, on_change=VOICE_ENGINES.invalidate)
+AUDIO_CACHE = AudioCache()
+ENCODERS = EncoderPool()
+register_cache(AUDIO_CACHE)
+register_scheduler(SCHEDULER)
+# Models load and warm up in the background; /ready gates traffic until they are hot
+WARMUP = VOICE_ENGINES.warm_up(preferred_voices(VOICE_REGISTRY))
+
+SYNTHESIS_THREADS = SCHEDULER.workers_per_voice * len(VOICE_MODELS) + SCHEDULER.max_queue
+SYNTHESIS_EXECUTOR = ThreadPoolExecutor(max_workers=SYNTHESIS_THREADS, thread_name_prefix="tts-async")
+
+class ExecutorGate:
+    """Admission to SYNTHESIS_EXECUTOR, decided on the event loop before a call is submitted
+
+    The scheduler bounds the queue of each voice, but a request's "voice" can name any registered model,
+    so the voices in play (and their queues) are not bounded by the executor's size. Past its threads a
+    call would wait inside the executor where no queue limit or Retry-After applies; it gets a 503 instead.
+    Only the event loop touches the counters, so they need no lock.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    def admit(self, voice=None):
+        """Raise SchedulerBusy when every executor thread is spoken for"""
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            QUEUE_REJECTED.inc(voice=voice or "", reason="executor full")
+            retry_after = SCHEDULER.queue(voice).retry_after() if voice else 1
+            raise SchedulerBusy(voice or "batch", retry_after, reason="executor full")
+
+    def stats(self):
+        return {"threads": self.limit, "in_flight": self.in_flight, "rejected": self.rejected}
+
+EXECUTOR_GATE = ExecutorGate(SYNTHESIS_THREADS)
+
+def synthesize(speaker, text, voice_model, voice_config):
+    """(WAV audio, viseme timeline) for text; repeat lesson text is served from the cache and never reaches Piper"""
+    return cached_synthesis(AUDIO_CACHE, VOICE_ENGINES, speaker, text, voice_model, voice_config)
+
+def encode(speaker, text, audio_data, audio_format, voice_model, voice_config):
+    """audio_data re-encoded as audio_format (cached next to the WAV)"""
+    return cached_encoding(
+        AUDIO_CACHE, ENCODERS, speaker, text, voice_model, audio_data, audio_format, voice_config
+    )
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run synthesis or encoding off the event loop, taking the request's stage timings (and profiler) along"""
+    call = partial(fn, *args, **kwargs)
+    timings = current_timings()
+    if timings is not None and timings.profile is not None:
+        call = partial(timings.profile.call, call)
+    context = contextvars.copy_context()
+    EXECUTOR_GATE.in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(SYNTHESIS_EXECUTOR, context.run, call)
+    finally:
+        EXECUTOR_GATE.in_flight -= 1
+
+async def blocking_stream(chunks):
+    """Drive a synchronous stream on SYNTHESIS_EXECUTOR a chunk at a time, so the synthesis behind each chunk
+    is counted by EXECUTOR_GATE like any other call instead of running on Starlette's own threadpool"""
+    chunks = iter(chunks)
+    done = object()
+    while True:
+        chunk = await run_blocking(next, chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+def busy_response(error):
+    """503 for a SchedulerBusy error, telling the client when to try again"""
+    return JSONResponse({
+        "error": "TTS server busy, please retry",
+        "reason": error.reason,
+        "retry_after": error.retry_after
+    }, status_code=503, headers={"Retry-After": str(error.retry_after)})
+
+def audio_response(audio_data, audio_format, duration, speaker, engine, voice_type=None):
+    """Raw audio body with the metadata the JSON envelope used to carry moved into headers"""
+    headers = {
+        "X-Audio-Duration": f"{duration:.3f}",
+        "X-TTS-Speaker": speaker,
+        "X-TTS-Engine": engine
+    }
+    if voice_type:
+        headers["X-TTS-Voice-Type"] = voice_type
+    return Response(audio_data, media_type=AUDIO_MIMETYPES[audio_format], headers=headers)
+
+def bundle_response(request, bundle, key, speaker=None, engine=None, voice_type=None):
+    """A playback bundle addressed by its cache key; GETs honour Range, If-Range and If-None-Match"""
+    header = read_header(bundle)
+    etag = f'"{key}"'
+    headers = {
+        "X-Audio-Duration": f"{header['duration_ms'] / 1000:.3f}",
+        "Content-Location": bundle_url(key),
+        "Accept-Ranges": "bytes",
+        "ETag": etag
+    }
+    for name, value in (("X-TTS-Speaker", speaker), ("X-TTS-Engine", engine), ("X-TTS-Voice-Type", voice_type)):
+        if value:
+            headers[name] = value
+    if request.method != "GET":
+        return Response(bundle, media_type=BUNDLE_MIMETYPE, headers=headers)
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if request.headers.get("if-range", etag) != etag:
+        # The player's cached prefix is of another version; send the whole bundle
+        return Response(bundle, media_type=BUNDLE_MIMETYPE, headers=headers)
+    try:
+        span = byte_range(request.headers.get("range"), len(bundle))
+    except BundleError:
+        headers["Content-Range"] = f"bytes */{len(bundle)}"
+        return Response(status_code=416, headers=headers)
+    if span is None:
+        return Response(bundle, media_type=BUNDLE_MIMETYPE, headers=headers)
+    start, end = span
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(bundle)}"
+    return Response(memoryview(bundle)[start:end + 1].tobytes(), status_code=206, media_type=BUNDLE_MIMETYPE,
+                    headers=headers)
+
+def accept_mimetypes(request):
+    return parse_accept_header(request.headers.get("accept"), MIMEAccept)
+
+def tag_request(request, speaker=None, engine=None, audio_format=None):
+    """Attach labels for this request's metrics once the handler knows them"""
+    if speaker is not None:
+        request.state.tts_speaker = speaker
+    if engine is not None:
+        request.state.tts_engine = engine
+    if audio_format is not None:
+        request.state.tts_format = audio_format
+
+class RequestMetrics:
+    """ASGI middleware timing every request for /metrics, like install_metrics does for Flask"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        response = {"status": 500, "bytes": 0, "streamed": False, "type": ""}
+
+        async def observe_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["type"] = dict(message.get("headers", [])).get(b"content-type", b"").decode().split(";")[0]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+                response["streamed"] |= message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, observe_send)
+        finally:
+            route = route_label(scope["path"])
+            status = str(response["status"])
+            state = scope.get("state", {})
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=scope["method"], status=status)
+            REQUESTS.inc(route=route, status=status,
+                         speaker=state.get("tts_speaker", ""), engine=state.get("tts_engine", ""))
+            if not response["streamed"]:
+                RESPONSE_BYTES.observe(response["bytes"], route=route,
+                                       format=state.get("tts_format", response["type"]))
+
+async def health(request):
+    # Never awaits synthesis: the registry's file checks run on the loop's default executor, not
+    # SYNTHESIS_EXECUTOR, so it stays instant under load
+    voice_paths = await asyncio.to_thread(get_voice_paths, VOICE_REGISTRY)
+    registry_stats = await asyncio.to_thread(VOICE_REGISTRY.stats)
+    custom_voices = {k: v["custom_available"] for k, v in voice_paths.items()}
+
+    return JSONResponse({
+        "server": "iLearnHow Custom Voice TTS (async)",
+        "status": "healthy",
+        "version": "2.0.0",
+        "engine": "piper_tts_custom",
+        "message": "Custom Ken & Kelly Voice TTS Server Running",
+        "timestamp": int(time.time()),
+        "voices": list(VOICE_MODELS.keys()),
+        "custom_voices_available": custom_voices,
+        "voice_details": voice_paths,
+        "engines": VOICE_ENGINES.stats(),
+        "voice_memory": VOICE_ENGINES.memory(),
+        "voice_registry": registry_stats,
+        "cache": AUDIO_CACHE.stats(),
+        "scheduler": SCHEDULER.stats(),
+        "executor": EXECUTOR_GATE.stats(),
+        "encoders": ENCODERS.stats(),
+        "warmup": WARMUP.stats()
+    })
+
+async def ready(request):
+    """Readiness probe: fails until every voice model is loaded and warmed up"""
+    stats = WARMUP.stats()
+    if stats["ready"]:
+        return JSONResponse(dict(stats, status="ready"))
+    headers = {"Retry-After": "5"} if not stats["finished"] else None
+    return JSONResponse(dict(stats, status="warming_up" if not stats["finished"] else "failed"),
+                        status_code=503, headers=headers)
+
+class RequestTiming:
+    """ASGI middleware adding Server-Timing (and the ?profile=1 summary), like install_timing does for Flask"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings, token = start_request()
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if profile_requested(query.get("profile", [""])[0]):
+            profile = RequestProfile()
+            # Handlers run on the event loop; only the work handed to run_blocking is profiled
+            if profile.start(enable=False):
+                timings.profile = profile
+
+        def profile_summary():
+            summary = timings.profile.stop() if timings.profile is not None else None
+            if summary:
+                print(f"🔬 Profile {scope['method']} {scope['path']}\n{summary}")
+            return summary
+
+        held = {}
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                headers = [(k, v) for k, v in message.get("headers", []) if k != b"server-timing"]
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+                if timings.profile is not None and dict(headers).get(b"content-type", b"").startswith(b"application/json"):
+                    # Hold the headers back until the body is complete, to add the profile to the JSON
+                    held["start"], held["body"] = message, b""
+                    return
+            elif message["type"] == "http.response.body" and "start" in held:
+                held["body"] += message.get("body", b"")
+                if message.get("more_body"):
+                    return
+                body = with_profile(held["body"], profile_summary())
+                start = held.pop("start")
+                headers = [(k, v) for k, v in start["headers"] if k != b"content-length"]
+                headers.append((b"content-length", str(len(body)).encode("latin-1")))
+                await send({**start, "headers": headers})
+                message = {**message, "body": body}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            profile_summary()
+            finish_request(token)
+
+def with_profile(body, summary):
+    """JSON response body with the profile summary added, or unchanged when it isn't a JSON object"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(data, dict) or summary is None:
+        return body
+    data["profile"] = summary
+    return json.dumps(data).encode("utf-8")
+
+async def metrics(request):
+    return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+async def tts_options(request):
+    # CORSMiddleware answers real preflights; this covers bare OPTIONS probes
+    return Response(status_code=204)
+
+async def parse_tts_request(request):
+    """Validate a TTS request body, returning (fields, None) or (None, error response)"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    # Voice checks go through the registry, which rescans the voice directories once its interval passes
+    params, error = await asyncio.to_thread(
+        validate_tts_request, request.headers.get('content-type', ''), data, VOICE_REGISTRY, ENCODERS.formats(),
+        request.query_params.get('stream')
+    )
+    if error:
+        body, status = error
+        return None, JSONResponse(body, status_code=status)
+    return params, None
+
+async def tts(request):
+    try:
+        params, error = await parse_tts_request(request)
+        mark("validate")
+        if error:
+            return error
+
+        text = params["text"]
+        speaker = params["speaker"]
+        include_phonemes = params["include_phonemes"]
+
+        # Accept: audio/* skips the base64 JSON envelope entirely
+        binary_format = negotiate_audio(accept_mimetypes(request))
+        if binary_format and binary_format not in ENCODERS.formats():
+            return JSONResponse({
+                "error": "Not Acceptable",
+                "allowed": [AUDIO_MIMETYPES[f] for f in ENCODERS.formats()] + ["application/json"]
+            }, status_code=406)
+        audio_format = binary_format or params["format"]
+        # Accept: application/vnd.ilearnhow.tts-bundle gets audio and visemes in one seekable binary file
+        wants_bundle = negotiate_bundle(accept_mimetypes(request))
+
+        # Determine which voice model to use
+        voice_model, voice_config, voice_type = await asyncio.to_thread(
+            select_voice, VOICE_REGISTRY, speaker, params["voice"]
+        )
+        tag_request(request, speaker, "piper_custom", audio_format)
+        if voice_type == "custom_trained":
+            print(f"🎤 Custom Voice TTS: {speaker} using TRAINED model - '{text[:50]}...'")
+        else:
+            print(f"⚠️ Fallback TTS: {speaker} using generic {voice_model} - '{text[:50]}...'")
+
+        if params["stream"] and not wants_bundle:
+            # Sentence-by-sentence on the synthesis executor. The first sentence is synthesized before
+            # responding, so a request the scheduler refuses still gets its 503
+            EXECUTOR_GATE.admit(voice_model)
+            synthesize_sentence = await run_blocking(started_synthesis, text, partial(
+                synthesize, speaker, voice_model=voice_model, voice_config=voice_config
+            ))
+            if binary_format:
+                return StreamingResponse(
+                    blocking_stream(audio_stream(text, synthesize_sentence, binary_format, ENCODERS)),
+                    media_type=AUDIO_MIMETYPES[binary_format]
+                )
+            encode_sentence = partial(
+                encode, speaker, audio_format=audio_format, voice_model=voice_model, voice_config=voice_config
+            )
+            return StreamingResponse(
+                blocking_stream(sse_stream(
+                    text, synthesize_sentence,
+                    include_phonemes=include_phonemes,
+                    include_envelope=params["include_envelope"],
+                    meta={"speaker": speaker, "engine": "piper_custom", "voice_type": voice_type},
+                    audio_format=audio_format,
+                    encode=encode_sentence if audio_format != 'wav' else None
+                )),
+                media_type='text/event-stream',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        EXECUTOR_GATE.admit(voice_model)
+        audio_data, timeline = await run_blocking(synthesize, speaker, text, voice_model, voice_config)
+        duration = wav_duration(audio_data)
+        payload = await run_blocking(encode, speaker, text, audio_data, audio_format, voice_model, voice_config)
+
+        if binary_format:
+            print(f"✅ Custom Voice TTS: Generated {duration:.2f}s of audio using {voice_type}")
+            return audio_response(payload, binary_format, duration, speaker, "piper_custom", voice_type)
+        if wants_bundle:
+            key, bundle = await run_blocking(
+                cached_bundle, AUDIO_CACHE, speaker, text, voice_model, audio_data, payload, audio_format, timeline,
+                duration, voice_config
+            )
+            return bundle_response(request, bundle, key, speaker, "piper_custom", voice_type)
+
+        def serialize():
+            # Encoding the clip and its envelope scales with its length; keep it off the event loop
+            with stage("serialize"):
+                audio_base64 = base64.b64encode(payload).decode('utf-8')
+            return audio_base64, wav_envelope(audio_data) if params["include_envelope"] else None
+
+        audio_base64, envelope = await run_blocking(serialize)
+        response_data = {
+            "audio": audio_base64,
+            "audio_format": audio_format,
+            "duration": duration,
+            "speaker": speaker,
+            "text": text,
+            "engine": "piper_custom",
+            "voice_type": voice_type,
+            "model_used": voice_model
+        }
+
+        if include_phonemes:
+            # Viseme timeline aligned to the phonemes Piper actually spoke
+            response_data["phonemes"] = timeline
+        if params["include_envelope"]:
+            # Per-frame jaw openness so the avatar needn't analyse the audio itself
+            response_data["envelope"] = envelope
+
+        print(f"✅ Custom Voice TTS: Generated {duration:.2f}s of audio using {voice_type}")
+        with stage("serialize"):
+            return JSONResponse(response_data)
+
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"❌ Custom Voice TTS Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def tts_phonemes(request):
+    """Phoneme timeline for a /api/tts request, for clients fetching binary audio"""
+    try:
+        params, error = await parse_tts_request(request)
+        mark("validate")
+        if error:
+            return error
+
+        voice_model, voice_config, voice_type = await asyncio.to_thread(
+            select_voice, VOICE_REGISTRY, params["speaker"], params["voice"]
+        )
+        tag_request(request, params["speaker"], "piper_custom")
+        EXECUTOR_GATE.admit(voice_model)
+        audio_data, timeline = await run_blocking(
+            synthesize, params["speaker"], params["text"], voice_model, voice_config
+        )
+        duration = wav_duration(audio_data)
+        result = {
+            "duration": duration,
+            "speaker": params["speaker"],
+            "text": params["text"],
+            "voice_type": voice_type,
+            "phonemes": timeline
+        }
+        if params["include_envelope"]:
+            result["envelope"] = await run_blocking(wav_envelope, audio_data)
+        with stage("serialize"):
+            return JSONResponse(result)
+
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"❌ Custom Voice TTS Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def tts_batch(request):
+    """Synthesize a whole tts_jobs lesson (or a list of {id, text, speaker}) in one call"""
+    try:
+        content_type = request.headers.get('content-type', '')
+        if 'application/json' not in content_type:
+            return JSONResponse({
+                "error": "Unsupported Media Type: Content-Type must be application/json"
+            }, status_code=415)
+
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        try:
+            document, items = batch_items(body)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        if not items:
+            return JSONResponse({"error": "Batch contains no items"}, status_code=422)
+        if len(items) > MAX_TTS_BATCH_ITEMS:
+            return JSONResponse({
+                "error": f"Batch exceeds maximum of {MAX_TTS_BATCH_ITEMS} items"
+            }, status_code=413)
+
+        error = await asyncio.to_thread(invalid_batch_item, items, VOICE_REGISTRY)
+        if error:
+            body, status = error
+            return JSONResponse(body, status_code=status)
+
+        def flag(name, default):
+            # Options may come from the query string or the batch document itself
+            value = request.query_params.get(name, document.get(name, default))
+            return str(value).lower() in ('1', 'true', 'yes')
+
+        include_phonemes = flag('include_phonemes', True)
+        audio_format = requested_format(request.query_params.get('format', document.get('format')))
+        if audio_format not in ENCODERS.formats():
+            return JSONResponse({
+                "error": "Unsupported format",
+                "allowed": ENCODERS.formats()
+            }, status_code=415)
+
+        def synthesize_item(item):
+            voice_model, voice_config, _ = select_voice(VOICE_REGISTRY, item["speaker"], item["voice"])
+            audio_data, timeline = synthesize(item["speaker"], item["text"], voice_model, voice_config)
+            duration = wav_duration(audio_data)
+            payload = encode(item["speaker"], item["text"], audio_data, audio_format, voice_model, voice_config)
+            result = {
+                "duration": duration,
+                "audio_format": audio_format,
+                "audio": base64.b64encode(payload).decode('utf-8')
+            }
+            if include_phonemes:
+                result["phonemes"] = timeline
+            return result
+
+        tag_request(request, engine="piper_custom", audio_format=audio_format)
+        print(f"🎤 Custom Voice TTS batch: {len(items)} items for '{document.get('slug', 'adhoc')}'")
+
+        if flag('stream', False):
+            # One SSE event per item as it finishes; the first is waited for so a refused batch still gets a 503
+            EXECUTOR_GATE.admit()
+            results = await run_blocking(started_batch, items, synthesize_item)
+            return StreamingResponse(
+                blocking_stream(batch_events(document, results, "piper_custom")),
+                media_type='text/event-stream',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        EXECUTOR_GATE.admit()
+        results = await run_blocking(lambda: list(run_batch(items, synthesize_item)))
+        manifest = batch_manifest(document, results, "piper_custom")
+        print(f"✅ Custom Voice TTS batch: Generated {manifest['duration']:.2f}s of audio, {manifest['failed']} failed")
+        return JSONResponse(manifest)
+
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"❌ Custom Voice TTS Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def tts_bundle(request):
+    """A bundle /api/tts or scripts/prerender-audio.py made, by content key; Range requests let players seek"""
+    key = request.path_params["key"]
+    bundle = await run_blocking(AUDIO_CACHE.get, key, record=False) if BUNDLE_KEY.fullmatch(key) else None
+    if bundle is None:
+        return JSONResponse({"error": "Bundle not found"}, status_code=404)
+    tag_request(request, engine="piper_custom", audio_format="bundle")
+    try:
+        return bundle_response(request, bundle, key)
+    except BundleError:
+        # A content key for plain audio or visemes, not a bundle
+        return JSONResponse({"error": "Bundle not found"}, status_code=404)
+
+async def root(request):
+    voice_paths = await asyncio.to_thread(get_voice_paths, VOICE_REGISTRY)
+    custom_voices = {k: v["custom_available"] for k, v in voice_paths.items()}
+
+    return JSONResponse({
+        "service": "Custom Ken & Kelly Voice TTS Server (async)",
+        "status": "running",
+        "voices": list(VOICE_MODELS.keys()),
+        "custom_voices_available": custom_voices,
+        "endpoints": {
+            "health": "/health",
+            "tts": "/api/tts",
+            "phonemes": "/api/tts/phonemes",
+            "batch": "/api/tts/batch",
+            "bundle": "/api/tts/bundle/<key>"
+        }
+    })
+
+ROUTES = [
+    Route('/health', health, methods=['GET']),
+    Route('/ready', ready, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+    Route('/api/tts', tts, methods=['POST']),
+    Route('/api/tts', tts_options, methods=['OPTIONS']),
+    Route('/api/tts/phonemes', tts_phonemes, methods=['POST']),
+    Route('/api/tts/batch', tts_batch, methods=['POST']),
+    Route('/api/tts/bundle/{key}', tts_bundle, methods=['GET']),
+    Route('/', root, methods=['GET'])
+]
+ROUTE_PATHS = {route.path for route in ROUTES}
+
+def route_label(path):
+    """Route template for metrics labels, so each bundle key does not become a series of its own"""
+    if path in ROUTE_PATHS:
+        return path
+    return next((route.path for route in ROUTES if "{" in route.path and route.path_regex.match(path)), "unmatched")
+
+app = Starlette(
+    routes=ROUTES,
+    middleware=[
+        Middleware(RequestMetrics),
+        Middleware(RequestTiming),
+        # Allow CORS and ensure preflight responses include headers
+        Middleware(
+            CORSMiddleware,
+            allow_origins=allowed_origins,
+            allow_origin_regex="|".join(f"(?:{p.pattern})" for p in origin_patterns) or None,
+            allow_methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type", "Authorization", "Range", "If-Range"],
+            expose_headers=AUDIO_EXPOSE_HEADERS,
+            max_age=86400
+        )
+    ]
+)
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5002))
+    voice_paths = get_voice_paths(VOICE_REGISTRY)
+
+    print("=" * 70)
+    print("🚀 Custom Ken & Kelly Voice TTS Server Starting (async)")
+    print("=" * 70)
+    print(f"✅ Port: {port}")
+    print(f"✅ Voices: {list(VOICE_MODELS.keys())}")
+
+    for speaker, info in voice_paths.items():
+        status = "✅ AVAILABLE" if info["custom_available"] else "❌ NOT FOUND"
+        print(f"   {speaker}: {status}")
+        if info["custom_available"]:
+            print(f"      Model: {info['model_path']}")
+            print(f"      Config: {info['config_path']}")
+        else:
+            print(f"      Fallback: {info['fallback']}")
+
+    print("✅ CORS enabled for ilearnhow.com")
+    print("=" * 70)
+
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -4,19 +4,32 @@ Railway TTS Server using Piper - Lightweight and Fast
 Real voice synthesis without heavy models
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import re
-import subprocess
-import tempfile
 import os
 import base64
-import json
 import time
-import wave
-import struct
+from functools import partial
+
+from tts_alignment import wav_envelope
+from tts_bundle import BUNDLE_KEY, BundleError
+from tts_cache import AudioCache, cached_bundle, cached_encoding, cached_synthesis
+from tts_encoding import EncoderPool, requested_format
+from tts_engine import VoiceEnginePool, wav_duration
+from tts_http import (
+    AUDIO_EXPOSE_HEADERS, AUDIO_MIMETYPES, audio_response, bundle_response, busy_response, install_metrics,
+    install_timing, negotiate_audio, negotiate_bundle, readiness_response, tag_request
+)
+from tts_metrics import register_cache, register_scheduler
+from tts_profiling import mark, stage
+from tts_scheduler import SchedulerBusy, SynthesisScheduler
+from tts_batch import MAX_TTS_BATCH_ITEMS, batch_events, batch_items, batch_manifest, run_batch, started_batch
+from tts_streaming import audio_stream, sse_stream, started_synthesis
 
 app = Flask(__name__)
+install_metrics(app)
+install_timing(app)
 
 # Configurable CORS and limits
 # Supports literal origins and regex origins via prefix "regex:"
@@ -60,7 +73,8 @@ CORS(
     resources={r"/*": {
         "origins": allowed_origins,
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Range", "If-Range"],
+        "expose_headers": AUDIO_EXPOSE_HEADERS,
         "max_age": 86400
     }}
 )
@@ -71,6 +85,16 @@ VOICE_MODELS = {
     "ken": "en_US-ryan-medium"     # Male voice
 }
 
+# Each voice model is loaded once and stays resident between requests
+SCHEDULER = SynthesisScheduler()
+VOICE_ENGINES = VoiceEnginePool(scheduler=SCHEDULER)
+AUDIO_CACHE = AudioCache()
+ENCODERS = EncoderPool()
+register_cache(AUDIO_CACHE)
+register_scheduler(SCHEDULER)
+# Models load and warm up in the background; /ready gates traffic until they are hot
+WARMUP = VOICE_ENGINES.warm_up((model, None) for model in VOICE_MODELS.values())
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({
@@ -80,182 +104,298 @@ def health():
         "engine": "piper_tts",
         "message": "Piper TTS Server Running",
         "timestamp": int(time.time()),
-        "voices": list(VOICE_MODELS.keys())
+        "voices": list(VOICE_MODELS.keys()),
+        "engines": VOICE_ENGINES.stats(),
+        "cache": AUDIO_CACHE.stats(),
+        "scheduler": SCHEDULER.stats(),
+        "encoders": ENCODERS.stats(),
+        "warmup": WARMUP.stats()
     })
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: fails until every voice model is loaded and warmed up"""
+    return readiness_response(WARMUP)
+
 @app.route('/api/tts', methods=['OPTIONS'])
 def tts_options():
     # Flask-CORS will attach appropriate headers
     return ("", 204)
 
 
+def parse_tts_request():
+    """Validate a TTS request body, returning (fields, None) or (None, error response)"""
+    # Content-Type validation
+    content_type = request.headers.get('Content-Type', '')
+    if 'application/json' not in content_type:
+        return None, (jsonify({
+            "error": "Unsupported Media Type: Content-Type must be application/json"
+        }), 415)
+
+    # JSON body parsing
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, (jsonify({"error": "Invalid JSON body"}), 400)
+
+    # Required fields and constraints
+    text = data.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return None, (jsonify({
+            "error": "Field 'text' is required and must be a non-empty string"
+        }), 422)
+    if len(text) > MAX_TTS_TEXT_CHARS:
+        return None, (jsonify({
+            "error": f"Text exceeds maximum allowed length of {MAX_TTS_TEXT_CHARS} characters"
+        }), 413)
+
+    speaker = str(data.get('speaker', 'kelly')).lower()
+    if speaker not in VOICE_MODELS:
+        return None, (jsonify({
+            "error": "Unsupported speaker",
+            "allowed": list(VOICE_MODELS.keys())
+        }), 422)
+
+    audio_format = requested_format(data.get('format'))
+    if audio_format not in ENCODERS.formats():
+        return None, (jsonify({
+            "error": "Unsupported format",
+            "allowed": ENCODERS.formats(),
+        }), 415)
+
+    return {
+        "text": text,
+        "speaker": speaker,
+        "format": audio_format,
+        "include_phonemes": bool(data.get('include_phonemes', False)),
+        "include_envelope": bool(data.get('include_envelope', False)),
+        "stream": str(data.get('stream', request.args.get('stream', 'false'))).lower() in ('1', 'true', 'yes')
+    }, None
+
+def synthesize(speaker, text):
+    """(WAV audio, viseme timeline) for text; repeat lesson text is served from the cache and never reaches Piper"""
+    return cached_synthesis(AUDIO_CACHE, VOICE_ENGINES, speaker, text, VOICE_MODELS[speaker])
+
+def encode(speaker, text, audio_data, audio_format):
+    """audio_data re-encoded as audio_format (cached next to the WAV)"""
+    return cached_encoding(AUDIO_CACHE, ENCODERS, speaker, text, VOICE_MODELS[speaker], audio_data, audio_format)
+
 @app.route('/api/tts', methods=['POST'])
 def tts():
     try:
-        # Content-Type validation
+        params, error = parse_tts_request()
+        mark("validate")
+        if error:
+            return error
+
+        text = params["text"]
+        speaker = params["speaker"]
+        include_phonemes = params["include_phonemes"]
+
+        # Accept: audio/* skips the base64 JSON envelope entirely
+        binary_format = negotiate_audio(request.accept_mimetypes)
+        if binary_format and binary_format not in ENCODERS.formats():
+            return jsonify({
+                "error": "Not Acceptable",
+                "allowed": [AUDIO_MIMETYPES[f] for f in ENCODERS.formats()] + ["application/json"]
+            }), 406
+        audio_format = binary_format or params["format"]
+        # Accept: application/vnd.ilearnhow.tts-bundle gets audio and visemes in one seekable binary file
+        wants_bundle = negotiate_bundle(request.accept_mimetypes)
+        tag_request(speaker, "piper", audio_format)
+        
+        print(f"🎤 Piper TTS: {speaker} ({VOICE_MODELS[speaker]}) - '{text[:50]}...'")
+        
+        if params["stream"] and not wants_bundle:
+            # Sentence-by-sentence: first audio arrives after the first sentence, not the last. That sentence
+            # is synthesized before responding, so a request the scheduler refuses still gets its 503
+            synthesize_sentence = started_synthesis(text, partial(synthesize, speaker))
+            if binary_format:
+                return Response(
+                    audio_stream(text, synthesize_sentence, binary_format, ENCODERS),
+                    mimetype=AUDIO_MIMETYPES[binary_format]
+                )
+            return Response(
+                sse_stream(
+                    text, synthesize_sentence,
+                    include_phonemes=include_phonemes,
+                    include_envelope=params["include_envelope"],
+                    meta={"speaker": speaker, "engine": "piper"},
+                    audio_format=audio_format,
+                    encode=partial(encode, speaker, audio_format=audio_format) if audio_format != 'wav' else None
+                ),
+                mimetype='text/event-stream',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        audio_data, timeline = synthesize(speaker, text)
+        duration = wav_duration(audio_data)
+        payload = encode(speaker, text, audio_data, audio_format)
+        
+        if binary_format:
+            print(f"✅ Piper TTS: Generated {duration:.2f}s of audio")
+            return audio_response(payload, binary_format, duration, speaker, "piper")
+        if wants_bundle:
+            key, bundle = cached_bundle(
+                AUDIO_CACHE, speaker, text, VOICE_MODELS[speaker], audio_data, payload, audio_format, timeline, duration
+            )
+            return bundle_response(bundle, key, speaker, "piper")
+        
+        # Encode to base64
+        with stage("serialize"):
+            audio_base64 = base64.b64encode(payload).decode('utf-8')
+        
+        response_data = {
+            "audio": audio_base64,
+            "audio_format": audio_format,
+            "duration": duration,
+            "speaker": speaker,
+            "text": text,
+            "engine": "piper"
+        }
+        
+        if include_phonemes:
+            # Viseme timeline aligned to the phonemes Piper actually spoke
+            response_data["phonemes"] = timeline
+        if params["include_envelope"]:
+            # Per-frame jaw openness so the avatar needn't analyse the audio itself
+            response_data["envelope"] = wav_envelope(audio_data)
+        
+        print(f"✅ Piper TTS: Generated {duration:.2f}s of audio")
+        with stage("serialize"):
+            return jsonify(response_data)
+        
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"❌ Piper TTS Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/tts/phonemes', methods=['POST'])
+def tts_phonemes():
+    """Phoneme timeline for a /api/tts request, for clients fetching binary audio"""
+    try:
+        params, error = parse_tts_request()
+        mark("validate")
+        if error:
+            return error
+
+        audio_data, timeline = synthesize(params["speaker"], params["text"])
+        duration = wav_duration(audio_data)
+        result = {
+            "duration": duration,
+            "speaker": params["speaker"],
+            "text": params["text"],
+            "phonemes": timeline
+        }
+        if params["include_envelope"]:
+            result["envelope"] = wav_envelope(audio_data)
+        with stage("serialize"):
+            return jsonify(result)
+        
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"❌ Piper TTS Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/tts/batch', methods=['POST'])
+def tts_batch():
+    """Synthesize a whole tts_jobs lesson (or a list of {id, text, speaker}) in one call"""
+    try:
         content_type = request.headers.get('Content-Type', '')
         if 'application/json' not in content_type:
             return jsonify({
                 "error": "Unsupported Media Type: Content-Type must be application/json"
             }), 415
 
-        # JSON body parsing
-        data = request.get_json(silent=True)
-        if not isinstance(data, dict):
-            return jsonify({"error": "Invalid JSON body"}), 400
+        try:
+            document, items = batch_items(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Required fields and constraints
-        text = data.get('text')
-        if not isinstance(text, str) or not text.strip():
-            return jsonify({
-                "error": "Field 'text' is required and must be a non-empty string"
-            }), 422
-        if len(text) > MAX_TTS_TEXT_CHARS:
+        if not items:
+            return jsonify({"error": "Batch contains no items"}), 422
+        if len(items) > MAX_TTS_BATCH_ITEMS:
             return jsonify({
-                "error": f"Text exceeds maximum allowed length of {MAX_TTS_TEXT_CHARS} characters"
+                "error": f"Batch exceeds maximum of {MAX_TTS_BATCH_ITEMS} items"
             }), 413
 
-        speaker = str(data.get('speaker', 'kelly')).lower()
-        if speaker not in VOICE_MODELS:
-            return jsonify({
-                "error": "Unsupported speaker",
-                "allowed": list(VOICE_MODELS.keys())
-            }), 422
+        for item in items:
+            text = item["text"]
+            if not isinstance(text, str) or not text.strip():
+                return jsonify({
+                    "error": f"Item '{item['id']}': field 'text' is required and must be a non-empty string"
+                }), 422
+            if len(text) > MAX_TTS_TEXT_CHARS:
+                return jsonify({
+                    "error": f"Item '{item['id']}': text exceeds maximum allowed length of {MAX_TTS_TEXT_CHARS} characters"
+                }), 413
+            if item["speaker"] not in VOICE_MODELS:
+                return jsonify({
+                    "error": f"Item '{item['id']}': unsupported speaker",
+                    "allowed": list(VOICE_MODELS.keys())
+                }), 422
+
+        def flag(name, default):
+            # Options may come from the query string or the batch document itself
+            value = request.args.get(name, document.get(name, default))
+            return str(value).lower() in ('1', 'true', 'yes')
 
-        requested_format = str(data.get('format', 'wav')).lower()
-        if requested_format != 'wav':
+        include_phonemes = flag('include_phonemes', True)
+        audio_format = requested_format(request.args.get('format', document.get('format')))
+        if audio_format not in ENCODERS.formats():
             return jsonify({
                 "error": "Unsupported format",
-                "allowed": ["wav"],
+                "allowed": ENCODERS.formats()
             }), 415
 
-        include_phonemes = bool(data.get('include_phonemes', False))
-        
-        # Map speaker to Piper voice
-        voice_model = VOICE_MODELS[speaker]
-        
-        print(f"🎤 Piper TTS: {speaker} ({voice_model}) - '{text[:50]}...'")
-        
-        # Create temporary file for output
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-            output_path = tmp_file.name
-        
-        try:
-            # Use Piper to generate speech
-            cmd = [
-                'piper',
-                '--model', voice_model,
-                '--output_file', output_path
-            ]
-            
-            # Run Piper
-            process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            stdout, stderr = process.communicate(input=text)
-            
-            if process.returncode != 0:
-                raise Exception(f"Piper failed: {stderr}")
-            
-            # Read the generated audio
-            with open(output_path, 'rb') as audio_file:
-                audio_data = audio_file.read()
-            
-            # Get audio duration
-            with wave.open(output_path, 'rb') as wav_file:
-                frames = wav_file.getnframes()
-                rate = wav_file.getframerate()
-                duration = frames / float(rate)
-            
-            # Encode to base64
-            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-            
-            # Generate simple phonemes for avatar sync
-            phonemes = []
-            if include_phonemes:
-                phonemes = generate_phonemes(text, duration)
-            
-            response_data = {
-                "audio": audio_base64,
-                "audio_format": "wav",
+        def synthesize_item(item):
+            audio_data, timeline = synthesize(item["speaker"], item["text"])
+            duration = wav_duration(audio_data)
+            payload = encode(item["speaker"], item["text"], audio_data, audio_format)
+            result = {
                 "duration": duration,
-                "speaker": speaker,
-                "text": text,
-                "engine": "piper"
+                "audio_format": audio_format,
+                "audio": base64.b64encode(payload).decode('utf-8')
             }
-            
             if include_phonemes:
-                response_data["phonemes"] = phonemes
-            
-            print(f"✅ Piper TTS: Generated {duration:.2f}s of audio")
-            return jsonify(response_data)
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(output_path):
-                os.unlink(output_path)
+                result["phonemes"] = timeline
+            return result
+
+        tag_request(engine="piper", audio_format=audio_format)
+        print(f"🎤 Piper TTS batch: {len(items)} items for '{document.get('slug', 'adhoc')}'")
+
+        if flag('stream', False):
+            # One SSE event per item as it finishes; the first is waited for so a refused batch still gets a 503
+            results = started_batch(items, synthesize_item)
+            return Response(
+                batch_events(document, results, "piper"),
+                mimetype='text/event-stream',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        manifest = batch_manifest(document, list(run_batch(items, synthesize_item)), "piper")
+        print(f"✅ Piper TTS batch: Generated {manifest['duration']:.2f}s of audio, {manifest['failed']} failed")
+        return jsonify(manifest)
         
+    except SchedulerBusy as e:
+        return busy_response(e)
     except Exception as e:
         print(f"❌ Piper TTS Error: {e}")
         return jsonify({"error": str(e)}), 500
 
-def generate_phonemes(text, duration):
-    """Generate simple phoneme timing for avatar sync"""
-    words = text.split()
-    phonemes = []
-    
-    if not words:
-        return phonemes
-    
-    time_per_word = duration / len(words)
-    current_time = 0.0
-    
-    # Simple phoneme patterns
-    for i, word in enumerate(words):
-        word_lower = word.lower().strip('.,!?')
-        
-        # Opening mouth movement
-        if word_lower[0] in 'aeiou':
-            phonemes.append({
-                "phoneme": "A",
-                "start": round(current_time, 3),
-                "end": round(current_time + time_per_word * 0.3, 3)
-            })
-        elif word_lower[0] in 'bpm':
-            phonemes.append({
-                "phoneme": "MBP",
-                "start": round(current_time, 3),
-                "end": round(current_time + time_per_word * 0.2, 3)
-            })
-        else:
-            phonemes.append({
-                "phoneme": "REST",
-                "start": round(current_time, 3),
-                "end": round(current_time + time_per_word * 0.1, 3)
-            })
-        
-        # Mid-word movement
-        phonemes.append({
-            "phoneme": "E",
-            "start": round(current_time + time_per_word * 0.3, 3),
-            "end": round(current_time + time_per_word * 0.7, 3)
-        })
-        
-        # Closing/rest
-        phonemes.append({
-            "phoneme": "REST",
-            "start": round(current_time + time_per_word * 0.7, 3),
-            "end": round(current_time + time_per_word, 3)
-        })
-        
-        current_time += time_per_word
-    
-    return phonemes
+@app.route('/api/tts/bundle/<key>', methods=['GET'])
+def tts_bundle(key):
+    """A bundle /api/tts or scripts/prerender-audio.py made, by content key; Range requests let players seek"""
+    bundle = AUDIO_CACHE.get(key, record=False) if BUNDLE_KEY.fullmatch(key) else None
+    if bundle is None:
+        return jsonify({"error": "Bundle not found"}), 404
+    tag_request(engine="piper", audio_format="bundle")
+    try:
+        return bundle_response(bundle, key)
+    except BundleError:
+        # A content key for plain audio or visemes, not a bundle
+        return jsonify({"error": "Bundle not found"}), 404
 
 @app.route('/', methods=['GET'])
 def root():
@@ -265,7 +405,10 @@ def root():
         "voices": list(VOICE_MODELS.keys()),
         "endpoints": {
             "health": "/health",
-            "tts": "/api/tts"
+            "tts": "/api/tts",
+            "phonemes": "/api/tts/phonemes",
+            "batch": "/api/tts/batch",
+            "bundle": "/api/tts/bundle/<key>"
         }
     })
 
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Benchmark lesson-progress writes on the Flask backend under concurrent learners
+Runs app.py in-process against a fresh SQLite file once per connection mode:
+"legacy" opens a rollback-journal connection per request (DB_POOL_SIZE=0), as
+the backend did before db_pool; "pooled" uses the WAL connection pool and
+"buffered" adds the progress write-behind buffer on top, both of the former
+writing every update through (PROGRESS_FLUSH_MS=0). Each learner registers, then posts progress for every phase of consecutive lesson
+days while reading its progress back, the traffic a classroom generates at the
+end of a lesson. Prints a comparison and writes the results as JSON.
+
+Usage:
+    python3 scripts/benchmark-db.py
+    python3 scripts/benchmark-db.py --learners 32 --days 10 --reads 2
+    python3 scripts/benchmark-db.py --modes pooled --pool-size 16
+    python3 scripts/benchmark-db.py --modes pooled,buffered --flush-ms 100
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmark-results"
+
+PHASES = 5
+MODES = ("legacy", "pooled", "buffered")
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def learner(app, number, days, reads, results, start):
+    """One learner's session: register, then every phase of `days` lessons with `reads` progress reads per write"""
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={
+        'username': f'learner{number}', 'password': 'secret', 'email': f'learner{number}@example.com'
+    })
+    start.wait()
+    if response.status_code != 201:
+        results.append(("register", None, response.status_code))
+        return
+    for day in range(1, days + 1):
+        for phase in range(1, PHASES + 1):
+            started = time.perf_counter()
+            response = client.post('/api/lessons/progress', json={
+                'lesson_day': day,
+                'phase': phase,
+                'completed': phase == PHASES,
+                'answers': ['A'] * phase,
+                'time_spent': 30 * phase
+            })
+            results.append(("write", time.perf_counter() - started, response.status_code))
+            for _ in range(reads):
+                started = time.perf_counter()
+                response = client.get(f'/api/lessons/progress?day={day}')
+                results.append(("read", time.perf_counter() - started, response.status_code))
+
+
+def run_worker(args):
+    """Child process: import the backend against the prepared database and drive it from learner threads"""
+    sys.path.insert(0, str(ROOT))
+    import app as backend
+
+    results = []
+    start = threading.Barrier(args.learners + 1)
+    threads = [
+        threading.Thread(target=learner, args=(backend.app, n, args.days, args.reads, results, start), daemon=True)
+        for n in range(args.learners)
+    ]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+    backend.PROGRESS_BUFFER.close()
+
+    report = {"wall_seconds": round(wall_seconds, 3), "progress_buffer": backend.PROGRESS_BUFFER.stats()}
+    for kind in ("write", "read"):
+        latencies = sorted(1000 * seconds for k, seconds, status in results if k == kind and status == 200)
+        statuses = {}
+        for k, _, status in results:
+            if k == kind:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[kind] = {
+            "requests": sum(statuses.values()),
+            "succeeded": len(latencies),
+            "statuses": statuses,
+            "throughput_rps": round(len(latencies) / wall_seconds, 1) if wall_seconds else None,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50), 2) if latencies else None,
+                "p95": round(percentile(latencies, 0.95), 2) if latencies else None,
+                "p99": round(percentile(latencies, 0.99), 2) if latencies else None,
+                "max": round(latencies[-1], 2) if latencies else None
+            }
+        }
+    report["register_failures"] = sum(1 for k, _, _ in results if k == "register")
+    print(json.dumps(report))
+
+
+def run_mode(mode, args, workdir):
+    """Benchmark one connection mode in a fresh process and database"""
+    db_path = workdir / f"{mode}.db"
+    env = dict(
+        os.environ,
+        ILEARNHOW_DB_PATH=str(db_path),
+        DB_POOL_SIZE="0" if mode == "legacy" else str(args.pool_size),
+        PROGRESS_FLUSH_MS=str(args.flush_ms) if mode == "buffered" else "0"
+    )
+    command = [
+        sys.executable, __file__, "--worker",
+        "--learners", str(args.learners), "--days", str(args.days), "--reads", str(args.reads)
+    ]
+    process = subprocess.run(command, cwd=str(ROOT), env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{process.stderr.strip()}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure progress-write throughput across SQLite connection and batching modes")
+    parser.add_argument("--modes", default="legacy,pooled,buffered",
+                        help="Modes to run: legacy, pooled, buffered")
+    parser.add_argument("--learners", type=int, default=16, help="Concurrent learner sessions")
+    parser.add_argument("--days", type=int, default=5, help="Lesson days each learner completes (5 phases each)")
+    parser.add_argument("--reads", type=int, default=1, help="Progress reads per progress write")
+    parser.add_argument("--pool-size", type=int, default=8, help="DB_POOL_SIZE for the pooled run")
+    parser.add_argument("--flush-ms", type=int, default=250, help="PROGRESS_FLUSH_MS for the buffered run")
+    parser.add_argument("--output", help="Results file (default benchmark-results/db-<time>.json)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(unknown)}")
+
+    print("=" * 70)
+    print("⏱️  Lesson progress database benchmark")
+    print("=" * 70)
+    print(f"✅ Traffic: {args.learners} learners x {args.days} days x {PHASES} phases, "
+          f"{args.reads} read(s) per write")
+
+    runs = {}
+    with tempfile.TemporaryDirectory(prefix="db-bench-") as workdir:
+        for mode in modes:
+            runs[mode] = run = run_mode(mode, args, Path(workdir))
+            write, read = run["write"], run["read"]
+            print(f"✅ {mode:>8}: writes {write['succeeded']}/{write['requests']} at {write['throughput_rps']} req/s "
+                  f"(p50 {write['latency_ms']['p50']} ms, p99 {write['latency_ms']['p99']} ms), "
+                  f"reads p50 {read['latency_ms']['p50']} ms, statuses {write['statuses']}, "
+                  f"{run['progress_buffer']['flushes']} commits")
+
+    if "legacy" in runs and "pooled" in runs:
+        legacy, pooled = runs["legacy"]["write"]["throughput_rps"], runs["pooled"]["write"]["throughput_rps"]
+        if legacy:
+            print(f"✅ Pooled WAL writes: {pooled / legacy:.2f}x legacy throughput")
+    if "pooled" in runs and "buffered" in runs:
+        pooled, buffered = runs["pooled"]["write"]["throughput_rps"], runs["buffered"]["write"]["throughput_rps"]
+        if pooled:
+            print(f"✅ Write-behind writes: {buffered / pooled:.2f}x pooled throughput, "
+                  f"{runs['buffered']['progress_buffer']['flushes']} commits instead of "
+                  f"{runs['pooled']['progress_buffer']['flushes']}")
+
+    report = {
+        "version": "db_benchmark_v1",
+        "generated_at": int(time.time()),
+        "revision": git_revision(),
+        "host": {
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "sqlite": __import__("sqlite3").sqlite_version
+        },
+        "config": {"learners": args.learners, "days": args.days, "reads": args.reads, "pool_size": args.pool_size,
+                   "flush_ms": args.flush_ms},
+        "runs": runs
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"db-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+    if any(run["write"]["succeeded"] < run["write"]["requests"] for run in runs.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
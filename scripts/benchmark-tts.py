@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Benchmark a TTS server under realistic lesson traffic
+Launches one of the local TTS servers (with a stub piper CLI when no voice
+models are available), replays every phase in data/tts_jobs/*.json against
+/api/tts at a fixed concurrency, and samples the server's RSS and CPU while
+it runs. Prints a summary and writes the full results as JSON so releases can
+be compared run against run.
+
+Each run starts with an empty audio cache, so the first pass measures
+synthesis; --passes 2 or more adds cache-hit traffic on top.
+
+Usage:
+    python3 scripts/benchmark-tts.py
+    python3 scripts/benchmark-tts.py --server railway-piper-server-async.py --concurrency 8 --passes 3
+    python3 scripts/benchmark-tts.py --url http://localhost:5002 --pid 12345
+    python3 scripts/benchmark-tts.py --compare benchmark-results/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmark-results"
+
+# Stand-in for the piper CLI: a tone lasting ~60 ms per word, produced `rtf` times faster than real time
+STUB_PIPER = """#!{python}
+import math, os, struct, sys, time, wave
+args = sys.argv[1:]
+text = sys.stdin.read()
+sample_rate = 22050
+samples = int(sample_rate * 0.06 * max(1, len(text.split())))
+time.sleep(samples / float(sample_rate) / float(os.environ.get("TTS_STUB_RTF", "{rtf}")))
+pcm = b"".join(struct.pack("<h", int(8000 * math.sin(i / 10.0))) for i in range(samples))
+if "--output_raw" in args:
+    sys.stdout.buffer.write(pcm)
+else:
+    with wave.open(args[args.index("--output_file") + 1], "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+"""
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def load_traffic(pattern, speakers):
+    """Every phase of every tts_jobs file matching pattern, as /api/tts request bodies"""
+    requests = []
+    for source in sorted(ROOT.glob(pattern)):
+        with open(source) as f:
+            job = json.load(f)
+        for phase in job.get("phases", []):
+            text = phase.get("text")
+            if not isinstance(text, str) or not text.strip():
+                continue
+            requests.append({
+                "source": source.name,
+                "id": phase.get("id"),
+                "text": text,
+                "speaker": speakers[len(requests) % len(speakers)] if speakers else job.get("defaultSpeaker", "kelly")
+            })
+    return requests
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def install_stub(directory, rtf):
+    path = Path(directory) / "piper"
+    path.write_text(STUB_PIPER.replace("{python}", sys.executable).replace("{rtf}", str(rtf)))
+    path.chmod(0o755)
+    return path
+
+
+class ProcessSampler:
+    """Polls /proc for a process's RSS and CPU time (its own plus reaped children, e.g. piper CLI runs)"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.rss = []
+        self.cpu_start = None
+        self.cpu_end = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tts-bench-sampler", daemon=True)
+
+    def available(self):
+        return self.pid is not None and Path(f"/proc/{self.pid}/stat").exists()
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # Fields after the parenthesised command name; utime, stime, cutime, cstime are 14-17
+            fields = f.read().rsplit(")", 1)[1].split()
+        return sum(int(v) for v in fields[11:15]) / float(CLOCK_TICKS)
+
+    def rss_bytes(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.rss.append(self.rss_bytes())
+            except (OSError, ValueError):
+                return
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.available():
+            self.cpu_start = self.cpu_seconds()
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self.cpu_start is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.cpu_end = self.cpu_seconds()
+        except OSError:
+            self.cpu_end = None
+
+    def summary(self, wall_seconds):
+        if self.cpu_start is None:
+            return None
+        rss = [v for v in self.rss if v is not None]
+        cpu = self.cpu_end - self.cpu_start if self.cpu_end is not None else None
+        return {
+            "rss_peak_mb": round(max(rss) / 2 ** 20, 1) if rss else None,
+            "rss_mean_mb": round(sum(rss) / len(rss) / 2 ** 20, 1) if rss else None,
+            "cpu_seconds": round(cpu, 2) if cpu is not None else None,
+            "cpu_percent": round(100 * cpu / wall_seconds, 1) if cpu is not None and wall_seconds else None
+        }
+
+
+def launch_server(server, port, env, log_path, timeout):
+    """Start a server script and wait until /ready (or, for servers without it, /health) answers"""
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / server)], cwd=str(ROOT), env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    url = f"http://127.0.0.1:{port}"
+    probe = "/ready"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} exited with {process.returncode}; see {log_path}")
+        try:
+            with urllib.request.urlopen(f"{url}{probe}", timeout=2) as response:
+                if response.status == 200:
+                    return process, url
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                probe = "/health"
+            time.sleep(0.2)
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{server} was not ready within {timeout}s; see {log_path}")
+
+
+def send(url, body, binary, timeout):
+    """POST one /api/tts request: (latency seconds, status, response bytes, audio seconds, error)"""
+    data = json.dumps(body).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if binary:
+        headers["Accept"] = "audio/wav"
+    request = urllib.request.Request(f"{url}/api/tts", data=data, headers=headers, method="POST")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = response.read()
+            latency = time.perf_counter() - started
+            if binary:
+                duration = float(response.headers.get("X-Audio-Duration") or 0)
+            else:
+                duration = float(json.loads(payload).get("duration") or 0)
+            return latency, response.status, len(payload), duration, None
+    except urllib.error.HTTPError as e:
+        return time.perf_counter() - started, e.code, len(e.read()), 0.0, e.reason
+    except Exception as e:
+        return time.perf_counter() - started, None, 0, 0.0, str(e)
+
+
+def run_load(url, traffic, concurrency, passes, binary, timeout):
+    """Replay traffic `passes` times over `concurrency` client threads"""
+    bodies = [{"text": t["text"], "speaker": t["speaker"]} for t in traffic] * passes
+    results = []
+    lock = threading.Lock()
+
+    def worker(body):
+        result = send(url, body, binary, timeout)
+        with lock:
+            results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tts-bench") as pool:
+        list(pool.map(worker, bodies))
+    return results, time.perf_counter() - started
+
+
+def summarize(results, wall_seconds):
+    ok = [r for r in results if r[1] == 200]
+    latencies = sorted(r[0] for r in ok)
+    audio_seconds = sum(r[3] for r in ok)
+    rtfs = sorted(r[3] / r[0] for r in ok if r[0] > 0 and r[3] > 0)
+    statuses = {}
+    for r in results:
+        statuses[str(r[1])] = statuses.get(str(r[1]), 0) + 1
+
+    def ms(value):
+        return round(1000 * value, 1) if value is not None else None
+
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "statuses": statuses,
+        "errors": sorted({r[4] for r in results if r[4]})[:10],
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(ok) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max": ms(latencies[-1]) if latencies else None
+        },
+        "audio_seconds": round(audio_seconds, 2),
+        # Seconds of audio delivered per second of wall time, per request and for the whole run
+        "realtime_factor": {
+            "p50": round(percentile(rtfs, 0.50), 2) if rtfs else None,
+            "p5": round(percentile(rtfs, 0.05), 2) if rtfs else None,
+            "aggregate": round(audio_seconds / wall_seconds, 2) if wall_seconds else None
+        },
+        "response_bytes": sum(r[2] for r in ok)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def delta(label, now, then, lower_is_better):
+        if now is None or then is None:
+            return
+        change = 100.0 * (now - then) / then if then else 0.0
+        better = (change < 0) == lower_is_better or change == 0
+        print(f"   {label:<20} {then:>10} -> {now:<10} {change:+.1f}% {'✅' if better else '⚠️'}")
+
+    print(f"📊 Compared with {baseline_path} ({baseline.get('revision')}, {baseline.get('server')})")
+    for name in ("p50", "p95", "p99"):
+        delta(f"latency {name} ms", current["results"]["latency_ms"][name],
+              baseline["results"]["latency_ms"][name], True)
+    delta("throughput rps", current["results"]["throughput_rps"], baseline["results"]["throughput_rps"], False)
+    delta("realtime factor", current["results"]["realtime_factor"]["aggregate"],
+          baseline["results"]["realtime_factor"]["aggregate"], False)
+    if current.get("process") and baseline.get("process"):
+        delta("rss peak mb", current["process"]["rss_peak_mb"], baseline["process"]["rss_peak_mb"], True)
+        delta("cpu seconds", current["process"]["cpu_seconds"], baseline["process"]["cpu_seconds"], True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay lesson TTS traffic against a server and record latency")
+    parser.add_argument("--server", default="railway-piper-server.py", help="Server script to launch")
+    parser.add_argument("--url", help="Benchmark an already running server instead of launching one")
+    parser.add_argument("--pid", type=int, help="With --url: process to sample RSS and CPU from")
+    parser.add_argument("--jobs", default="data/tts_jobs/*.json", help="tts_jobs files to replay (glob)")
+    parser.add_argument("--speakers", default="kelly,ken", help="Speakers to rotate through; empty uses each file's default")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--passes", type=int, default=1, help="Times to replay the traffic (later passes hit the cache)")
+    parser.add_argument("--binary", action="store_true", help="Ask for raw audio (Accept: audio/wav) instead of JSON")
+    parser.add_argument("--stub", choices=["auto", "always", "never"], default="auto",
+                        help="Use the stub piper CLI: when piper is missing (auto), always, or never")
+    parser.add_argument("--stub-rtf", type=float, default=20.0, help="How much faster than real time the stub speaks")
+    parser.add_argument("--warmup", type=int, default=2, help="Requests sent before measuring")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Results file (default benchmark-results/<server>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier results file to print deltas against")
+    args = parser.parse_args()
+
+    speakers = [s.strip().lower() for s in args.speakers.split(",") if s.strip()]
+    traffic = load_traffic(args.jobs, speakers)
+    if not traffic:
+        parser.error(f"No tts_jobs phases found in {args.jobs}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="tts-bench-"))
+    process = None
+    stubbed = False
+    try:
+        if args.url:
+            url, pid, server = args.url.rstrip("/"), args.pid, args.url
+        else:
+            server = args.server
+            port = free_port()
+            env = dict(os.environ, PORT=str(port), TTS_CACHE_DIR=str(workdir / "cache"), PYTHONUNBUFFERED="1")
+            stubbed = args.stub == "always" or (args.stub == "auto" and shutil.which("piper") is None)
+            if stubbed:
+                install_stub(workdir, args.stub_rtf)
+                env["PATH"] = f"{workdir}{os.pathsep}{env.get('PATH', '')}"
+                # No local models either, so every voice goes through the stub CLI
+                env["PIPER_DATA_DIR"] = str(workdir)
+            process, url = launch_server(server, port, env, workdir / "server.log", args.startup_timeout)
+            pid = process.pid
+
+        print("=" * 70)
+        print("⏱️  TTS benchmark")
+        print("=" * 70)
+        print(f"✅ Server: {server} ({url}){' with stub piper' if stubbed else ''}")
+        print(f"✅ Traffic: {len(traffic)} phases x {args.passes} passes at concurrency {args.concurrency}")
+
+        for body in traffic[:args.warmup]:
+            send(url, {"text": "Warming up.", "speaker": body["speaker"]}, args.binary, args.timeout)
+
+        sampler = ProcessSampler(pid).start()
+        results, wall_seconds = run_load(url, traffic, args.concurrency, args.passes, args.binary, args.timeout)
+        sampler.stop()
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "version": "tts_benchmark_v1",
+        "generated_at": int(time.time()),
+        "revision": git_revision(),
+        "server": server,
+        "stub_piper": stubbed,
+        "stub_rtf": args.stub_rtf if stubbed else None,
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "jobs": args.jobs,
+            "speakers": speakers,
+            "concurrency": args.concurrency,
+            "passes": args.passes,
+            "binary": args.binary
+        },
+        "results": summarize(results, wall_seconds),
+        "process": sampler.summary(wall_seconds)
+    }
+
+    summary = report["results"]
+    print(f"✅ {summary['succeeded']}/{summary['requests']} succeeded in {summary['wall_seconds']}s "
+          f"({summary['throughput_rps']} req/s), statuses {summary['statuses']}")
+    print(f"✅ Latency ms: p50 {summary['latency_ms']['p50']}  p95 {summary['latency_ms']['p95']}  "
+          f"p99 {summary['latency_ms']['p99']}  max {summary['latency_ms']['max']}")
+    print(f"✅ Real-time factor: p50 {summary['realtime_factor']['p50']}x per request, "
+          f"{summary['realtime_factor']['aggregate']}x overall ({summary['audio_seconds']}s of audio)")
+    if report["process"]:
+        print(f"✅ Server process: RSS peak {report['process']['rss_peak_mb']} MB, "
+              f"CPU {report['process']['cpu_seconds']}s ({report['process']['cpu_percent']}%)")
+    for error in summary["errors"]:
+        print(f"❌ {error}")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{Path(server).stem if not args.url else 'remote'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+    shutil.rmtree(workdir, ignore_errors=True)
+    if summary["succeeded"] < summary["requests"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
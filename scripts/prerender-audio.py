@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Pre-render lesson audio ahead of time
+Walks data/*_normalized.json (every voice_over_script per age and tone) and
+data/tts_jobs/*.json (every phase), renders each text for every avatar on a
+multiprocessing pool, and writes the WAVs (plus their viseme timelines and a
+playback bundle of both, see tts_bundle) into a content-addressed store the TTS
+servers read from directly.
+
+Re-running is safe: anything whose content hash is already in the store is
+skipped, so an interrupted run simply resumes.
+
+Usage:
+    python3 scripts/prerender-audio.py
+    python3 scripts/prerender-audio.py --voice kelly=dist/configs/kelly_model.onnx:dist/configs/kelly_config.json
+    python3 scripts/prerender-audio.py --bundle-format wav
+    python3 scripts/prerender-audio.py --dry-run
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from tts_bundle import BUNDLE_CODECS, wav_bundle
+from tts_cache import TTS_PRERENDER_DIR, AudioStore, cache_key, model_digest
+from tts_encoding import EncoderPool
+from tts_engine import VoiceEnginePool, wav_bytes, wav_duration
+
+# Same voices railway-piper-server.py serves; override with --voice for the custom models
+DEFAULT_VOICES = {
+    "kelly": "en_US-amy-medium",
+    "ken": "en_US-ryan-medium"
+}
+
+INDEX_FILE = "index.json"
+
+# Per-worker engines and encoder, created once by the pool initializer
+_engines = None
+_encoders = None
+
+
+def parse_voice(spec):
+    """'speaker=model[:config]' -> (speaker, model, config)"""
+    speaker, _, model = spec.partition("=")
+    model, _, config = model.partition(":")
+    if not speaker or not model:
+        raise argparse.ArgumentTypeError(f"Expected speaker=model[:config], got '{spec}'")
+    return speaker.lower(), model, config or None
+
+
+def find_scripts(node, path):
+    """Yield (path, voice_over_script) for every script nested anywhere in a lesson file"""
+    if isinstance(node, dict):
+        script = node.get("voice_over_script")
+        if isinstance(script, str) and script.strip():
+            yield path, script
+        for key, value in node.items():
+            yield from find_scripts(value, path + [str(key)])
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            yield from find_scripts(value, path + [str(index)])
+
+
+def collect_texts(data_dir):
+    """Every (source, lesson, location, text) that learners can hear"""
+    for source in sorted(data_dir.glob("*_normalized.json")):
+        with open(source) as f:
+            lesson = json.load(f)
+        lesson_id = lesson.get("lesson_metadata", {}).get("lesson_id", source.stem)
+        for path, script in find_scripts(lesson, []):
+            yield {
+                "source": str(source.relative_to(ROOT)),
+                "lesson": lesson_id,
+                "location": "/".join(path),
+                "text": script
+            }
+
+    for source in sorted((data_dir / "tts_jobs").glob("*.json")):
+        with open(source) as f:
+            job = json.load(f)
+        for phase in job.get("phases", []):
+            if isinstance(phase.get("text"), str) and phase["text"].strip():
+                yield {
+                    "source": str(source.relative_to(ROOT)),
+                    "lesson": job.get("slug", source.stem),
+                    "language": job.get("language"),
+                    "location": f"phases/{phase.get('id')}",
+                    "text": phase["text"]
+                }
+
+
+def init_worker(voices):
+    global _engines, _encoders
+    _engines = VoiceEnginePool()
+    _encoders = EncoderPool(workers=1)
+    _engines.preload((model, config) for model, config in voices.values())
+
+
+def render(job):
+    """Synthesize one text into the store (runs in a worker process)"""
+    key, timeline_key, bundle_key, encoded_key, bundle_format, speaker, text, model, config, store_dir = job
+    store = AudioStore(store_dir)
+    try:
+        audio_data = store.read(key)
+        timeline_data = store.read(timeline_key)
+        if audio_data is None or timeline_data is None:
+            # Visemes come out of the same pass, so the clip is re-synthesized if either is missing
+            pcm, sample_rate, timeline = _engines.synthesize_aligned(model, text, config=config)
+            audio_data = wav_bytes(pcm, sample_rate)
+            store.write(key, audio_data)
+            store.write(timeline_key, json.dumps(timeline).encode("utf-8"))
+        else:
+            timeline = json.loads(timeline_data)
+        duration = wav_duration(audio_data)
+
+        if bundle_key and not store.exists(bundle_key):
+            payload = audio_data
+            if encoded_key:
+                # Kept as well, so the servers' cached_encoding finds it
+                payload = store.read(encoded_key)
+                if payload is None:
+                    payload = _encoders.encode(audio_data, bundle_format)
+                    store.write(encoded_key, payload)
+            store.write(bundle_key, wav_bundle(audio_data, payload, bundle_format, timeline, text, duration))
+        return key, duration, len(audio_data), None
+    except Exception as e:
+        return key, None, None, str(e)
+
+
+def load_index(store_dir):
+    path = Path(store_dir) / INDEX_FILE
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {"entries": {}}
+
+
+def write_index(store_dir, index):
+    path = Path(store_dir) / INDEX_FILE
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render lesson audio into a content-addressed store")
+    parser.add_argument("--data-dir", default=str(ROOT / "data"))
+    parser.add_argument("--store", default=TTS_PRERENDER_DIR)
+    parser.add_argument("--voice", action="append", type=parse_voice, default=[],
+                        help="speaker=model[:config]; repeat per avatar")
+    parser.add_argument("--avatars", default=",".join(DEFAULT_VOICES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bundle-format", choices=["auto", "none"] + list(BUNDLE_CODECS), default="auto",
+                        help="Audio inside each playback bundle; auto is ogg (Opus) when ffmpeg is installed, else wav")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be rendered")
+    args = parser.parse_args()
+
+    voices = {speaker: (model, None) for speaker, model in DEFAULT_VOICES.items()}
+    voices.update({speaker: (model, config) for speaker, model, config in args.voice})
+    avatars = [a.strip().lower() for a in args.avatars.split(",") if a.strip()]
+    unknown = [a for a in avatars if a not in voices]
+    if unknown:
+        parser.error(f"No voice configured for: {', '.join(unknown)}")
+
+    bundle_format = args.bundle_format
+    encoder_formats = EncoderPool(workers=1).formats()
+    if bundle_format == "auto":
+        bundle_format = "ogg" if "ogg" in encoder_formats else "wav"
+    elif bundle_format not in encoder_formats + ["none"]:
+        parser.error(f"--bundle-format {bundle_format} needs ffmpeg")
+    if bundle_format == "none":
+        bundle_format = None
+
+    store = AudioStore(args.store)
+    index = load_index(args.store)
+    index["voices"] = {
+        speaker: {"model": model, "config": config, "digest": model_digest(model, config)}
+        for speaker, (model, config) in voices.items() if speaker in avatars
+    }
+
+    # One job per unique content hash; identical scripts across lessons render once
+    jobs = {}
+    entries = index["entries"]
+    for item in collect_texts(Path(args.data_dir)):
+        for speaker in avatars:
+            model, config = voices[speaker]
+            key = cache_key(speaker, item["text"], model, config, audio_format="wav")
+            timeline_key = cache_key(speaker, item["text"], model, config, audio_format="visemes")
+            # Same keys cached_bundle and cached_encoding use, so the servers serve these directly
+            bundle_key = encoded_key = None
+            if bundle_format:
+                bundle_key = cache_key(speaker, item["text"], model, config, audio_format=f"bundle.{bundle_format}")
+                if bundle_format != "wav":
+                    encoded_key = cache_key(speaker, item["text"], model, config, audio_format=bundle_format)
+            entry_id = f"{item['source']}#{item['location']}@{speaker}"
+            previous = entries.get(entry_id, {})
+            if previous.get("key") != key:
+                # Script text or voice changed since the last run
+                previous = {}
+            entries[entry_id] = dict(previous, **item, speaker=speaker, key=key)
+            if bundle_key:
+                entries[entry_id]["bundle"] = bundle_key
+            else:
+                entries[entry_id].pop("bundle", None)
+            rendered_already = store.exists(key) and store.exists(timeline_key)
+            if key not in jobs and not (rendered_already and (not bundle_key or store.exists(bundle_key))):
+                jobs[key] = (
+                    key, timeline_key, bundle_key, encoded_key, bundle_format,
+                    speaker, item["text"], model, config, str(store.root)
+                )
+
+    print("=" * 70)
+    print("🎧 Pre-rendering lesson audio")
+    print("=" * 70)
+    print(f"✅ Store: {store.root}")
+    print(f"✅ Avatars: {avatars}")
+    print(f"✅ Bundles: {bundle_format or 'off'}")
+    print(f"✅ Entries: {len(entries)} ({len(jobs)} to render, rest already in store)")
+    if args.dry_run:
+        return
+
+    store.root.mkdir(parents=True, exist_ok=True)
+    rendered = {}
+    failures = 0
+    started = time.time()
+    with Pool(processes=args.workers, initializer=init_worker,
+              initargs=({s: voices[s] for s in avatars},)) as pool:
+        for done, (key, duration, size, error) in enumerate(
+                pool.imap_unordered(render, jobs.values()), start=1):
+            if error:
+                failures += 1
+                print(f"❌ {key[:12]}: {error}")
+                continue
+            rendered[key] = (duration, size)
+            if done % 25 == 0:
+                print(f"   {done}/{len(jobs)} rendered")
+
+    # Fill durations for everything in the store, including earlier runs
+    for entry in entries.values():
+        key = entry["key"]
+        if key in rendered:
+            entry["duration"], entry["bytes"] = rendered[key]
+        elif "duration" not in entry and store.exists(key):
+            audio_data = store.read(key)
+            entry["duration"], entry["bytes"] = wav_duration(audio_data), len(audio_data)
+
+    index["bundle_format"] = bundle_format
+    index["version"] = "prerender_v1"
+    index["generated_at"] = int(time.time())
+    write_index(args.store, index)
+
+    print(f"✅ Rendered {len(rendered)} clips in {time.time() - started:.1f}s, {failures} failed")
+    print(f"✅ Index written to {store.root / INDEX_FILE}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The backend and TTS modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Importing app opens its database; keep the tracked ilearnhow.db out of the tests
+os.environ.setdefault("ILEARNHOW_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="ilearnhow-tests-"), "test.db"))
+os.environ.setdefault("LESSON_RELOAD_SECONDS", "0")
@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool, connect
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "pool.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_connect_applies_wal_and_pragmas(db_path):
+    conn = connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+    assert isinstance(conn.execute("SELECT 1 AS one").fetchone(), sqlite3.Row)
+    conn.close()
+
+
+def test_close_returns_connection_for_reuse(db_path):
+    pool = ConnectionPool(db_path, size=2)
+    first = pool.acquire()
+    raw = first._conn
+    first.close()
+    assert first.closed
+
+    second = pool.acquire()
+    assert second._conn is raw
+    assert pool.stats()["open"] == 1
+    second.close()
+
+
+def test_release_rolls_back_uncommitted_work(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO t (value) VALUES ('left behind')")
+    conn.close()
+
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    conn.close()
+
+
+def test_context_manager_commits(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    conn = pool.acquire()
+    with conn:
+        conn.execute("INSERT INTO t (value) VALUES ('kept')")
+    conn.close()
+
+    check = sqlite3.connect(db_path)
+    assert check.execute("SELECT value FROM t").fetchall() == [("kept",)]
+    check.close()
+
+
+def test_exhausted_pool_waits_then_times_out(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    held = pool.acquire()
+    with pytest.raises(sqlite3.OperationalError, match="No database connection free"):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()["waits"] == 1
+
+    # A connection handed back wakes the waiter
+    threading.Timer(0.05, held.close).start()
+    conn = pool.acquire(timeout=2)
+    assert pool.stats()["open"] == 1
+    conn.close()
+
+
+def test_concurrent_readers_share_bounded_connections(db_path):
+    pool = ConnectionPool(db_path, size=3)
+    errors = []
+
+    def read():
+        try:
+            for _ in range(20):
+                conn = pool.acquire(timeout=5)
+                conn.execute("SELECT COUNT(*) FROM t").fetchone()
+                conn.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    stats = pool.stats()
+    assert stats["open"] <= 3
+    assert stats["idle"] == stats["open"]
+    assert stats["acquired"] == 160
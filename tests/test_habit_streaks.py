@@ -0,0 +1,189 @@
+import random
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from habit_streaks import (
+    STREAK_WINDOW_DAYS, ActivityBitmap, backfill, ensure_schema, longest_run, record_activity, trailing_ones
+)
+
+START = date(2025, 1, 1)
+
+
+def days(*offsets):
+    return [START + timedelta(days=offset) for offset in offsets]
+
+
+def test_trailing_ones_and_longest_run():
+    assert trailing_ones(0) == 0
+    assert trailing_ones(0b1) == 1
+    assert trailing_ones(0b1011) == 2
+    assert trailing_ones((1 << 300) - 1) == 300
+    assert longest_run(0) == 0
+    assert longest_run(0b1110110) == 3
+
+
+def test_mark_returns_the_streak_each_day_joins():
+    bits = ActivityBitmap()
+    assert [bits.mark(day) for day in days(0, 1, 2, 4)] == [1, 2, 3, 1]
+    # Marking the same day again changes nothing
+    assert bits.mark(days(4)[0]) == 1
+    assert bits.last_day == days(4)[0]
+
+
+def test_late_mark_joins_the_runs_on_either_side():
+    bits = ActivityBitmap.from_days(days(0, 1, 3, 4, 5))
+    assert bits.current_streak(days(5)[0]) == 3
+    assert bits.mark(days(2)[0]) == 6
+    assert bits.current_streak(days(5)[0]) == 6
+
+
+def test_days_outside_the_window_fall_off():
+    bits = ActivityBitmap.from_days(days(0))
+    assert bits.mark(days(0)[0] + timedelta(days=STREAK_WINDOW_DAYS + 5)) == 1
+    assert bits.bits == 1
+    assert bits.mark(days(0)[0]) == 0
+
+
+def test_status_lapses_without_a_write():
+    bits = ActivityBitmap.from_days(days(0, 1, 2))
+    today = days(2)[0]
+    assert bits.status(today)["streak_days"] == 3
+    assert bits.status(today)["daily_goal_met"] is True
+    # Still open the next day, broken the day after
+    assert bits.status(today + timedelta(days=1))["streak_days"] == 3
+    assert bits.status(today + timedelta(days=1))["daily_goal_met"] is False
+    lapsed = bits.status(today + timedelta(days=2), longest_streak=7)
+    assert (lapsed["streak_days"], lapsed["longest_streak"], lapsed["current_streak_start"]) == (0, 7, None)
+
+
+def test_status_goals():
+    status = ActivityBitmap.from_days(days(*range(25))).status(days(24)[0])
+    assert status["current_streak_start"] == START.isoformat()
+    assert status["weekly_goal_met"] and status["monthly_goal_met"]
+    sparse = ActivityBitmap.from_days(days(0, 3, 6)).status(days(6)[0])
+    assert not sparse["weekly_goal_met"] and not sparse["monthly_goal_met"]
+
+
+def test_blob_round_trip_and_legacy_rows():
+    bits = ActivityBitmap.from_days(days(0, 2, 3))
+    restored = ActivityBitmap.from_row(bits.to_blob(), days(3)[0].isoformat())
+    assert (restored.bits, restored.last_day) == (bits.bits, bits.last_day)
+    # Rows from before the bitmap are seeded from their stored streak
+    legacy = ActivityBitmap.from_row(None, days(3)[0].isoformat(), streak_days=4)
+    assert legacy.current_streak(days(3)[0]) == 4
+
+
+def old_update_habit_formation(habit, today):
+    """update_habit_formation as app.py had it before the bitmap, with `today` passed in"""
+    last_activity = date.fromisoformat(habit["last_activity_date"]) if habit["last_activity_date"] else None
+    if last_activity is None or (today - last_activity).days == 1:
+        new_streak = habit["streak_days"] + 1
+        streak_start = habit["current_streak_start"] or today.isoformat()
+    elif (today - last_activity).days == 0:
+        new_streak = habit["streak_days"]
+        streak_start = habit["current_streak_start"]
+    else:
+        new_streak = 1
+        streak_start = today.isoformat()
+    habit.update(
+        streak_days=new_streak,
+        longest_streak=max(habit["longest_streak"], new_streak),
+        current_streak_start=streak_start,
+        last_activity_date=today.isoformat()
+    )
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(":memory:")
+    cursor = conn.cursor()
+    # The tables as they were before the bitmap column
+    cursor.execute('''
+        CREATE TABLE habit_formation (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            streak_days INTEGER DEFAULT 0,
+            longest_streak INTEGER DEFAULT 0,
+            current_streak_start DATE,
+            last_activity_date DATE,
+            daily_goal_met BOOLEAN DEFAULT FALSE,
+            weekly_goal_met BOOLEAN DEFAULT FALSE,
+            monthly_goal_met BOOLEAN DEFAULT FALSE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE lesson_progress (
+            user_id INTEGER NOT NULL,
+            lesson_day INTEGER NOT NULL,
+            phase INTEGER NOT NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            completed_at TIMESTAMP,
+            UNIQUE(user_id, lesson_day, phase)
+        )
+    ''')
+    yield cursor
+    conn.close()
+
+
+def histories():
+    rng = random.Random(24)
+    yield [START]
+    yield days(0, 1, 2, 3)
+    yield days(0, 1, 5, 6, 7, 20)
+    yield days(0, 0, 1, 1, 3)
+    # Longer than the bitmap window: the longest streak must still come from the full history
+    yield days(*range(40), *range(400, 410))
+    for _ in range(20):
+        offsets = sorted(rng.sample(range(120), rng.randint(1, 60)))
+        yield days(*offsets)
+
+
+HABIT_FIELDS = ("streak_days", "longest_streak", "current_streak_start", "last_activity_date")
+
+
+@pytest.mark.parametrize("completions", list(histories()))
+def test_backfilled_streaks_match_the_old_update_habit_formation(cursor, completions):
+    habit = {"streak_days": 0, "longest_streak": 0, "current_streak_start": None, "last_activity_date": None}
+    for day in completions:
+        old_update_habit_formation(habit, day)
+
+    cursor.execute("INSERT INTO habit_formation (user_id) VALUES (1)")
+    cursor.executemany(
+        "INSERT OR IGNORE INTO lesson_progress (user_id, lesson_day, phase, completed, completed_at) "
+        "VALUES (1, ?, 5, 1, ?)",
+        [(n + 1, f"{day.isoformat()}T09:30:00") for n, day in enumerate(completions)]
+    )
+    assert ensure_schema(cursor) is True
+    assert ensure_schema(cursor) is False
+    assert backfill(cursor, today=completions[-1]) == 1
+
+    cursor.execute(f"SELECT {', '.join(HABIT_FIELDS)} FROM habit_formation WHERE user_id = 1")
+    assert dict(zip(HABIT_FIELDS, cursor.fetchone())) == habit
+
+
+@pytest.mark.parametrize("completions", list(histories())[:5])
+def test_incremental_updates_match_the_old_update_habit_formation(cursor, completions):
+    habit = {"streak_days": 0, "longest_streak": 0, "current_streak_start": None, "last_activity_date": None}
+    ensure_schema(cursor)
+    cursor.execute("INSERT INTO habit_formation (user_id) VALUES (1)")
+    for day in completions:
+        old_update_habit_formation(habit, day)
+        record_activity(cursor, {1: {day}}, today=day)
+        cursor.execute(f"SELECT {', '.join(HABIT_FIELDS)} FROM habit_formation WHERE user_id = 1")
+        assert dict(zip(HABIT_FIELDS, cursor.fetchone())) == habit
+
+
+def test_backfill_limited_to_some_learners(cursor):
+    ensure_schema(cursor)
+    cursor.executemany("INSERT INTO habit_formation (user_id) VALUES (?)", [(1,), (2,)])
+    cursor.executemany(
+        "INSERT INTO lesson_progress (user_id, lesson_day, phase, completed, completed_at) VALUES (?, 1, 1, 1, ?)",
+        [(1, START.isoformat()), (2, START.isoformat())]
+    )
+    assert backfill(cursor, user_ids=[], today=START) == 0
+    assert backfill(cursor, user_ids=[2], today=START) == 1
+    cursor.execute("SELECT user_id, streak_days FROM habit_formation ORDER BY user_id")
+    assert cursor.fetchall() == [(1, 0), (2, 1)]
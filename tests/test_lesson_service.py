@@ -0,0 +1,138 @@
+import json
+import os
+
+import pytest
+
+import app as backend
+from lesson_service import LESSON_DATA_DIR, LessonService, build_index
+
+
+def text(value):
+    return {"display_text": value, "voice_over_script": f"{value} (spoken)"}
+
+
+def dna(lesson_id, day, ages=("5", "25", "60"), tones=("neutral", "fun"), languages=("english", "spanish")):
+    return {
+        "lesson_metadata": {"lesson_id": lesson_id, "day": day, "universal_concept": "orbits"},
+        "age_expressions": {
+            age: {"concept_name": {tone: text(f"{lesson_id} {age} {tone}") for tone in tones}} for age in ages
+        },
+        "core_lesson_structure": {
+            question: {
+                "concept_focus": question,
+                "ages": {age: {"question": {tone: text(f"{question} {age}") for tone in tones},
+                               "option_a": text("a"), "option_b": text("b"), "correct_option": "a"}
+                         for age in ages}
+            }
+            for question in ("question_1", "question_2", "question_3")
+        },
+        "wisdom_phase_content": {"fortune": {tone: text(f"fortune {tone}") for tone in tones}},
+        "language_translations": {language: {"key_phrases": {"greeting": f"hello in {language}"}}
+                                  for language in languages},
+        "tone_delivery_dna": {tone: {"language_patterns": {"openings": [f"{tone} opening"]}} for tone in tones}
+    }
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    month = {"month": "january", "days": [
+        {"day": 1, "date": "2025-01-01", "title": "The Moon and its phases", "learning_objective": "phases"},
+        {"day": 2, "date": "2025-01-02", "title": "Rivers", "learning_objective": "water"}
+    ]}
+    (tmp_path / "january_curriculum.json").write_text(json.dumps(month))
+    (tmp_path / "moon_normalized.json").write_text(json.dumps(dna("the-moon", 1)))
+    return tmp_path
+
+
+def body(found):
+    return json.loads(found[0])
+
+
+@pytest.mark.parametrize("value, group", [
+    ("age_25", "25"), ("25", "25"), (25, "25"), ("30", "25"), (30.9, "25"), (3, "5"), ("70", "60"),
+    (500, "60"), (-4, "5"), (None, "25"), ("", "25")
+])
+def test_resolve_age(data_dir, value, group):
+    assert build_index(data_dir).resolve_age(value) == group
+
+
+def test_resolve_age_rejects_unparseable_ages(data_dir):
+    assert build_index(data_dir).resolve_age("teen") is None
+
+
+def test_lookup_renders_the_requested_variant(data_dir):
+    index = build_index(data_dir)
+    lesson = body(index.lookup(1, age="age_5", tone="fun", language="spanish"))
+    assert lesson["lesson_id"] == "the-moon"
+    assert lesson["variant"] == {"age_group": "age_5", "tone": "fun", "language": "spanish"}
+    assert lesson["phases"]["1"]["content"] == "the-moon 5 fun"
+    assert lesson["phases"]["1"]["greeting"] == "hello in spanish"
+    assert lesson["phases"]["5"]["content"] == "fortune fun"
+    assert lesson["variants"]["age_groups"] == ["age_5", "age_25", "age_60"]
+
+
+def test_lookup_falls_back_to_defaults(data_dir):
+    index = build_index(data_dir)
+    default = index.lookup(1)
+    assert body(default)["variant"] == {"age_group": "age_25", "tone": "neutral", "language": "english"}
+    assert index.lookup(1, age="teen", tone="grumpy", language="klingon") == default
+
+
+def test_lookup_etags_differ_per_variant(data_dir):
+    index = build_index(data_dir)
+    assert index.lookup(1, age="5")[1] != index.lookup(1, age="60")[1]
+    assert index.lookup(1, age="5")[1] == build_index(data_dir).lookup(1, age="5")[1]
+
+
+def test_lookup_curriculum_only_and_missing_days(data_dir):
+    index = build_index(data_dir)
+    river = index.lookup(2, age="5", tone="fun")
+    assert body(river)["title"] == "Rivers"
+    assert body(river)["lesson_id"] is None
+    assert river[2] is None
+    for day in (0, 3, 366, 367, -1):
+        assert index.lookup(day) is None
+
+
+def test_service_reloads_when_files_change(data_dir):
+    service = LessonService(data_dir, reload_seconds=0).start()
+    assert body(service.lookup(2))["title"] == "Rivers"
+    assert service.load() is False
+
+    path = data_dir / "january_curriculum.json"
+    month = json.loads(path.read_text())
+    month["days"][1]["title"] = "Rivers and lakes"
+    path.write_text(json.dumps(month))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    assert service.load() is True
+    assert body(service.lookup(2))["title"] == "Rivers and lakes"
+    assert service.stats()["reloads"] == 1
+
+
+def test_service_keeps_the_last_good_index_on_a_broken_reload(data_dir):
+    service = LessonService(data_dir, reload_seconds=0).start()
+    path = data_dir / "january_curriculum.json"
+    path.write_text("{ half written")
+    assert service.load() is False
+    assert body(service.lookup(2))["title"] == "Rivers"
+    assert service.stats()["failures"] == 1
+    # The same broken files are not parsed again
+    assert service.load() is False
+    assert service.stats()["failures"] == 1
+
+
+def test_repository_curriculum_loads():
+    index = build_index(LESSON_DATA_DIR)
+    assert index.lookup(1) is not None
+    assert all(index.lookup(day) is not None for day in range(1, 367) if index.days[day] is not None)
+
+
+def test_lesson_endpoint_serves_the_index_with_etags():
+    client = backend.app.test_client()
+    response = client.get('/api/lessons/1?age=8&tone=fun')
+    assert response.status_code == 200
+    assert response.get_json()["day"] == 1
+    etag = response.headers["ETag"]
+    assert client.get('/api/lessons/1?age=8&tone=fun', headers={"If-None-Match": etag}).status_code == 304
+    assert client.get('/api/lessons/0').status_code == 400
+    assert client.get('/api/lessons/367').status_code == 400
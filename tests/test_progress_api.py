@@ -0,0 +1,107 @@
+import itertools
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app as backend
+
+_users = itertools.count()
+
+
+@pytest.fixture
+def client():
+    """A test client logged in as a freshly registered learner"""
+    client = backend.app.test_client()
+    name = f'learner{next(_users)}'
+    response = client.post('/api/auth/register', json={
+        'username': name, 'password': 'secret', 'email': f'{name}@example.com'
+    })
+    assert response.status_code == 201
+    return client
+
+
+def progress(client, day=None):
+    response = client.get('/api/lessons/progress', query_string={'day': day} if day else None)
+    assert response.status_code == 200
+    return response.get_json()['progress']
+
+
+def test_bulk_requires_login():
+    response = backend.app.test_client().post('/api/lessons/progress/bulk', json=[{'lesson_day': 1, 'phase': 1}])
+    assert response.status_code == 401
+
+
+def test_bulk_applies_events_in_order(client):
+    response = client.post('/api/lessons/progress/bulk', json={'events': [
+        {'lesson_day': 1, 'phase': 1, 'completed': False, 'time_spent': 5},
+        {'lesson_day': 1, 'phase': 1, 'completed': True, 'time_spent': 30, 'answers': ['a']},
+        {'lesson_day': '2', 'phase': 3, 'completed': True}
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()['applied'] == 3
+    assert response.get_json()['phases'] == 2
+
+    # Committed before responding, not just buffered
+    assert backend.PROGRESS_BUFFER.stats()['pending'] == 0
+    rows = progress(client)
+    assert [(row['lesson_day'], row['phase'], row['completed'], row['time_spent']) for row in rows] == [
+        (1, 1, 1, 30), (2, 3, 1, 0)
+    ]
+    assert rows[0]['answers'] == '["a"]'
+
+
+@pytest.mark.parametrize('body', [None, [], {'events': []}, {'events': 'nope'}])
+def test_bulk_rejects_empty_or_malformed_batches(client, body):
+    assert client.post('/api/lessons/progress/bulk', json=body).status_code == 400
+
+
+def test_bulk_rejects_oversized_batches(client, monkeypatch):
+    monkeypatch.setattr(backend, 'PROGRESS_BULK_MAX', 2)
+    events = [{'lesson_day': 1, 'phase': phase} for phase in (1, 2, 3)]
+    assert client.post('/api/lessons/progress/bulk', json=events).status_code == 413
+
+
+@pytest.mark.parametrize('bad', [
+    {'phase': 1},
+    {'lesson_day': [1], 'phase': 1},
+    {'lesson_day': 0, 'phase': 1},
+    {'lesson_day': 367, 'phase': 1},
+    {'lesson_day': 1, 'phase': 'three'},
+    {'lesson_day': 1, 'phase': True},
+    {'lesson_day': 1, 'phase': 1, 'completed': 'yes'},
+    {'lesson_day': 1, 'phase': 1, 'time_spent': -1},
+    {'lesson_day': 1, 'phase': 1, 'time_spent': []},
+    {'lesson_day': 1, 'phase': 1, 'completed_at': 'yesterday'},
+    {'lesson_day': 1, 'phase': 1, 'completed_at': 3},
+    'not an event'
+])
+def test_bulk_rejects_a_bad_event_with_its_index_and_applies_nothing(client, bad):
+    response = client.post('/api/lessons/progress/bulk', json=[{'lesson_day': 5, 'phase': 1}, bad])
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 1
+    assert progress(client, day=5) == []
+
+
+def test_bulk_replayed_completions_count_on_their_own_days(client):
+    today = date.today()
+    events = [
+        {'lesson_day': n + 1, 'phase': 5, 'completed': True,
+         'completed_at': datetime.combine(today - timedelta(days=2 - n), datetime.min.time()).isoformat()}
+        for n in range(3)
+    ]
+    assert client.post('/api/lessons/progress/bulk', json=events).status_code == 200
+
+    habits = client.get('/api/habits/status').get_json()
+    assert habits['streak_days'] == 3
+    assert habits['current_streak_start'] == (today - timedelta(days=2)).isoformat()
+    assert habits['daily_goal_met'] is True
+
+
+def test_bulk_clamps_future_completions_to_now(client):
+    tomorrow = (datetime.now() + timedelta(days=1)).isoformat()
+    response = client.post('/api/lessons/progress/bulk', json=[
+        {'lesson_day': 1, 'phase': 1, 'completed': True, 'completed_at': tomorrow}
+    ])
+    assert response.status_code == 200
+    assert progress(client)[0]['completed_at'] <= datetime.now().isoformat()
+    assert client.get('/api/habits/status').get_json()['last_activity_date'] == date.today().isoformat()
@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+from progress_buffer import WriteBehindBuffer
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "buffer.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE progress (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def write_rows(cursor, events):
+    cursor.executemany(
+        "INSERT OR REPLACE INTO progress (key, value) VALUES (?, ?)",
+        [(key, event["value"]) for key, event in events]
+    )
+
+
+def rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute("SELECT key, value FROM progress"))
+    finally:
+        conn.close()
+
+
+def make_buffer(db_path, **kwargs):
+    kwargs.setdefault("flush_ms", 60000)
+    return WriteBehindBuffer(write_rows, connect=lambda: sqlite3.connect(db_path), **kwargs)
+
+
+def test_record_coalesces_per_key_until_flush(db_path):
+    buffer = make_buffer(db_path)
+    buffer.record("a", {"value": 1})
+    buffer.record("a", {"value": 2})
+    buffer.record("b", {"value": 3})
+
+    assert rows(db_path) == {}
+    assert buffer.pending() == {"a": {"value": 2}, "b": {"value": 3}}
+    assert buffer.flush() == 2
+    assert rows(db_path) == {"a": 2, "b": 3}
+    stats = buffer.stats()
+    assert (stats["events"], stats["coalesced"], stats["flushes"], stats["pending"]) == (3, 1, 1, 0)
+
+
+def test_merge_folds_newer_event_into_pending(db_path):
+    buffer = make_buffer(db_path, merge=lambda previous, event: {"value": previous["value"] + event["value"]})
+    buffer.record_many([("a", {"value": 1}), ("a", {"value": 2})])
+    buffer.record("a", {"value": 4})
+    buffer.flush()
+    assert rows(db_path) == {"a": 7}
+
+
+def test_pending_filters_by_key(db_path):
+    buffer = make_buffer(db_path)
+    buffer.record_many([(("u1", 1), {"value": 1}), (("u2", 1), {"value": 2})])
+    assert buffer.pending(lambda key: key[0] == "u2") == {("u2", 1): {"value": 2}}
+
+
+def test_write_through_commits_immediately(db_path):
+    buffer = make_buffer(db_path, flush_ms=0).start()
+    buffer.record("a", {"value": 1})
+    assert rows(db_path) == {"a": 1}
+    assert buffer.stats()["pending"] == 0
+
+
+def test_background_thread_flushes_at_max_events(db_path):
+    buffer = make_buffer(db_path, max_events=2).start()
+    buffer.record_many([("a", {"value": 1}), ("b", {"value": 2})])
+    buffer.close()
+    assert rows(db_path) == {"a": 1, "b": 2}
+    # Once closed, events are written through
+    buffer.record("c", {"value": 3})
+    assert rows(db_path)["c"] == 3
+
+
+def test_poison_event_is_dropped_and_the_rest_committed(db_path):
+    buffer = make_buffer(db_path)
+    buffer.record_many([("good", {"value": 1}), ("poison", {"value": None}), ("also good", {"value": 2})])
+
+    # NOT NULL fails the batch; committed one by one, only the poison event is lost
+    assert buffer.flush() == 2
+    assert rows(db_path) == {"good": 1, "also good": 2}
+    stats = buffer.stats()
+    assert (stats["failures"], stats["dropped"], stats["pending"]) == (1, 1, 0)
+
+    # Later flushes are not held back by it
+    buffer.record("next", {"value": 3})
+    assert buffer.flush() == 1
+    assert rows(db_path)["next"] == 3
+
+
+def test_unbindable_event_is_dropped(db_path):
+    buffer = make_buffer(db_path)
+    buffer.record_many([("good", {"value": 1}), ("poison", {"value": {"not": "bindable"}})])
+    assert buffer.flush() == 1
+    assert rows(db_path) == {"good": 1}
+    assert buffer.stats()["dropped"] == 1
+
+
+def test_transient_failure_requeues_with_newer_events_winning(db_path):
+    attempts = []
+
+    def flaky_connect():
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        return sqlite3.connect(db_path)
+
+    buffer = WriteBehindBuffer(write_rows, connect=flaky_connect, flush_ms=60000)
+    buffer.record_many([("a", {"value": 1}), ("b", {"value": 2})])
+    with pytest.raises(sqlite3.OperationalError):
+        buffer.flush()
+    assert buffer.stats()["dropped"] == 0
+    assert buffer.pending() == {"a": {"value": 1}, "b": {"value": 2}}
+
+    # Recorded while the failed batch was out: newer than the re-queued event
+    buffer.record("a", {"value": 10})
+    assert buffer.flush() == 2
+    assert rows(db_path) == {"a": 10, "b": 2}
@@ -0,0 +1,115 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from tts_alignment import (
+    VISEMES, align_phonemes, align_text, grapheme_units, ipa_units, mouth_envelope, place_units, voiced_bounds,
+    wav_envelope
+)
+
+RATE = 16000
+
+
+def pcm(*spans):
+    """int16 PCM of (seconds, amplitude) spans of a 220 Hz tone, amplitude 0 for silence"""
+    parts = []
+    for seconds, amplitude in spans:
+        t = np.arange(int(seconds * RATE)) / RATE
+        parts.append(amplitude * np.sin(2 * np.pi * 220 * t))
+    return np.concatenate(parts).astype("<i2").tobytes()
+
+
+def wav_file(data, channels=1, width=2):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(RATE)
+        wav.writeframes(data)
+    return buffer.getvalue()
+
+
+def assert_contiguous(timeline, duration):
+    assert timeline[0]["start"] == 0.0
+    assert timeline[-1]["end"] == pytest.approx(duration, abs=0.001)
+    for previous, entry in zip(timeline, timeline[1:]):
+        assert previous["end"] == entry["start"]
+    assert all(entry["phoneme"] in VISEMES for entry in timeline)
+
+
+def test_voiced_bounds_skip_leading_and_trailing_silence():
+    start, end = voiced_bounds(pcm((0.2, 0), (0.5, 8000), (0.3, 0)), RATE)
+    assert start == pytest.approx(0.2, abs=0.011)
+    assert end == pytest.approx(0.7, abs=0.011)
+
+
+@pytest.mark.parametrize("data", [b"", pcm((0.3, 0)), b"\1\0" * 10])
+def test_voiced_bounds_of_silent_or_tiny_audio_span_everything(data):
+    assert voiced_bounds(data, RATE) == (0.0, len(data) / 2.0 / RATE)
+
+
+def test_ipa_units():
+    # Stress marks and spaces take no time; the length mark stretches the vowel before it
+    assert ipa_units("ˈmuːn,") == [("MBP", 0.55), ("O", 1.6), ("DNTL", 0.55), ("REST", 2.0)]
+
+
+def test_grapheme_units_read_digraphs_first():
+    assert [viseme for viseme, _ in grapheme_units("The moon!")] == ["TH", "E", "MBP", "O", "DNTL", "REST"]
+
+
+def test_place_units_merges_repeats_and_fills_the_span():
+    timeline = place_units([("A", 1.0), ("A", 1.0), ("S", 2.0)], 1.0, 2.0, offset=10.0)
+    assert timeline == [
+        {"phoneme": "A", "start": 11.0, "end": 11.5},
+        {"phoneme": "S", "start": 11.5, "end": 12.0}
+    ]
+    assert place_units([], 0.0, 1.0) == []
+    assert place_units([("A", 1.0)], 1.0, 1.0) == []
+
+
+def test_align_phonemes_closes_the_mouth_over_silence():
+    audio = pcm((0.2, 0), (0.5, 8000), (0.3, 0))
+    timeline = align_phonemes("həlˈoʊ.", audio, RATE, offset=1.0)
+    assert timeline[0]["phoneme"] == timeline[-1]["phoneme"] == "REST"
+    assert timeline[0]["start"] == 1.0
+    assert timeline[1]["start"] == pytest.approx(1.2, abs=0.011)
+    assert timeline[-1]["end"] == pytest.approx(2.0, abs=0.001)
+    assert [entry["phoneme"] for entry in timeline[1:-1]] == ["E", "DNTL", "O", "REST"]
+
+
+def test_align_text_from_audio_or_duration():
+    audio = pcm((0.1, 0), (0.6, 8000), (0.1, 0))
+    assert_contiguous(align_text("Hello there, moon.", audio, RATE), 0.8)
+    by_duration = align_text("Hello there, moon.", duration=1.5)
+    assert_contiguous(by_duration, 1.5)
+    assert by_duration[0]["phoneme"] == "E"
+
+
+def test_mouth_envelope_follows_loudness():
+    audio = pcm((0.2, 0), (0.2, 300), (0.2, 8000))
+    values = mouth_envelope(audio, RATE, fps=10)
+    assert len(values) == 6
+    assert values[:2] == [0.0, 0.0]
+    assert 0.0 < values[2] < values[4] == 1.0
+    assert all(0.0 <= value <= 1.0 for value in values)
+
+
+def test_mouth_envelope_of_silence_and_empty_audio():
+    assert mouth_envelope(pcm((0.1, 0)), RATE, fps=30) == [0.0] * 3
+    assert mouth_envelope(b"", RATE) == []
+
+
+def test_mouth_envelope_downmixes_stereo():
+    mono = pcm((0.1, 0), (0.1, 8000))
+    stereo = np.repeat(np.frombuffer(mono, dtype="<i2"), 2).astype("<i2").tobytes()
+    assert mouth_envelope(stereo, RATE, fps=20, channels=2) == mouth_envelope(mono, RATE, fps=20)
+
+
+def test_wav_envelope():
+    audio = pcm((0.1, 0), (0.1, 8000))
+    envelope = wav_envelope(wav_file(audio), fps=20)
+    assert envelope == {"fps": 20, "values": mouth_envelope(audio, RATE, fps=20)}
+    with pytest.raises(ValueError, match="16-bit"):
+        wav_envelope(wav_file(b"\0" * 100, width=1))
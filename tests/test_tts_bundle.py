@@ -0,0 +1,119 @@
+import io
+import wave
+
+import pytest
+
+from tts_bundle import (
+    BUNDLE_HEADER, BUNDLE_KEY, VISEME_RECORD, BundleError, build_bundle, byte_range, pack_visemes, read_bundle,
+    read_header, unpack_visemes, wav_bundle
+)
+
+TIMELINE = [
+    {"phoneme": "REST", "start": 0.0, "end": 0.12},
+    {"phoneme": "A", "start": 0.12, "end": 0.3},
+    {"phoneme": "MBP", "start": 0.3, "end": 0.451}
+]
+
+
+def wav_file(pcm, sample_rate=22050, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def test_visemes_round_trip_through_packed_records():
+    packed = pack_visemes(TIMELINE)
+    assert len(packed) == VISEME_RECORD.size * len(TIMELINE)
+    assert unpack_visemes(packed) == TIMELINE
+    assert unpack_visemes(packed, count=1) == TIMELINE[:1]
+
+
+def test_unknown_visemes_pack_as_rest():
+    assert unpack_visemes(pack_visemes([{"phoneme": "??", "start": 0, "end": 0.1}]))[0]["phoneme"] == "REST"
+
+
+def test_wav_bundle_carries_bare_pcm_on_aligned_sections():
+    pcm = bytes(range(256)) * 8
+    audio = wav_file(pcm, sample_rate=16000)
+    text = "Hé, moon"  # not a multiple of 4 bytes in UTF-8
+    bundle = wav_bundle(audio, audio, "wav", TIMELINE, text, 0.064)
+
+    found = read_bundle(bundle)
+    assert (found["codec"], found["sample_rate"], found["channels"], found["duration_ms"]) == ("pcm_s16le", 16000, 1, 64)
+    assert found["visemes"] == TIMELINE
+    assert found["text"] == text
+    assert bytes(found["audio"]) == pcm
+    assert found["audio_length"] == len(pcm)
+    for section in ("viseme_offset", "text_offset", "audio_offset"):
+        assert found[section] % 4 == 0
+    # A sample's position comes straight from its time
+    seek = found["audio_offset"] + 2 * (32 * 16000 // 1000)
+    assert bundle[seek:seek + 2] == pcm[1024:1026]
+
+
+def test_encoded_bundles_carry_the_encoded_file():
+    audio = wav_file(b"\0\0" * 100)
+    bundle = wav_bundle(audio, b"OggS encoded", "ogg", [], "", 0.01)
+    found = read_bundle(bundle)
+    assert found["codec"] == "opus"
+    assert bytes(found["audio"]) == b"OggS encoded"
+    assert found["visemes"] == []
+
+
+def test_build_bundle_rejects_unknown_formats():
+    with pytest.raises(BundleError):
+        build_bundle(b"", "flac", [], "", 0, 22050)
+
+
+def test_read_header_from_a_range_response():
+    bundle = build_bundle(b"\0" * 40, "mp3", TIMELINE, "hi", 0.5, 24000)
+    header = read_header(bundle[:BUNDLE_HEADER.size])
+    assert (header["codec"], header["viseme_count"], header["text_length"], header["audio_length"]) == ("mp3", 3, 2, 40)
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"ILHB", "shorter"),
+    (b"XXXX" + b"\0" * BUNDLE_HEADER.size, "Not a TTS bundle"),
+    (BUNDLE_HEADER.pack(b"ILHB", 9, BUNDLE_HEADER.size, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0), "version 9"),
+])
+def test_read_header_rejects_other_data(data, message):
+    with pytest.raises(BundleError, match=message):
+        read_header(data)
+
+
+def test_read_bundle_rejects_truncated_audio():
+    bundle = build_bundle(b"\0" * 40, "wav", TIMELINE, "hi", 0.5, 22050)
+    with pytest.raises(BundleError, match="truncated"):
+        read_bundle(bundle[:-1])
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("items=0-10", None),
+    ("bytes=0-10,20-30", None),
+    ("bytes=a-b", None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+])
+def test_byte_range(header, expected):
+    assert byte_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=100-200", "bytes=10-5", "bytes=-0"])
+def test_byte_range_not_satisfiable(header):
+    with pytest.raises(BundleError):
+        byte_range(header, 100)
+
+
+def test_bundle_key_is_a_sha256_hex_digest():
+    assert BUNDLE_KEY.fullmatch("ab" * 32)
+    assert not BUNDLE_KEY.fullmatch("AB" * 32)
+    assert not BUNDLE_KEY.fullmatch("../" + "a" * 61)
@@ -0,0 +1,68 @@
+import pytest
+
+from tts_bundle import read_bundle
+from tts_cache import AudioCache, cached_bundle, cached_encoding, cached_synthesis
+from tts_engine import wav_duration
+
+
+class FakeEngines:
+    scheduler = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def synthesize_aligned(self, model, text, config=None):
+        self.calls += 1
+        return b"\1\0" * 160, 16000, [{"phoneme": "A", "start": 0.0, "end": 0.01}]
+
+
+class FakeEncoders:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, audio_data, audio_format):
+        self.calls += 1
+        return b"OggS" + audio_data[-8:]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AudioCache(disk_dir=str(tmp_path / "cache"), prerender_dir=None)
+
+
+def request(cache, engines, encoders, text="Hello there."):
+    """What /api/tts does for an ogg bundle: synthesize, encode, bundle"""
+    audio_data, timeline = cached_synthesis(cache, engines, "ken", text, "en_US-ken")
+    payload = cached_encoding(cache, encoders, "ken", text, "en_US-ken", audio_data, "ogg")
+    key, bundle = cached_bundle(
+        cache, "ken", text, "en_US-ken", audio_data, payload, "ogg", timeline, wav_duration(audio_data)
+    )
+    return payload, key, bundle
+
+
+def test_repeat_request_is_served_from_the_cache(cache):
+    engines, encoders = FakeEngines(), FakeEncoders()
+    first = request(cache, engines, encoders)
+    assert request(cache, engines, encoders) == first
+    assert (engines.calls, encoders.calls) == (1, 1)
+    assert read_bundle(first[2])["codec"] == "opus"
+
+
+def test_one_hit_or_miss_per_synthesis_request(cache):
+    engines, encoders = FakeEngines(), FakeEncoders()
+    request(cache, engines, encoders)
+    request(cache, engines, encoders)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_encoding_a_prerendered_wav_is_still_a_hit(tmp_path):
+    engines, encoders = FakeEngines(), FakeEncoders()
+    prerender = AudioCache(disk_dir=str(tmp_path / "render"), prerender_dir=None)
+    cached_synthesis(prerender, engines, "ken", "Hello there.", "en_US-ken")
+
+    cache = AudioCache(disk_dir=str(tmp_path / "cache"), prerender_dir=str(tmp_path / "render"))
+    audio_data, _ = cached_synthesis(cache, engines, "ken", "Hello there.", "en_US-ken")
+    cached_encoding(cache, encoders, "ken", "Hello there.", "en_US-ken", audio_data, "ogg")
+    stats = cache.stats()
+    assert (stats["hits_prerendered"], stats["misses"], engines.calls, encoders.calls) == (1, 0, 1, 1)
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tts_parallel
+from tts_parallel import parallel_synthesis, sentence_runs, stitch
+from tts_scheduler import SynthesisScheduler
+from tts_streaming import split_sentences
+
+RATE = 1000
+TEXT = " ".join(f"Sentence number {n} is about the moon." for n in range(24))
+
+
+class FakeEngines:
+    """Stands in for VoiceEnginePool: one sample per character, each call on a scheduler slot like _run"""
+
+    def __init__(self, scheduler=None, delay=0.02):
+        self.scheduler = scheduler
+        self.delay = delay
+        self.running = Counter()
+        self.peak = Counter()
+        self._lock = threading.Lock()
+
+    def synthesize_aligned(self, model, text, config=None):
+        def synthesize():
+            with self._lock:
+                self.running[model] += 1
+                self.peak[model] = max(self.peak[model], self.running[model])
+            try:
+                time.sleep(self.delay)
+                pcm = b"\1\0" * len(text)
+                return pcm, RATE, [{"phoneme": "A", "start": 0.0, "end": len(text) / RATE}]
+            finally:
+                with self._lock:
+                    self.running[model] -= 1
+
+        if self.scheduler is None:
+            return synthesize()
+        return self.scheduler.run(model, synthesize)
+
+
+@pytest.fixture
+def wide(monkeypatch):
+    """Fan-out wider than the scheduler's per-voice workers, as with TTS_PARALLEL_WORKERS=8"""
+    executor = ThreadPoolExecutor(max_workers=8)
+    monkeypatch.setattr(tts_parallel, "TTS_PARALLEL_WORKERS", 8)
+    monkeypatch.setattr(tts_parallel, "TTS_PARALLEL_MIN_CHARS", 100)
+    monkeypatch.setattr(tts_parallel, "SENTENCE_EXECUTOR", executor)
+    yield
+    executor.shutdown()
+
+
+def test_sentence_runs_are_balanced_and_keep_every_sentence():
+    runs = sentence_runs(TEXT, 4)
+    assert len(runs) == 4
+    assert " ".join(runs) == " ".join(split_sentences(TEXT))
+    lengths = [len(run) for run in runs]
+    assert max(lengths) - min(lengths) <= len(split_sentences(TEXT)[0]) + 1
+
+
+def test_sentence_runs_never_outnumber_sentences():
+    assert sentence_runs("One. Two.", 8) == ["One.", "Two."]
+    assert sentence_runs("Just one sentence", 3) == ["Just one sentence"]
+
+
+def test_stitch_shifts_timelines_by_the_audio_before_them():
+    results = [
+        (b"\0\0" * 500, [{"phoneme": "A", "start": 0.0, "end": 0.5}]),
+        (b"\0\0" * 250, [{"phoneme": "O", "start": 0.1, "end": 0.25}])
+    ]
+    pcm, timeline = stitch(results, RATE, silence=0)
+    assert len(pcm) == 1500
+    assert timeline == [{"phoneme": "A", "start": 0.0, "end": 0.5}, {"phoneme": "O", "start": 0.6, "end": 0.75}]
+
+    pcm, timeline = stitch(results, RATE, silence=0.2)
+    assert len(pcm) == 1900
+    assert timeline[1] == {"phoneme": "REST", "start": 0.5, "end": 0.7}
+    assert timeline[2] == {"phoneme": "O", "start": 0.8, "end": 0.95}
+
+
+def test_parallel_output_matches_the_runs_in_order(wide):
+    pcm, sample_rate, timeline = parallel_synthesis(FakeEngines(), "voice", TEXT)
+    runs = sentence_runs(TEXT, 8)
+    assert sample_rate == RATE
+    assert len(pcm) == 2 * sum(len(run) for run in runs)
+    assert [entry["start"] for entry in timeline] == pytest.approx(
+        [sum(len(run) for run in runs[:index]) / RATE for index in range(len(runs))]
+    )
+
+
+def test_short_text_is_one_call(wide):
+    engines = FakeEngines()
+    pcm, _, timeline = parallel_synthesis(engines, "voice", "Short. Text.")
+    assert len(pcm) == 2 * len("Short. Text.")
+    assert len(timeline) == 1
+
+
+def test_concurrent_long_requests_stay_within_the_per_voice_workers(wide):
+    scheduler = SynthesisScheduler(workers_per_voice=2, max_queue=8, queue_timeout=10)
+    engines = FakeEngines(scheduler)
+    errors = []
+
+    def request():
+        try:
+            parallel_synthesis(engines, "voice", TEXT)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert engines.peak["voice"] == 2
+    stats = scheduler.stats()["voices"]["voice"]
+    assert (stats["active"], stats["completed"]) == (0, 3)
+
+
+def test_a_request_fans_out_only_across_free_slots(wide):
+    scheduler = SynthesisScheduler(workers_per_voice=2, max_queue=8, queue_timeout=10)
+    engines = FakeEngines(scheduler)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        held.set()
+        release.wait(5)
+
+    holder = threading.Thread(target=scheduler.run, args=("voice", hold))
+    holder.start()
+    held.wait(5)
+    try:
+        # One of the two slots is taken: the utterance runs whole on the other
+        pcm, _, timeline = parallel_synthesis(engines, "voice", TEXT)
+    finally:
+        release.set()
+        holder.join()
+    assert len(pcm) == 2 * len(TEXT)
+    assert len(timeline) == 1
+    assert engines.peak["voice"] == 1
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from tts_scheduler import SchedulerBusy, SynthesisScheduler
+
+
+class Holder:
+    """Keeps one of a voice's slots busy on a background thread until released"""
+
+    def __init__(self, scheduler, voice="ken"):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=scheduler.run, args=(voice, self._hold))
+        self.thread.start()
+
+    def _hold(self):
+        self.started.set()
+        self.release.wait(5)
+
+    def wait_started(self):
+        assert self.started.wait(5)
+        return self
+
+    def finish(self):
+        self.release.set()
+        self.thread.join(5)
+
+
+def test_run_returns_the_result_and_records_the_call():
+    scheduler = SynthesisScheduler(workers_per_voice=2, max_queue=4)
+    assert scheduler.run("ken", lambda a, b=0: a + b, 1, b=2) == 3
+    stats = scheduler.stats()["voices"]["ken"]
+    assert (stats["active"], stats["completed"], stats["queue_depth"]) == (0, 1, 0)
+    assert stats["service"]["max_ms"] is not None
+
+
+def test_errors_propagate_and_free_the_slot():
+    scheduler = SynthesisScheduler(workers_per_voice=1, max_queue=1, queue_timeout=1)
+
+    def fail():
+        raise RuntimeError("piper crashed")
+
+    with pytest.raises(RuntimeError):
+        scheduler.run("ken", fail)
+    assert scheduler.run("ken", lambda: "ok") == "ok"
+
+
+def test_full_queue_is_refused_with_retry_after():
+    scheduler = SynthesisScheduler(workers_per_voice=1, max_queue=1, queue_timeout=5)
+    holder = Holder(scheduler).wait_started()
+    queued = threading.Thread(target=scheduler.run, args=("ken", lambda: None))
+    queued.start()
+    try:
+        for _ in range(500):
+            if scheduler.queue("ken").waiting:
+                break
+            time.sleep(0.01)
+        scheduler.queue("ken").services.extend([2.0, 4.0])
+        with pytest.raises(SchedulerBusy) as refused:
+            scheduler.run("ken", lambda: None)
+    finally:
+        holder.finish()
+        queued.join(5)
+
+    # Average service 3s x (1 waiting + 1 active) / 1 worker
+    assert refused.value.retry_after == 6
+    assert (refused.value.voice, refused.value.reason) == ("ken", "queue full")
+    assert scheduler.stats()["voices"]["ken"]["rejected"] == 1
+
+
+def test_queue_timeout_is_refused_with_retry_after():
+    scheduler = SynthesisScheduler(workers_per_voice=1, max_queue=4, queue_timeout=0.05)
+    holder = Holder(scheduler).wait_started()
+    try:
+        with pytest.raises(SchedulerBusy) as refused:
+            scheduler.run("ken", lambda: None)
+    finally:
+        holder.finish()
+
+    # No service times yet: 1s a call, and only the holder is left ahead
+    assert (refused.value.reason, refused.value.retry_after) == ("queue timeout", 1)
+    stats = scheduler.stats()["voices"]["ken"]
+    assert (stats["timed_out"], stats["queue_depth"]) == (1, 0)
+
+
+def test_voices_queue_independently():
+    scheduler = SynthesisScheduler(workers_per_voice=1, max_queue=1, queue_timeout=0.05)
+    holder = Holder(scheduler, "ken").wait_started()
+    try:
+        with pytest.raises(SchedulerBusy, match="queue timeout"):
+            scheduler.run("ken", lambda: None)
+        assert scheduler.run("kelly", lambda: "kelly") == "kelly"
+    finally:
+        holder.finish()
+
+
+def test_nested_run_for_the_same_voice_uses_the_held_slot():
+    scheduler = SynthesisScheduler(workers_per_voice=1, max_queue=1, queue_timeout=0.05)
+    assert scheduler.run("ken", lambda: scheduler.run("ken", lambda: "inner")) == "inner"
+    assert scheduler.stats()["voices"]["ken"]["completed"] == 1
+
+
+def test_run_many_takes_only_free_slots():
+    scheduler = SynthesisScheduler(workers_per_voice=3, max_queue=1)
+    seen = []
+
+    def record(slots):
+        seen.append((slots, scheduler.stats()["voices"]["ken"]["active"]))
+
+    scheduler.run_many("ken", 2, record)
+    scheduler.run_many("ken", 5, record)
+    holder = Holder(scheduler).wait_started()
+    try:
+        scheduler.run_many("ken", 3, record)
+    finally:
+        holder.finish()
+    assert seen == [(2, 2), (3, 3), (2, 3)]
+    assert scheduler.stats()["voices"]["ken"]["active"] == 0
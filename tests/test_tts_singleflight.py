@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from tts_singleflight import SingleFlight
+
+
+def gated(flight, key, fn, callers):
+    """Start callers threads on flight.do(key, fn); returns (threads, outcomes) once all but the leader wait"""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(("result", flight.do(key, fn)))
+        except Exception as e:
+            outcomes.append(("error", e))
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.coalesced < callers - 1 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return threads, outcomes
+
+
+@pytest.fixture(params=["in-process", "lock files"])
+def flight(request, tmp_path):
+    return SingleFlight(tmp_path / "locks" if request.param == "lock files" else None)
+
+
+def test_followers_receive_the_leaders_result(flight):
+    release = threading.Event()
+    runs = []
+
+    def synthesize():
+        runs.append(1)
+        release.wait(5)
+        return b"audio"
+
+    threads, outcomes = gated(flight, "key", synthesize, 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert runs == [1]
+    assert outcomes == [("result", b"audio")] * 4
+    stats = flight.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 3, 0)
+
+
+def test_followers_receive_the_leaders_error(flight):
+    release = threading.Event()
+    error = RuntimeError("piper crashed")
+
+    def synthesize():
+        release.wait(5)
+        raise error
+
+    threads, outcomes = gated(flight, "key", synthesize, 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert outcomes == [("error", error)] * 3
+    # The failed flight is gone: the next caller leads a fresh one
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_distinct_keys_do_not_coalesce(flight):
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.do("a", lambda: 3) == 3
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_lock_files_are_removed_after_each_flight(tmp_path):
+    flight = SingleFlight(tmp_path / "locks")
+    assert flight.stats()["cross_process"] is True
+    assert flight.do("key", lambda: "done") == "done"
+    assert list((tmp_path / "locks").iterdir()) == []
+
+
+def test_instances_sharing_a_lock_dir_take_turns(tmp_path):
+    # Two SingleFlights on one lock directory stand in for two worker processes
+    first, second = SingleFlight(tmp_path / "locks"), SingleFlight(tmp_path / "locks")
+    inside = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def slow():
+        inside.set()
+        release.wait(5)
+        order.append("first")
+        return "rendered"
+
+    leader = threading.Thread(target=first.do, args=("key", slow))
+    leader.start()
+    assert inside.wait(5)
+    follower = threading.Thread(target=second.do, args=("key", lambda: order.append("second")))
+    follower.start()
+    time.sleep(0.05)
+    assert order == []
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert order == ["first", "second"]
+    assert second.stats()["cross_process_waits"] == 1
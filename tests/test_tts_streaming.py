@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from tts_engine import wav_bytes
+from tts_scheduler import SchedulerBusy
+from tts_streaming import split_sentences, sse_stream, started_synthesis, wav_stream
+
+TEXT = "The moon is bright. It circles the Earth! Does it spin?"
+
+
+def synthesizer(busy_after=None):
+    calls = []
+
+    def synthesize(sentence):
+        if busy_after is not None and len(calls) >= busy_after:
+            raise SchedulerBusy("ken", 4)
+        calls.append(sentence)
+        return wav_bytes(b"\0\0" * 100, 1000), [{"phoneme": "A", "start": 0.0, "end": 0.1}]
+
+    return synthesize, calls
+
+
+def events(stream):
+    return [(event.split("\n")[0][len("event: "):], json.loads(event.split("\n")[1][len("data: "):]))
+            for event in stream if event.strip()]
+
+
+def test_split_sentences_keeps_punctuation_and_closing_quotes():
+    assert split_sentences(TEXT) == ["The moon is bright.", "It circles the Earth!", "Does it spin?"]
+    assert split_sentences('He said "Hi." Then left') == ['He said "Hi."', "Then left"]
+    assert split_sentences("   ") == []
+
+
+def test_started_synthesis_runs_the_first_sentence_up_front():
+    synthesize, calls = synthesizer()
+    started = started_synthesis(TEXT, synthesize)
+    assert calls == ["The moon is bright."]
+
+    chunks = list(wav_stream(TEXT, started))
+    assert calls == split_sentences(TEXT)
+    assert len(chunks) == 4
+    assert b"".join(chunks[1:]) == b"\0\0" * 300
+
+
+def test_started_synthesis_raises_when_refused_before_responding():
+    synthesize, _ = synthesizer(busy_after=0)
+    with pytest.raises(SchedulerBusy):
+        started_synthesis(TEXT, synthesize)
+
+
+def test_sse_stream_refused_mid_stream_carries_retry_after():
+    synthesize, _ = synthesizer(busy_after=2)
+    found = events(sse_stream(TEXT, started_synthesis(TEXT, synthesize)))
+    assert [event for event, _ in found] == ["start", "chunk", "chunk", "error"]
+    assert found[-1][1]["retry_after"] == 4
+    assert found[-1][1]["reason"] == "queue full"
+    assert [data["start"] for event, data in found if event == "chunk"] == [0.0, 0.1]
@@ -0,0 +1,210 @@
+"""
+Viseme Alignment for the iLearnHow TTS servers
+Turns the phonemes Piper speaks (or, failing that, the spelling) into a timed
+viseme track bounded by where the synthesized audio is actually voiced
+"""
+
+import io
+import os
+import wave
+
+import numpy as np
+
+from tts_profiling import stage
+
+# The 13 mouth shapes the avatars are built with (tools/build_avatar_manifest.py)
+VISEMES = ['REST', 'A', 'E', 'I', 'O', 'MBP', 'FV', 'TH', 'DNTL', 'KG', 'S', 'WQ', 'R']
+
+# espeak-ng IPA symbols as emitted by Piper's phonemizer
+IPA_VISEMES = {
+    **dict.fromkeys("aæɐɑʌ", "A"),
+    **dict.fromkeys("əɚɛɜeᵻh", "E"),
+    **dict.fromkeys("iɪjy", "I"),
+    **dict.fromkeys("oɔɒuʊɵ", "O"),
+    **dict.fromkeys("mbp", "MBP"),
+    **dict.fromkeys("fv", "FV"),
+    **dict.fromkeys("θð", "TH"),
+    **dict.fromkeys("tdnlɾɬ", "DNTL"),
+    **dict.fromkeys("kgɡŋxçɣ", "KG"),
+    **dict.fromkeys("szʃʒ", "S"),
+    **dict.fromkeys("wʍ", "WQ"),
+    **dict.fromkeys("ɹr", "R"),
+    "ʔ": "REST"
+}
+
+# Spelling fallback for audio that did not come from an in-process Piper voice
+GRAPHEME_VISEMES = {
+    **dict.fromkeys("a", "A"),
+    **dict.fromkeys("e", "E"),
+    **dict.fromkeys("iy", "I"),
+    **dict.fromkeys("ou", "O"),
+    **dict.fromkeys("bmp", "MBP"),
+    **dict.fromkeys("fv", "FV"),
+    **dict.fromkeys("tdnl", "DNTL"),
+    **dict.fromkeys("kgcqx", "KG"),
+    **dict.fromkeys("szj", "S"),
+    **dict.fromkeys("w", "WQ"),
+    **dict.fromkeys("r", "R")
+}
+GRAPHEME_DIGRAPHS = {"th": "TH", "sh": "S", "ch": "S", "ph": "FV", "ng": "KG", "oo": "O", "ee": "I"}
+
+# Relative speaking time per viseme class; vowels carry the syllable
+VISEME_WEIGHTS = {
+    'A': 1.0, 'E': 0.9, 'I': 0.9, 'O': 1.0,
+    'MBP': 0.55, 'DNTL': 0.55, 'KG': 0.55,
+    'FV': 0.75, 'TH': 0.75, 'S': 0.8,
+    'WQ': 0.6, 'R': 0.6, 'REST': 0.5
+}
+PAUSE_WEIGHTS = {",": 2.0, ";": 2.0, ":": 2.0, "—": 2.0, ".": 1.0, "!": 1.0, "?": 1.0}
+LENGTH_MARK = "ː"
+STRESS_MARKS = "ˈˌ"
+
+SILENCE_DB = -40.0
+FRAME_MS = 10
+
+# Mouth-openness envelope rate; matches CONFIG['frame_rate'] in scripts/extract-frames-ffmpeg.py
+ENVELOPE_FPS = int(os.environ.get("TTS_ENVELOPE_FPS", "30"))
+
+
+def voiced_bounds(pcm, sample_rate):
+    """(start, end) in seconds of the span whose energy is above the silence floor"""
+    samples = np.frombuffer(pcm, dtype="<i2")
+    duration = len(samples) / float(sample_rate)
+    frame = max(1, sample_rate * FRAME_MS // 1000)
+    frames = len(samples) // frame
+    if frames == 0:
+        return 0.0, duration
+
+    windows = samples[:frames * frame].reshape(frames, frame).astype(np.float32)
+    rms = np.sqrt(np.mean(windows * windows, axis=1))
+    peak = rms.max()
+    if peak == 0:
+        return 0.0, duration
+
+    voiced = np.flatnonzero(rms > peak * 10 ** (SILENCE_DB / 20))
+    return float(voiced[0] * frame) / sample_rate, min(duration, float((voiced[-1] + 1) * frame) / sample_rate)
+
+
+def ipa_units(phonemes):
+    """[(viseme, weight)] for a sentence of Piper phonemes"""
+    units = []
+    for symbol in phonemes:
+        if symbol in STRESS_MARKS or symbol == " ":
+            continue
+        if symbol == LENGTH_MARK and units:
+            viseme, weight = units[-1]
+            units[-1] = (viseme, weight * 1.6)
+        elif symbol in PAUSE_WEIGHTS:
+            units.append(("REST", PAUSE_WEIGHTS[symbol]))
+        elif symbol in IPA_VISEMES:
+            viseme = IPA_VISEMES[symbol]
+            units.append((viseme, VISEME_WEIGHTS[viseme]))
+    return units
+
+
+def grapheme_units(text):
+    """[(viseme, weight)] approximated from spelling"""
+    units = []
+    lowered = text.lower()
+    i = 0
+    while i < len(lowered):
+        pair = lowered[i:i + 2]
+        if pair in GRAPHEME_DIGRAPHS:
+            viseme = GRAPHEME_DIGRAPHS[pair]
+            units.append((viseme, VISEME_WEIGHTS[viseme]))
+            i += 2
+            continue
+        char = lowered[i]
+        if char in PAUSE_WEIGHTS:
+            units.append(("REST", PAUSE_WEIGHTS[char]))
+        elif char in GRAPHEME_VISEMES:
+            viseme = GRAPHEME_VISEMES[char]
+            units.append((viseme, VISEME_WEIGHTS[viseme]))
+        i += 1
+    return units
+
+
+def place_units(units, start, end, offset=0.0):
+    """Spread weighted units over [start, end], merging repeats into one viseme span"""
+    timeline = []
+    total = sum(weight for _, weight in units)
+    if total <= 0 or end <= start:
+        return timeline
+
+    scale = (end - start) / total
+    cursor = start
+    for viseme, weight in units:
+        span_end = cursor + weight * scale
+        if timeline and timeline[-1]["phoneme"] == viseme:
+            timeline[-1]["end"] = round(offset + span_end, 3)
+        else:
+            timeline.append({
+                "phoneme": viseme,
+                "start": round(offset + cursor, 3),
+                "end": round(offset + span_end, 3)
+            })
+        cursor = span_end
+    return timeline
+
+
+def framed(timeline, start, end, duration, offset=0.0):
+    """Close the mouth over leading and trailing silence"""
+    if start > 0:
+        timeline.insert(0, {"phoneme": "REST", "start": round(offset, 3), "end": round(offset + start, 3)})
+    if end < duration:
+        timeline.append({"phoneme": "REST", "start": round(offset + end, 3), "end": round(offset + duration, 3)})
+    return timeline
+
+
+def align_phonemes(phonemes, pcm, sample_rate, offset=0.0):
+    """Viseme timeline for one synthesized sentence from the phonemes Piper spoke"""
+    duration = len(pcm) / (2.0 * sample_rate)
+    start, end = voiced_bounds(pcm, sample_rate)
+    return framed(place_units(ipa_units(phonemes), start, end, offset), start, end, duration, offset)
+
+
+def align_text(text, pcm=None, sample_rate=None, duration=None):
+    """Viseme timeline from spelling, bounded by the voiced span of pcm when given"""
+    with stage("phonemes"):
+        if pcm is not None:
+            duration = len(pcm) / (2.0 * sample_rate)
+            start, end = voiced_bounds(pcm, sample_rate)
+        else:
+            start, end = 0.0, duration
+        return framed(place_units(grapheme_units(text), start, end), start, end, duration)
+
+
+def mouth_envelope(pcm, sample_rate, fps=ENVELOPE_FPS, channels=1):
+    """Jaw openness per video frame, 0.0 (closed) to 1.0 (loudest frame), from windowed RMS of int16 PCM"""
+    samples = np.frombuffer(pcm, dtype="<i2")
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    frames = int(np.ceil(len(samples) * fps / float(sample_rate)))
+    if frames == 0:
+        return []
+
+    # Frame boundaries fall on fractional samples at most rates (16000 / 30), so sum squares between rounded edges
+    edges = np.minimum(np.round(np.arange(frames) * sample_rate / float(fps)).astype(np.int64), len(samples) - 1)
+    energy = np.add.reduceat(np.square(samples, dtype=np.float64), edges)
+    counts = np.diff(np.append(edges, len(samples)))
+    rms = np.sqrt(energy / np.maximum(counts, 1))
+
+    peak = rms.max()
+    if peak == 0:
+        return [0.0] * frames
+    # Loudness is perceived in dB: map [SILENCE_DB, 0] relative to the peak onto [0, 1]
+    level = 20 * np.log10(np.maximum(rms / peak, 1e-6))
+    openness = np.clip(1.0 - level / SILENCE_DB, 0.0, 1.0)
+    return np.round(openness, 2).tolist()
+
+
+def wav_envelope(audio_data, fps=ENVELOPE_FPS):
+    """{"fps", "values"} mouth-openness track for an in-memory 16-bit WAV file"""
+    with stage("envelope"), wave.open(io.BytesIO(audio_data), "rb") as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise ValueError("Mouth envelope needs 16-bit PCM audio")
+        values = mouth_envelope(
+            wav_file.readframes(wav_file.getnframes()), wav_file.getframerate(),
+            fps=fps, channels=wav_file.getnchannels()
+        )
+    return {"fps": fps, "values": values}
@@ -0,0 +1,104 @@
+"""
+Batch synthesis for the iLearnHow TTS servers
+Turns a whole tts_jobs lesson (or a list of items) into audio on a shared worker pool
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+
+from tts_scheduler import SchedulerBusy
+from tts_streaming import sse_event
+
+TTS_BATCH_WORKERS = int(os.environ.get("TTS_BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_TTS_BATCH_ITEMS = int(os.environ.get("MAX_TTS_BATCH_ITEMS", "50"))
+
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=TTS_BATCH_WORKERS, thread_name_prefix="tts-batch")
+
+
+def batch_items(data, default_speaker="kelly"):
+    """Normalize a tts_jobs document or a list of {id, text, speaker, voice} into (document, items)"""
+    if isinstance(data, list):
+        document, entries = {}, data
+    elif isinstance(data, dict) and isinstance(data.get("phases"), list):
+        document, entries = data, data["phases"]
+    elif isinstance(data, dict) and isinstance(data.get("items"), list):
+        document, entries = data, data["items"]
+    else:
+        raise ValueError("Expected a tts_jobs document or a list of {id, text, speaker} items")
+
+    speaker = str(document.get("defaultSpeaker") or document.get("speaker") or default_speaker)
+    voice = document.get("voice")
+    items = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Item {index} must be an object with 'text'")
+        item_voice = entry.get("voice", voice)
+        items.append({
+            "index": index,
+            "id": str(entry.get("id", index)),
+            "text": entry.get("text"),
+            "speaker": str(entry.get("speaker", speaker)).lower(),
+            # Optional specific model by file name, as for /api/tts; None serves the speaker's own
+            "voice": str(item_voice) if item_voice is not None else None
+        })
+    return document, items
+
+
+def run_batch(items, synthesize_item):
+    """Synthesize items concurrently, yielding each result as soon as it completes
+
+    An item failing is reported in its result, but SchedulerBusy is raised: the voice is saturated, so
+    the items not yet started are cancelled and the caller answers 503 + Retry-After for the batch.
+    """
+    futures = {BATCH_EXECUTOR.submit(synthesize_item, item): item for item in items}
+    try:
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except SchedulerBusy:
+                raise
+            except Exception as e:
+                print(f"❌ TTS batch item {item['id']} failed: {e}")
+                result = {"error": str(e)}
+            yield dict({"index": item["index"], "id": item["id"], "speaker": item["speaker"]}, **result)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def started_batch(items, synthesize_item):
+    """run_batch with its first result already in, so a batch the scheduler refuses outright raises here"""
+    results = run_batch(items, synthesize_item)
+    first = next(results)
+    return chain([first], results)
+
+
+def batch_events(document, results, engine):
+    """Server-Sent Events: one 'item' event per result as it finishes, then the manifest without audio
+
+    A SchedulerBusy once the stream is under way ends it with an 'error' event carrying retry_after.
+    """
+    done = []
+    try:
+        for result in results:
+            done.append({k: v for k, v in result.items() if k != "audio"})
+            yield sse_event("item", result)
+    except SchedulerBusy as e:
+        yield sse_event("error", {"error": str(e), "reason": e.reason, "retry_after": e.retry_after})
+        return
+    yield sse_event("end", batch_manifest(document, done, engine))
+
+
+def batch_manifest(document, results, engine):
+    """Lesson-level manifest with per-item results in their original order"""
+    results = sorted(results, key=lambda result: result["index"])
+    return {
+        "slug": document.get("slug"),
+        "language": document.get("language"),
+        "engine": engine,
+        "items": results,
+        "duration": sum(result.get("duration", 0.0) for result in results),
+        "failed": sum(1 for result in results if "error" in result)
+    }
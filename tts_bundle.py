@@ -0,0 +1,166 @@
+"""
+Lesson Playback Bundles for the iLearnHow TTS servers
+One binary file per phase: a fixed header, the viseme track as packed integers, the text, then the audio
+
+Layout (little-endian, every section starting on a 4-byte boundary):
+
+    header    BUNDLE_HEADER, BUNDLE_HEADER.size bytes
+    visemes   viseme_count records of (viseme id, start_ms, end_ms) as uint32 - a Uint32Array in the player
+    text      UTF-8
+    audio     16-bit mono PCM, or the Ogg Opus / MP3 file
+
+The header gives each section's offset and length, so a player can fetch the header and visemes with
+one small Range request and the audio in further ranges. PCM seeks are exact: the sample for t ms sits at
+audio_offset + 2 * (t * sample_rate // 1000).
+"""
+
+import re
+import struct
+
+from tts_alignment import VISEMES
+from tts_engine import wav_format
+
+BUNDLE_MIMETYPE = "application/vnd.ilearnhow.tts-bundle"
+BUNDLE_MAGIC = b"ILHB"
+BUNDLE_VERSION = 1
+
+# magic, version, header size, codec, channels, reserved, sample rate, duration ms,
+# viseme offset, viseme count, text offset, text length, audio offset, audio length
+BUNDLE_HEADER = struct.Struct("<4sHHBBHIIIIIIII")
+VISEME_RECORD = struct.Struct("<III")
+
+# Codec byte per TTS format name; "wav" requests carry bare PCM, the WAV header moving into ours
+BUNDLE_CODECS = {"wav": 0, "ogg": 1, "mp3": 2}
+CODEC_NAMES = {0: "pcm_s16le", 1: "opus", 2: "mp3"}
+
+VISEME_IDS = {name: index for index, name in enumerate(VISEMES)}
+BUNDLE_KEY = re.compile(r"[0-9a-f]{64}")
+
+
+class BundleError(ValueError):
+    """Bytes that are not a bundle this version can read"""
+
+
+def _padding(length):
+    return b"\0" * (-length % 4)
+
+
+def pack_visemes(timeline):
+    """Viseme timeline dicts ({"phoneme", "start", "end"} in seconds) as packed uint32 records"""
+    records = bytearray(VISEME_RECORD.size * len(timeline))
+    for index, entry in enumerate(timeline):
+        VISEME_RECORD.pack_into(
+            records, index * VISEME_RECORD.size,
+            VISEME_IDS.get(entry["phoneme"], 0),
+            int(round(entry["start"] * 1000)),
+            int(round(entry["end"] * 1000))
+        )
+    return bytes(records)
+
+
+def unpack_visemes(data, count=None):
+    """Packed viseme records back to the timeline dicts the JSON API returns"""
+    data = memoryview(data)
+    if count is not None:
+        data = data[:count * VISEME_RECORD.size]
+    return [
+        {"phoneme": VISEMES[viseme] if viseme < len(VISEMES) else "REST", "start": start / 1000.0, "end": end / 1000.0}
+        for viseme, start, end in VISEME_RECORD.iter_unpack(data)
+    ]
+
+
+def build_bundle(audio, audio_format, timeline, text, duration, sample_rate, channels=1):
+    """Bundle bytes for one clip; audio is PCM for "wav" and the encoded file otherwise"""
+    if audio_format not in BUNDLE_CODECS:
+        raise BundleError(f"Bundles cannot carry {audio_format} audio")
+    visemes = pack_visemes(timeline)
+    text_data = text.encode("utf-8")
+
+    viseme_offset = BUNDLE_HEADER.size
+    text_offset = viseme_offset + len(visemes)
+    audio_offset = text_offset + len(text_data) + len(_padding(len(text_data)))
+    header = BUNDLE_HEADER.pack(
+        BUNDLE_MAGIC, BUNDLE_VERSION, BUNDLE_HEADER.size, BUNDLE_CODECS[audio_format], channels, 0,
+        sample_rate, int(round(duration * 1000)),
+        viseme_offset, len(timeline), text_offset, len(text_data), audio_offset, len(audio)
+    )
+    return b"".join((header, visemes, text_data, _padding(len(text_data)), audio))
+
+
+def wav_bundle(audio_data, payload, audio_format, timeline, text, duration):
+    """Bundle for a synthesized WAV clip and its encoding in audio_format (the WAV itself for "wav")"""
+    sample_rate, channels, _, offset, length = wav_format(audio_data)
+    if audio_format == "wav":
+        payload = memoryview(audio_data)[offset:offset + length]
+    return build_bundle(payload, audio_format, timeline, text, duration, sample_rate, channels)
+
+
+def read_header(data):
+    """Header fields as a dict; data may be just the first BUNDLE_HEADER.size bytes (e.g. a Range response)"""
+    if len(data) < BUNDLE_HEADER.size:
+        raise BundleError("Bundle shorter than its header")
+    (magic, version, header_size, codec, channels, _, sample_rate, duration_ms,
+     viseme_offset, viseme_count, text_offset, text_length, audio_offset, audio_length) = BUNDLE_HEADER.unpack_from(data)
+    if magic != BUNDLE_MAGIC:
+        raise BundleError("Not a TTS bundle")
+    if version != BUNDLE_VERSION:
+        raise BundleError(f"Unsupported bundle version {version}")
+    return {
+        "version": version,
+        "header_size": header_size,
+        "codec": CODEC_NAMES.get(codec, "unknown"),
+        "channels": channels,
+        "sample_rate": sample_rate,
+        "duration_ms": duration_ms,
+        "viseme_offset": viseme_offset,
+        "viseme_count": viseme_count,
+        "text_offset": text_offset,
+        "text_length": text_length,
+        "audio_offset": audio_offset,
+        "audio_length": audio_length
+    }
+
+
+def read_bundle(data):
+    """Header, timeline, text and a zero-copy view of the audio of a complete bundle"""
+    header = read_header(data)
+    data = memoryview(data)
+    if len(data) < header["audio_offset"] + header["audio_length"]:
+        raise BundleError("Bundle truncated")
+    viseme_end = header["viseme_offset"] + header["viseme_count"] * VISEME_RECORD.size
+    text_end = header["text_offset"] + header["text_length"]
+    return {
+        **header,
+        "visemes": unpack_visemes(data[header["viseme_offset"]:viseme_end]),
+        "text": bytes(data[header["text_offset"]:text_end]).decode("utf-8"),
+        "audio": data[header["audio_offset"]:header["audio_offset"] + header["audio_length"]]
+    }
+
+
+def bundle_url(key):
+    """Path the TTS servers serve a cached or pre-rendered bundle from"""
+    return f"/api/tts/bundle/{key}"
+
+
+def byte_range(header, length):
+    """(start, end) inclusive for a single-range "bytes=" Range header, None to send everything
+
+    Raises BundleError when the range lies outside the bundle (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        # bytes=-N: the last N bytes
+        if not end:
+            raise BundleError("Range not satisfiable")
+        return max(0, length - end), length - 1
+    end = length - 1 if end is None else min(end, length - 1)
+    if start >= length or end < start:
+        raise BundleError("Range not satisfiable")
+    return start, end
@@ -0,0 +1,320 @@
+"""
+Content-Addressed Audio Cache for the iLearnHow TTS servers
+Bounded in-memory LRU tier backed by a content-addressed on-disk tier
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+from tts_alignment import align_text
+from tts_bundle import wav_bundle
+from tts_engine import resolve_model, wav_bytes, wav_pcm_view
+from tts_parallel import parallel_synthesis
+from tts_profiling import stage
+from tts_singleflight import SingleFlight
+
+TTS_CACHE_MEMORY_MB = int(os.environ.get("TTS_CACHE_MEMORY_MB", "64"))
+TTS_CACHE_DISK_MB = int(os.environ.get("TTS_CACHE_DISK_MB", "1024"))
+TTS_CACHE_DIR = os.environ.get(
+    "TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ilearnhow-tts-cache")
+)
+# Read-only store written by scripts/prerender-audio.py; never evicted by the server
+TTS_PRERENDER_DIR = os.environ.get(
+    "TTS_PRERENDER_DIR", str(Path(__file__).parent / "prerendered_audio")
+)
+
+# How long a model's digest is trusted before its files are stat'ed again
+TTS_DIGEST_TTL_SECONDS = float(os.environ.get("TTS_DIGEST_TTL_SECONDS", "5"))
+
+_digest_cache = {}
+_digest_recent = {}
+_digest_lock = threading.Lock()
+
+
+def normalize_text(text):
+    """Canonical form of the text so cosmetic whitespace differences share an entry"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def model_digest(model, config=None):
+    """SHA-256 of the model (and config) file, memoized on path, size and mtime
+
+    Every cache_key call lands here, so the resolved digest is reused for TTS_DIGEST_TTL_SECONDS
+    before the files are resolved and stat'ed again to notice a replaced model.
+    """
+    now = time.monotonic()
+    recent = _digest_recent.get((model, config))
+    if recent is not None and recent[0] > now:
+        return recent[1]
+
+    model_path, config_path = resolve_model(model, config)
+    if not model_path:
+        # Generic voice resolved by the piper CLI - the name is all we know
+        digest = hashlib.sha256(model.encode("utf-8")).hexdigest()
+        _digest_recent[(model, config)] = (now + TTS_DIGEST_TTL_SECONDS, digest)
+        return digest
+
+    files = [p for p in (model_path, config_path) if p]
+    fingerprint = tuple((p, stat.st_size, stat.st_mtime_ns) for p, stat in ((p, os.stat(p)) for p in files))
+    digest = _digest_cache.get(fingerprint)
+    if digest is None:
+        sha = hashlib.sha256()
+        for path in files:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+        digest = sha.hexdigest()
+        with _digest_lock:
+            _digest_cache[fingerprint] = digest
+    _digest_recent[(model, config)] = (now + TTS_DIGEST_TTL_SECONDS, digest)
+    return digest
+
+
+def cache_key(speaker, text, model, config=None, audio_format="wav"):
+    """Content address for one synthesized utterance"""
+    parts = [speaker, normalize_text(text), model_digest(model, config), audio_format]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class AudioStore:
+    """Content-addressed directory of audio blobs laid out as <root>/<key[:2]>/<key>.bin"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, key):
+        return self.root / key[:2] / f"{key}.bin"
+
+    def exists(self, key):
+        return self.path(key).is_file()
+
+    def read(self, key):
+        """Blob bytes in one read, or None when absent"""
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, data):
+        """Atomically store a blob; returns False when it was already present"""
+        path = self.path(key)
+        if path.exists():
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def blobs(self):
+        return self.root.glob("*/*.bin")
+
+
+class AudioCache:
+    """Two-tier audio cache: LRU in memory, spilled to a content-addressed directory"""
+
+    def __init__(self, memory_bytes=TTS_CACHE_MEMORY_MB << 20,
+                 disk_dir=TTS_CACHE_DIR, disk_bytes=TTS_CACHE_DISK_MB << 20,
+                 prerender_dir=TTS_PRERENDER_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.disk = AudioStore(disk_dir) if disk_dir else None
+        self.prerendered = AudioStore(prerender_dir) if prerender_dir else None
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        # Identical misses share one synthesis; the lock files let sibling processes on the disk tier join in
+        self.flight = SingleFlight(Path(disk_dir) / ".locks" if disk_dir else None)
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.hits_prerendered = 0
+        self.misses = 0
+
+        if self.disk:
+            self.disk.root.mkdir(parents=True, exist_ok=True)
+            self._disk_size = sum(p.stat().st_size for p in self.disk.blobs())
+
+    def get(self, key, record=True):
+        with stage("cache"):
+            with self._lock:
+                data = self._memory.get(key)
+                if data is not None:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += record
+                    return data
+
+            tier = "prerendered"
+            data = self.prerendered.read(key) if self.prerendered else None
+            if data is None:
+                tier = "disk"
+                data = self._read_disk(key)
+            with self._lock:
+                if data is None:
+                    self.misses += record
+                    return None
+                if tier == "prerendered":
+                    self.hits_prerendered += record
+                else:
+                    self.hits_disk += record
+                self._remember(key, data)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+        self._write_disk(key, data)
+
+    def get_or_create(self, key, create):
+        """Return cached bytes for key, calling create() to fill a miss"""
+        data = self.get(key)
+        if data is None:
+            data = create()
+            self.put(key, data)
+        return data
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _read_disk(self, key):
+        if not self.disk:
+            return None
+        data = self.disk.read(key)
+        if data is not None:
+            # Touch so disk eviction approximates LRU
+            os.utime(self.disk.path(key))
+        return data
+
+    def _write_disk(self, key, data):
+        if not self.disk or len(data) > self.disk_bytes:
+            return
+        if self.prerendered and self.prerendered.exists(key):
+            return
+        if not self.disk.write(key, data):
+            return
+        with self._lock:
+            self._disk_size += len(data)
+            over = self._disk_size > self.disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for path in self.disk.blobs():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(key=lambda entry: entry[0])
+
+        for _, size, path in entries:
+            with self._lock:
+                if self._disk_size <= self.disk_bytes * 0.9:
+                    return
+                self._disk_size -= size
+            path.unlink(missing_ok=True)
+
+    def stats(self):
+        hits = self.hits_memory + self.hits_disk + self.hits_prerendered
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "hits_prerendered": self.hits_prerendered,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size,
+            "disk_dir": str(self.disk.root) if self.disk else None,
+            "prerender_dir": str(self.prerendered.root) if self.prerendered else None,
+            "single_flight": self.flight.stats()
+        }
+
+
+def cached_synthesis(cache, engines, speaker, text, model, config=None):
+    """(WAV bytes, viseme timeline) for text; a miss synthesizes both in a single, coalesced pass"""
+    audio_key = cache_key(speaker, text, model, config, audio_format="wav")
+    timeline_key = cache_key(speaker, text, model, config, audio_format="visemes")
+
+    # The audio lookup records the request's one hit or miss; the timeline rides along with it
+    audio_data = cache.get(audio_key)
+    if audio_data is not None:
+        timeline_data = cache.get(timeline_key, record=False)
+        if timeline_data is not None:
+            return audio_data, json.loads(timeline_data)
+
+        # Audio baked without a timeline - align from spelling over the cached PCM
+        with stage("wav"):
+            pcm, sample_rate = wav_pcm_view(audio_data)
+        timeline = align_text(text, pcm, sample_rate)
+        cache.put(timeline_key, json.dumps(timeline).encode("utf-8"))
+        return audio_data, timeline
+
+    def synthesize():
+        # Another process may have rendered it while this one waited for the lock
+        audio_data = cache.get(audio_key, record=False)
+        timeline_data = cache.get(timeline_key, record=False)
+        if audio_data is not None and timeline_data is not None:
+            return audio_data, json.loads(timeline_data)
+
+        pcm, sample_rate, timeline = parallel_synthesis(engines, model, text, config)
+        audio_data = wav_bytes(pcm, sample_rate)
+        cache.put(audio_key, audio_data)
+        cache.put(timeline_key, json.dumps(timeline).encode("utf-8"))
+        return audio_data, timeline
+
+    return cache.flight.do(audio_key, synthesize)
+
+
+def cached_encoding(cache, encoders, speaker, text, model, audio_data, audio_format, config=None):
+    """WAV audio_data for text re-encoded as audio_format, kept in the cache next to the WAV"""
+    if audio_format == "wav":
+        return audio_data
+
+    key = cache_key(speaker, text, model, config, audio_format=audio_format)
+    # Hit and miss counts are per synthesis request, which cached_synthesis already recorded
+    encoded = cache.get(key, record=False)
+    if encoded is not None:
+        return encoded
+
+    def encode():
+        encoded = cache.get(key, record=False)
+        if encoded is None:
+            encoded = encoders.encode(audio_data, audio_format)
+            cache.put(key, encoded)
+        return encoded
+
+    return cache.flight.do(key, encode)
+
+
+def cached_bundle(cache, speaker, text, model, audio_data, payload, audio_format, timeline, duration, config=None):
+    """(content key, playback bundle) for a synthesized clip, kept in the cache for ranged GETs by key"""
+    key = cache_key(speaker, text, model, config, audio_format=f"bundle.{audio_format}")
+    bundle = cache.get(key, record=False)
+    if bundle is None:
+        with stage("serialize"):
+            bundle = wav_bundle(audio_data, payload, audio_format, timeline, text, duration)
+        cache.put(key, bundle)
+    return key, bundle
@@ -0,0 +1,201 @@
+"""
+Custom Voice configuration for the iLearnHow TTS servers
+Origins, limits, the Ken & Kelly voice models and request validation shared by the Flask and async custom-voice servers
+"""
+
+import os
+import re
+from pathlib import Path
+
+from tts_encoding import requested_format
+
+# Configurable CORS and limits
+# Supports literal origins and regex origins via prefix "regex:"
+ALLOWED_ORIGINS_RAW = os.environ.get(
+    "ALLOWED_ORIGINS",
+    ",".join([
+        # Production domains
+        "https://ilearnhow.com",
+        "https://www.ilearnhow.com",
+        # Cloudflare Pages custom and preview domains
+        "https://ilearnhow.pages.dev",
+        r"regex:^https://[A-Za-z0-9-]+\.ilearnhow\.pages\.dev$",
+        r"regex:^https://[A-Za-z0-9-]+\.pages\.dev$",
+        # Local development
+        "http://localhost:3000",
+        "http://127.0.0.1:3000",
+        "http://localhost:5501",
+        "http://127.0.0.1:5501",
+        "http://localhost:8000",
+        "http://127.0.0.1:8000"
+    ])
+).split(",")
+MAX_TTS_TEXT_CHARS = int(os.environ.get("MAX_TTS_TEXT_CHARS", "2000"))
+
+# 🎯 CUSTOM VOICE MODELS - Your actual trained Ken & Kelly voices!
+VOICE_MODELS = {
+    "kelly": {
+        "model_path": "dist/configs/kelly_model.onnx",
+        "config_path": "dist/configs/kelly_config.json",
+        "fallback": "en_US-amy-medium"  # Fallback if custom model fails
+    },
+    "ken": {
+        "model_path": "dist/configs/ken_model.onnx",
+        "config_path": "dist/configs/ken_config.json",
+        "fallback": "en_US-ryan-medium"  # Fallback if custom model fails
+    }
+}
+
+BASE_DIR = Path(__file__).parent
+# Trained models dropped next to the server or into dist/configs are picked up without a restart
+VOICE_DIRS = [BASE_DIR, BASE_DIR / "dist" / "configs"]
+
+
+def parse_origins(raw=ALLOWED_ORIGINS_RAW):
+    """(literal origins, compiled regex origins) from ALLOWED_ORIGINS; invalid patterns are ignored"""
+    literal, patterns = [], []
+    for origin in raw:
+        o = origin.strip()
+        if not o:
+            continue
+        if o.startswith("regex:"):
+            try:
+                patterns.append(re.compile(o[len("regex:"):]))
+            except re.error:
+                # Fallback: ignore invalid regex
+                pass
+        else:
+            literal.append(o)
+    return literal, patterns
+
+
+def get_voice_paths(registry):
+    """Model and config each speaker is served with, from the voice registry's cached file metadata"""
+    voice_paths = {}
+
+    for speaker, voice_info in VOICE_MODELS.items():
+        voice = registry.preferred(speaker, BASE_DIR / voice_info["model_path"])
+
+        voice_paths[speaker] = {
+            "model_path": voice["model_path"] if voice else str(BASE_DIR / voice_info["model_path"]),
+            "config_path": voice["config_path"] if voice else str(BASE_DIR / voice_info["config_path"]),
+            "fallback": voice_info["fallback"],
+            "custom_available": voice is not None,
+            "discovered": [v["name"] for v in registry.voices() if v["speaker"] == speaker]
+        }
+
+    return voice_paths
+
+
+def preferred_voices(registry):
+    """(model, config) pairs each speaker will be served with"""
+    return [
+        (info["model_path"], info["config_path"]) if info["custom_available"] else (info["fallback"], None)
+        for info in get_voice_paths(registry).values()
+    ]
+
+
+def select_voice(registry, speaker, voice=None):
+    """(model, config, voice type) for a speaker: the requested or trained model when present, else the generic fallback"""
+    if voice is not None:
+        registered = registry.get(voice)
+        if registered and registered["usable"]:
+            return registered["model_path"], registered["config_path"], "custom_trained"
+    voice_info = get_voice_paths(registry)[speaker]
+    if voice_info["custom_available"]:
+        return voice_info["model_path"], voice_info["config_path"], "custom_trained"
+    return voice_info["fallback"], None, "fallback_generic"
+
+
+def unsupported_voice(registry, voice, error="Unsupported voice"):
+    """(error body, status) when voice names no usable registered model, else None"""
+    registered = registry.get(str(voice))
+    if registered is None or not registered["usable"]:
+        return {
+            "error": error,
+            "allowed": [v["name"] for v in registry.voices() if v["usable"]]
+        }, 422
+    return None
+
+
+def validate_tts_request(content_type, data, registry, formats, stream=None):
+    """Validate a TTS request body, returning (fields, None) or (None, (error body, status))
+
+    data is the parsed JSON body (None when it wasn't JSON) and stream the ?stream= query value;
+    each server wraps an error body in its own response type.
+    """
+    # Content-Type validation
+    if 'application/json' not in (content_type or ''):
+        return None, ({
+            "error": "Unsupported Media Type: Content-Type must be application/json"
+        }, 415)
+
+    # JSON body parsing
+    if not isinstance(data, dict):
+        return None, ({"error": "Invalid JSON body"}, 400)
+
+    # Required fields and constraints
+    text = data.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return None, ({
+            "error": "Field 'text' is required and must be a non-empty string"
+        }, 422)
+    if len(text) > MAX_TTS_TEXT_CHARS:
+        return None, ({
+            "error": f"Text exceeds maximum allowed length of {MAX_TTS_TEXT_CHARS} characters"
+        }, 413)
+
+    speaker = str(data.get('speaker', 'kelly')).lower()
+    if speaker not in VOICE_MODELS:
+        return None, ({
+            "error": "Unsupported speaker",
+            "allowed": list(VOICE_MODELS.keys())
+        }, 422)
+
+    # Optional specific model, e.g. a tone- or language-specific voice, by file name
+    voice = data.get('voice')
+    if voice is not None:
+        error = unsupported_voice(registry, voice)
+        if error:
+            return None, error
+
+    audio_format = requested_format(data.get('format'))
+    if audio_format not in formats:
+        return None, ({
+            "error": "Unsupported format",
+            "allowed": formats,
+        }, 415)
+
+    return {
+        "text": text,
+        "speaker": speaker,
+        "voice": voice,
+        "format": audio_format,
+        "include_phonemes": bool(data.get('include_phonemes', False)),
+        "include_envelope": bool(data.get('include_envelope', False)),
+        "stream": str(data.get('stream', stream or 'false')).lower() in ('1', 'true', 'yes')
+    }, None
+
+
+def invalid_batch_item(items, registry):
+    """(error body, status) for the first batch item that can't be synthesized, else None"""
+    for item in items:
+        text = item["text"]
+        if not isinstance(text, str) or not text.strip():
+            return {
+                "error": f"Item '{item['id']}': field 'text' is required and must be a non-empty string"
+            }, 422
+        if len(text) > MAX_TTS_TEXT_CHARS:
+            return {
+                "error": f"Item '{item['id']}': text exceeds maximum allowed length of {MAX_TTS_TEXT_CHARS} characters"
+            }, 413
+        if item["speaker"] not in VOICE_MODELS:
+            return {
+                "error": f"Item '{item['id']}': unsupported speaker",
+                "allowed": list(VOICE_MODELS.keys())
+            }, 422
+        if item["voice"] is not None:
+            error = unsupported_voice(registry, item["voice"], f"Item '{item['id']}': unsupported voice")
+            if error:
+                return error
+    return None
@@ -0,0 +1,171 @@
+"""
+Compressed Audio Encoding for the iLearnHow TTS servers
+Opus-in-OGG and MP3 through a bounded pool of ffmpeg encoders, whole clips or streamed sentence by sentence
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from tts_metrics import ENCODE_SECONDS
+from tts_profiling import stage
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+TTS_ENCODER_WORKERS = int(os.environ.get("TTS_ENCODER_WORKERS", str(min(4, os.cpu_count() or 1))))
+TTS_OPUS_BITRATE = os.environ.get("TTS_OPUS_BITRATE", "24k")
+TTS_MP3_BITRATE = os.environ.get("TTS_MP3_BITRATE", "48k")
+
+# Output options per format; speech-tuned bitrates, mono
+ENCODER_ARGS = {
+    "ogg": ["-c:a", "libopus", "-b:a", TTS_OPUS_BITRATE, "-application", "voip", "-ar", "48000", "-f", "ogg"],
+    "mp3": ["-c:a", "libmp3lame", "-b:a", TTS_MP3_BITRATE, "-f", "mp3"]
+}
+# Names clients may use in the request body's "format" field
+FORMAT_ALIASES = {"opus": "ogg", "oga": "ogg", "mpeg": "mp3"}
+
+READ_BLOCK = 16 * 1024
+
+
+def requested_format(value):
+    """Canonical format name for a request's "format" field"""
+    name = str(value or "wav").lower()
+    return FORMAT_ALIASES.get(name, name)
+
+
+class EncoderPool:
+    """At most `workers` ffmpeg encoders at a time, shared by all request threads"""
+
+    def __init__(self, workers=TTS_ENCODER_WORKERS, binary=FFMPEG_BINARY):
+        self.binary = binary
+        self.workers = workers
+        self.available = shutil.which(binary) is not None
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.encoded = 0
+        self.streams = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+        if not self.available:
+            print(f"⚠️ Audio encoders: {binary} not found, serving WAV only")
+
+    def formats(self):
+        """Output formats this pool can produce"""
+        return ["wav"] + (list(ENCODER_ARGS) if self.available else [])
+
+    def _command(self, input_args, audio_format):
+        return [
+            self.binary, "-hide_banner", "-loglevel", "error", "-nostdin",
+            *input_args, "-i", "pipe:0", "-vn", "-ac", "1",
+            *ENCODER_ARGS[audio_format], "pipe:1"
+        ]
+
+    def _record(self, started, bytes_in, bytes_out, error=None):
+        with self._lock:
+            self.active -= 1
+            if error:
+                self.failures += 1
+                return
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += time.perf_counter() - started
+
+    def encode(self, audio_data, audio_format):
+        """Encode a complete in-memory WAV file"""
+        if audio_format == "wav":
+            return audio_data
+
+        with stage("encode"), self._slots:
+            with self._lock:
+                self.active += 1
+                self.encoded += 1
+            started = time.perf_counter()
+            process = subprocess.run(
+                self._command(["-f", "wav"], audio_format),
+                input=audio_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            if process.returncode != 0:
+                self._record(started, 0, 0, error=True)
+                raise Exception(f"ffmpeg {audio_format} encode failed: {process.stderr.decode(errors='replace').strip()}")
+            self._record(started, len(audio_data), len(process.stdout))
+            ENCODE_SECONDS.observe(time.perf_counter() - started, format=audio_format)
+            return process.stdout
+
+    def encode_stream(self, chunks, audio_format):
+        """Encode (PCM, sample rate) chunks as they arrive, yielding compressed bytes as ffmpeg emits them"""
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is None:
+            return
+        pcm, sample_rate = first
+
+        with self._slots:
+            with self._lock:
+                self.active += 1
+                self.streams += 1
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                self._command(["-f", "s16le", "-ar", str(sample_rate), "-ac", "1"], audio_format),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            fed = {"bytes": 0, "error": None}
+
+            def feed():
+                # Synthesis of later sentences happens here, overlapping with encoding and sending
+                try:
+                    process.stdin.write(pcm)
+                    fed["bytes"] += len(pcm)
+                    for chunk, _ in chunks:
+                        process.stdin.write(chunk)
+                        fed["bytes"] += len(chunk)
+                except Exception as e:
+                    fed["error"] = e
+                finally:
+                    try:
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass
+
+            writer = threading.Thread(target=feed, name="tts-encode-feed", daemon=True)
+            writer.start()
+            sent = 0
+            try:
+                while True:
+                    block = process.stdout.read1(READ_BLOCK)
+                    if not block:
+                        break
+                    sent += len(block)
+                    yield block
+                writer.join()
+                process.wait()
+                if fed["error"] is not None:
+                    raise fed["error"]
+                if process.returncode != 0:
+                    raise Exception(f"ffmpeg {audio_format} stream encode failed ({process.returncode})")
+            except BaseException:
+                self._record(started, 0, 0, error=True)
+                raise
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+            self._record(started, fed["bytes"], sent)
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "formats": self.formats(),
+            "workers": self.workers,
+            "active": self.active,
+            "encoded": self.encoded,
+            "streams": self.streams,
+            "failures": self.failures,
+            "encode_seconds": round(self.seconds, 3),
+            "compression_ratio": round(self.bytes_in / self.bytes_out, 1) if self.bytes_out else None
+        }
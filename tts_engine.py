@@ -0,0 +1,445 @@
+"""
+Persistent Piper Voice Engines for the iLearnHow TTS servers
+Loads each voice model on first use and keeps it in memory between requests, within a memory budget
+"""
+
+import json
+import os
+import struct
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from tts_alignment import align_phonemes, align_text
+from tts_metrics import observe_synthesis
+from tts_profiling import stage
+
+try:
+    from piper.voice import PiperVoice
+except ImportError:
+    # piper-tts not installed - engines fall back to the piper CLI
+    PiperVoice = None
+
+# Directories searched for generic voices such as "en_US-amy-medium"
+PIPER_DATA_DIRS = [
+    d for d in os.environ.get("PIPER_DATA_DIR", os.getcwd()).split(os.pathsep) if d
+]
+
+
+def resolve_model(model, config=None):
+    """Resolve a model path or voice name to (model_path, config_path) on disk"""
+    candidates = [Path(model)]
+    if not model.endswith(".onnx"):
+        candidates += [Path(d) / f"{model}.onnx" for d in PIPER_DATA_DIRS]
+
+    for model_path in candidates:
+        if not model_path.is_file():
+            continue
+        config_path = Path(config) if config else Path(f"{model_path}.json")
+        if config_path.is_file():
+            return str(model_path), str(config_path)
+    return None, None
+
+
+# Resident voice models are evicted least recently used first beyond this; 0 keeps every model loaded
+TTS_VOICE_MEMORY_MB = int(os.environ.get("TTS_VOICE_MEMORY_MB", "1024"))
+# ONNX Runtime holds roughly the weights plus arena buffers: about twice the model file in resident memory
+MODEL_MEMORY_FACTOR = 2.0
+
+# Spoken once cold and once warm per voice at startup; empty loads the models without synthesizing
+TTS_WARMUP_TEXT = os.environ.get("TTS_WARMUP_TEXT", "Hello! Let's learn something new today.")
+
+# Sample rate of Piper's medium/high voices; low and x_low voices speak at 16 kHz
+PIPER_SAMPLE_RATE = 22050
+# Rough bytes of 16-bit audio Piper produces per character of text at 22.05 kHz, to size the output buffer
+PCM_BYTES_PER_CHAR = 4096
+
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
+def wav_header(data_length, sample_rate, channels=1, sample_width=2):
+    """Canonical 44-byte PCM WAV header for data_length bytes of samples"""
+    block_align = channels * sample_width
+    return WAV_HEADER.pack(
+        b"RIFF", 36 + data_length, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 8 * sample_width,
+        b"data", data_length
+    )
+
+
+def wav_bytes(pcm, sample_rate, channels=1, sample_width=2):
+    """Wrap raw 16-bit PCM in a WAV container: the header is arithmetic and the samples are copied once"""
+    with stage("wav"):
+        return b"".join((wav_header(len(pcm), sample_rate, channels, sample_width), pcm))
+
+
+def wav_format(audio_data):
+    """(sample rate, channels, sample width, data offset, data length) of an in-memory WAV file, read in place"""
+    view = memoryview(audio_data)
+    if len(view) < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = view[offset:offset + 4].tobytes()
+        size, = struct.unpack_from("<I", view, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            _, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", view, body)
+            fmt = (sample_rate, channels, bits // 8)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk precedes its fmt chunk")
+            # Streamed WAVs carry 0xFFFFFFFF as the data size
+            return fmt + (body, min(size, len(view) - body))
+        offset = body + size + (size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+
+def wav_pcm_view(audio_data):
+    """(memoryview of the PCM samples, sample rate) of an in-memory WAV file, without copying"""
+    sample_rate, _, _, offset, length = wav_format(audio_data)
+    return memoryview(audio_data)[offset:offset + length], sample_rate
+
+
+def wav_duration(audio_data):
+    """Duration in seconds of an in-memory WAV file, from its header and size alone"""
+    with stage("duration"):
+        sample_rate, channels, sample_width, _, length = wav_format(audio_data)
+        return length / float(sample_rate * channels * sample_width)
+
+
+class VoiceEngine:
+    """A single Piper voice, loaded on first use and reused for every request until its pool evicts it"""
+
+    def __init__(self, model, config=None, on_load=None):
+        self.model = model
+        self.config = config
+        self.voice = None
+        self.sample_rate = None
+        self.load_seconds = None
+        self.memory_bytes = 0
+        self.requests = 0
+        self.loads = 0
+        self.evictions = 0
+        # Requests currently synthesizing; the pool never evicts an engine that is in use
+        self.active = 0
+        self.cli_only = PiperVoice is None
+        # Called with the engine after each load, outside the load lock, so the pool can enforce its budget
+        self.on_load = on_load
+        self._load_lock = threading.Lock()
+
+    @property
+    def in_process(self):
+        return self.voice is not None
+
+    def load(self):
+        """Load the ONNX model into memory (no-op when already loaded): the PiperVoice, or None for the CLI"""
+        voice = self.voice
+        if voice is not None or self.cli_only:
+            return voice
+
+        with self._load_lock:
+            if self.voice is not None:
+                return self.voice
+            model_path, config_path = resolve_model(self.model, self.config)
+            if not model_path:
+                self.cli_only = True
+                print(f"⚠️ Voice engine: {self.model} not found locally, using piper CLI")
+                return None
+
+            started = time.perf_counter()
+            with stage("load"):
+                voice = PiperVoice.load(model_path, config_path=config_path)
+            self.load_seconds = time.perf_counter() - started
+            self.sample_rate = voice.config.sample_rate
+            self.memory_bytes = int(os.path.getsize(model_path) * MODEL_MEMORY_FACTOR)
+            self.loads += 1
+            self.voice = voice
+            print(f"✅ Voice engine: loaded {model_path} in {self.load_seconds:.2f}s")
+
+        if self.on_load:
+            self.on_load(self)
+        return voice
+
+    def unload(self, evicted=False):
+        """Drop the loaded model; requests still holding it finish first, and the next request loads it again"""
+        with self._load_lock:
+            if self.voice is None and self.cli_only == (PiperVoice is None):
+                return
+            self.voice = None
+            self.sample_rate = None
+            self.memory_bytes = 0
+            # The model file may have appeared or changed since it was last looked up
+            self.cli_only = PiperVoice is None
+            if evicted:
+                self.evictions += 1
+        print(f"♻️ Voice engine: unloaded {self.model}{' (memory budget)' if evicted else ''}")
+
+    def synthesize_aligned(self, text):
+        """Synthesize text and its viseme timeline in one pass: (PCM bytes, sample rate, timeline)"""
+        self.requests += 1
+        # Held locally so an eviction mid-request only drops the engine's reference
+        voice = self.load()
+        if voice is None:
+            pcm, sample_rate = self._synthesize_cli(text)
+            return pcm, sample_rate, align_text(text, pcm, sample_rate)
+
+        # Same phonemize -> ids -> audio steps synthesize_stream_raw runs, keeping the phonemes
+        sample_rate = voice.config.sample_rate
+        chunks = []
+        timeline = []
+        offset = 0.0
+        for phonemes in voice.phonemize(text):
+            pcm = voice.synthesize_ids_to_raw(voice.phonemes_to_ids(phonemes))
+            with stage("phonemes"):
+                timeline += align_phonemes(phonemes, pcm, sample_rate, offset)
+            offset += len(pcm) / (2.0 * sample_rate)
+            chunks.append(pcm)
+        return b"".join(chunks), sample_rate, timeline
+
+    def cli_sample_rate(self):
+        """Sample rate of the CLI's raw output: from the voice config when it is on disk, else by quality name"""
+        if self.sample_rate:
+            return self.sample_rate
+        _, config_path = resolve_model(self.model, self.config)
+        if config_path:
+            with open(config_path) as f:
+                sample_rate = json.load(f).get("audio", {}).get("sample_rate")
+            if sample_rate:
+                self.sample_rate = sample_rate
+                return sample_rate
+        return 16000 if self.model.endswith(("-low", "-x_low")) else PIPER_SAMPLE_RATE
+
+    def _synthesize_cli(self, text):
+        """Fallback: one piper process per request when the model can't be held in memory
+
+        Piper writes raw PCM to stdout, read straight into a preallocated buffer: no temp file and no
+        WAV parsing; the caller builds the header from the sample count.
+        """
+        sample_rate = self.cli_sample_rate()
+        cmd = ["piper", "--model", self.model]
+        if self.config:
+            cmd += ["--config", self.config]
+        cmd += ["--output_raw"]
+
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stderr = []
+        drain = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        drain.start()
+        # Request text is capped well below the pipe buffer, so this write cannot block on Piper's output
+        process.stdin.write(text.encode("utf-8"))
+        process.stdin.close()
+
+        buffer = bytearray(max(64 * 1024, len(text) * PCM_BYTES_PER_CHAR * sample_rate // PIPER_SAMPLE_RATE))
+        size = 0
+        while True:
+            if size == len(buffer):
+                buffer.extend(bytes(len(buffer)))
+            read = process.stdout.readinto(memoryview(buffer)[size:])
+            if not read:
+                break
+            size += read
+        process.stdout.close()
+        process.wait()
+        drain.join()
+        if process.returncode != 0:
+            raise Exception(f"Piper failed: {b''.join(stderr).decode(errors='replace')}")
+
+        # Trimming in place keeps the samples where Piper's output landed
+        del buffer[size - (size % 2):]
+        return buffer, sample_rate
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "in_process": self.in_process,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds else None,
+            "sample_rate": self.sample_rate,
+            "requests": self.requests,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "memory_mb": round(self.memory_bytes / 1048576, 1)
+        }
+
+
+class VoiceEnginePool:
+    """Long-lived engines keyed by (model, config), shared by all request threads
+
+    Models load on first use. Once the loaded models' estimated memory passes memory_budget, the least
+    recently used idle ones are unloaded and load again lazily when next asked for.
+    """
+
+    def __init__(self, scheduler=None, memory_budget=TTS_VOICE_MEMORY_MB * 1024 * 1024):
+        self._engines = {}
+        # Engines holding a loaded model, least recently used first
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+        # Optional SynthesisScheduler bounding how many requests run per voice at once
+        self.scheduler = scheduler
+        self.memory_budget = memory_budget
+        self.evictions = 0
+
+    def engine(self, model, config=None):
+        key = (model, config)
+        engine = self._engines.get(key)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.setdefault(key, VoiceEngine(model, config, on_load=self._admit))
+        return engine
+
+    def _admit(self, engine):
+        """Track a newly loaded engine and evict idle ones, oldest use first, until the budget holds"""
+        evicted = []
+        with self._lock:
+            self._resident[(engine.model, engine.config)] = engine
+            if self.memory_budget:
+                resident = sum(e.memory_bytes for e in self._resident.values())
+                for key, other in list(self._resident.items()):
+                    if resident <= self.memory_budget:
+                        break
+                    if other is engine or other.active:
+                        continue
+                    resident -= other.memory_bytes
+                    del self._resident[key]
+                    evicted.append(other)
+            self.evictions += len(evicted)
+        for other in evicted:
+            other.unload(evicted=True)
+
+    def invalidate(self, model):
+        """Unload every engine for a model path, e.g. after the file changed on disk"""
+        with self._lock:
+            engines = [e for (m, _), e in self._engines.items() if m == model]
+            for engine in engines:
+                self._resident.pop((engine.model, engine.config), None)
+        for engine in engines:
+            engine.unload()
+
+    def preload(self, voices):
+        """Load every (model, config) pair up front so requests never pay the cold start"""
+        for model, config in voices:
+            try:
+                self.engine(model, config).load()
+            except Exception as e:
+                print(f"❌ Voice engine: failed to load {model}: {e}")
+
+    def warm_up(self, voices, text=TTS_WARMUP_TEXT):
+        """Load and exercise every (model, config) pair on a background thread; see EngineWarmup"""
+        return EngineWarmup(self, voices, text).start()
+
+    def _run(self, engine, fn, text, observe=True):
+        """fn(text) on one of the scheduler's slots for the engine's voice, marked active against eviction"""
+        model = engine.model
+
+        def timed():
+            with self._lock:
+                engine.active += 1
+                if (model, engine.config) in self._resident:
+                    self._resident.move_to_end((model, engine.config))
+            started = time.perf_counter()
+            try:
+                with stage("synth"):
+                    result = fn(text)
+            finally:
+                with self._lock:
+                    engine.active -= 1
+            if observe:
+                observe_synthesis(model, time.perf_counter() - started, result[0], result[1])
+            return result
+
+        if self.scheduler is None:
+            return timed()
+        return self.scheduler.run(model, timed)
+
+    def synthesize_aligned(self, model, text, config=None):
+        engine = self.engine(model, config)
+        return self._run(engine, engine.synthesize_aligned, text)
+
+    def memory(self):
+        """Estimated resident model memory against the budget"""
+        with self._lock:
+            resident = list(self._resident.values())
+        return {
+            "budget_mb": round(self.memory_budget / 1048576, 1) if self.memory_budget else None,
+            "resident_mb": round(sum(e.memory_bytes for e in resident) / 1048576, 1),
+            "resident": [e.model for e in resident],
+            "evictions": self.evictions
+        }
+
+    def stats(self):
+        return {model: engine.stats() for (model, _), engine in self._engines.items()}
+
+
+class EngineWarmup:
+    """Startup phase that loads each served voice and synthesizes a short utterance with it, cold then warm
+
+    The server answers /health while this runs; /ready fails until every voice has warmed up.
+    """
+
+    def __init__(self, pool, voices, text=TTS_WARMUP_TEXT):
+        self.pool = pool
+        self.voices = list(voices)
+        self.text = text
+        self.results = {}
+        self.seconds = None
+        self._done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="tts-warmup", daemon=True).start()
+        return self
+
+    def _run(self):
+        started = time.perf_counter()
+        for model, config in self.voices:
+            self.results[model] = self._warm(model, config)
+        self.seconds = time.perf_counter() - started
+        self._done.set()
+        status = "ready" if self.ready else "finished with errors"
+        print(f"{'✅' if self.ready else '❌'} Voice engines: warm-up {status} in {self.seconds:.2f}s")
+
+    def _warm(self, model, config):
+        engine = self.pool.engine(model, config)
+        result = {"in_process": False, "load_ms": None, "cold_ms": None, "warm_ms": None, "error": None}
+        try:
+            engine.load()
+            result["in_process"] = engine.in_process
+            if engine.load_seconds is not None:
+                result["load_ms"] = round(1000 * engine.load_seconds, 1)
+            if self.text:
+                # The first inference pays ONNX Runtime's graph optimisation and buffer allocation;
+                # the second is what a request sees from then on. Both take a scheduler slot like a
+                # request would, so early traffic never shares a voice with more than its workers
+                for phase in ("cold_ms", "warm_ms"):
+                    started = time.perf_counter()
+                    self.pool._run(engine, engine.synthesize_aligned, self.text, observe=False)
+                    result[phase] = round(1000 * (time.perf_counter() - started), 1)
+            print(f"✅ Voice engine: {model} warm (cold {result['cold_ms']} ms, warm {result['warm_ms']} ms)")
+        except Exception as e:
+            result["error"] = str(e)
+            print(f"❌ Voice engine: warm-up failed for {model}: {e}")
+        return result
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    @property
+    def ready(self):
+        """Warm-up finished and every voice came through it"""
+        return self.finished and all(r["error"] is None for r in self.results.values())
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "finished": self.finished,
+            "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "voices": {model: dict(result) for model, result in list(self.results.items())},
+            "pending": [model for model, _ in self.voices if model not in self.results]
+        }
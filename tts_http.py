@@ -0,0 +1,173 @@
+"""
+HTTP helpers shared by the iLearnHow TTS servers
+Content negotiation between the JSON envelope, raw binary audio and playback bundles
+"""
+
+import json
+import time
+
+from flask import Response, g, jsonify, request
+
+from tts_bundle import BUNDLE_MIMETYPE, bundle_url, read_header
+from tts_metrics import CONTENT_TYPE, REGISTRY, REQUEST_SECONDS, REQUESTS, RESPONSE_BYTES
+from tts_profiling import RequestProfile, finish_request, profile_requested, start_request
+
+# Binary audio types a client may ask for with the Accept header
+AUDIO_MIMETYPES = {
+    "wav": "audio/wav",
+    "ogg": "audio/ogg",
+    "mp3": "audio/mpeg"
+}
+ACCEPT_ALIASES = {
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/ogg": "ogg",
+    "audio/mpeg": "mp3"
+}
+
+# Response headers browsers may read on binary audio responses
+AUDIO_EXPOSE_HEADERS = ["X-Audio-Duration", "X-TTS-Speaker", "X-TTS-Engine", "X-TTS-Voice-Type", "Retry-After", "Server-Timing",
+                        "Accept-Ranges", "Content-Range", "Content-Location", "ETag"]
+
+
+def negotiate_audio(accept_mimetypes):
+    """Audio format named by the Accept header, or None when the client wants JSON"""
+    best = accept_mimetypes.best_match(["application/json"] + list(ACCEPT_ALIASES))
+    return ACCEPT_ALIASES.get(best)
+
+
+def negotiate_bundle(accept_mimetypes):
+    """Whether the Accept header prefers a playback bundle (see tts_bundle) to JSON"""
+    return accept_mimetypes.best_match(["application/json", BUNDLE_MIMETYPE]) == BUNDLE_MIMETYPE
+
+
+def audio_response(audio_data, audio_format, duration, speaker, engine, voice_type=None):
+    """Raw audio body with the metadata the JSON envelope used to carry moved into headers"""
+    response = Response(audio_data, mimetype=AUDIO_MIMETYPES[audio_format])
+    response.headers["X-Audio-Duration"] = f"{duration:.3f}"
+    response.headers["X-TTS-Speaker"] = speaker
+    response.headers["X-TTS-Engine"] = engine
+    if voice_type:
+        response.headers["X-TTS-Voice-Type"] = voice_type
+    return response
+
+
+def bundle_response(bundle, key, speaker=None, engine=None, voice_type=None):
+    """A playback bundle addressed by its cache key (None when uncached); GETs honour Range and If-Range"""
+    header = read_header(bundle)
+    response = Response(bundle, mimetype=BUNDLE_MIMETYPE)
+    response.headers["X-Audio-Duration"] = f"{header['duration_ms'] / 1000:.3f}"
+    for name, value in (("X-TTS-Speaker", speaker), ("X-TTS-Engine", engine), ("X-TTS-Voice-Type", voice_type)):
+        if value:
+            response.headers[name] = value
+    if key is None:
+        return response
+    response.headers["Content-Location"] = bundle_url(key)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.set_etag(key)
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(bundle))
+
+
+def busy_response(error):
+    """503 for a SchedulerBusy error, telling the client when to try again"""
+    response = jsonify({
+        "error": "TTS server busy, please retry",
+        "reason": error.reason,
+        "retry_after": error.retry_after
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def readiness_response(warmup):
+    """200 once every voice is loaded and warm, 503 with warm-up progress until then"""
+    stats = warmup.stats()
+    if stats["ready"]:
+        return jsonify(dict(stats, status="ready"))
+    response = jsonify(dict(stats, status="warming_up" if not stats["finished"] else "failed"))
+    response.status_code = 503
+    if not stats["finished"]:
+        response.headers["Retry-After"] = "5"
+    return response
+
+
+def tag_request(speaker=None, engine=None, audio_format=None):
+    """Attach labels for this request's metrics once the handler knows them"""
+    if speaker is not None:
+        g.tts_speaker = speaker
+    if engine is not None:
+        g.tts_engine = engine
+    if audio_format is not None:
+        g.tts_format = audio_format
+
+
+def install_metrics(app):
+    """Time every request and serve GET /metrics in the Prometheus text format"""
+
+    @app.before_request
+    def start_timer():
+        g.tts_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = getattr(g, "tts_started", None)
+        if started is None or request.path == "/metrics":
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = str(response.status_code)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=status)
+        REQUESTS.inc(route=route, status=status,
+                     speaker=getattr(g, "tts_speaker", ""), engine=getattr(g, "tts_engine", ""))
+        if not response.is_streamed and response.content_length is not None:
+            RESPONSE_BYTES.observe(response.content_length, route=route,
+                                   format=getattr(g, "tts_format", response.mimetype))
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    return app
+
+
+def install_timing(app):
+    """Server-Timing stage breakdown on every response; ?profile=1 adds a cProfile summary"""
+
+    @app.before_request
+    def start_timing():
+        g.tts_timings, g.tts_timing_token = start_request()
+        if profile_requested(request.args.get("profile")):
+            profile = RequestProfile()
+            if profile.start():
+                g.tts_profile = profile
+
+    @app.after_request
+    def add_server_timing(response):
+        timings = getattr(g, "tts_timings", None)
+        if timings is None:
+            return response
+        profile = g.pop("tts_profile", None)
+        if profile is not None:
+            summary = profile.stop()
+            print(f"🔬 Profile {request.method} {request.path}\n{summary}")
+            # JSON responses carry the summary too; binary and streamed ones only log it
+            data = response.get_json(silent=True) if response.is_json and not response.is_streamed else None
+            if isinstance(data, dict):
+                data["profile"] = summary
+                response.set_data(json.dumps(data))
+        # Streamed responses only cover the work done before the first byte
+        response.headers["Server-Timing"] = timings.server_timing()
+        return response
+
+    @app.teardown_request
+    def finish_timing(error=None):
+        profile = g.pop("tts_profile", None)
+        if profile is not None:
+            profile.stop()
+        token = g.pop("tts_timing_token", None)
+        if token is not None:
+            finish_request(token)
+
+    return app
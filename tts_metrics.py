@@ -0,0 +1,194 @@
+"""
+Prometheus Metrics for the iLearnHow TTS servers
+Dependency-free counters and histograms rendered in the Prometheus text format at /metrics
+"""
+
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RTF_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20, 64 << 20)
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{format_labels(self.labels, key)} {format_value(v)}" for key, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = format_labels(self.labels, key, ("le", format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Collected:
+    """Values read from existing stats() at scrape time: fn() -> {label values tuple: value}"""
+
+    def __init__(self, name, help, kind, labels, fn):
+        self.name, self.help, self.kind, self.labels, self.fn = name, help, kind, tuple(labels), fn
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.fn().items()):
+            if value is not None:
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if all(m.name != metric.name for m in self._metrics):
+                self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collected(self, name, help, kind="gauge", labels=(), fn=dict):
+        return self.register(Collected(name, help, kind, labels, fn))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines += metric.render()
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "tts_request_duration_seconds", "Wall time from request start to response, by route and status",
+    labels=("route", "method", "status"))
+REQUESTS = REGISTRY.counter(
+    "tts_requests_total", "Requests by route, status, speaker and engine",
+    labels=("route", "status", "speaker", "engine"))
+RESPONSE_BYTES = REGISTRY.histogram(
+    "tts_response_bytes", "Response body size (streamed responses excluded)",
+    labels=("route", "format"), buckets=BYTES_BUCKETS)
+SYNTHESIS_SECONDS = REGISTRY.histogram(
+    "tts_synthesis_seconds", "Time spent inside Piper for one synthesis call", labels=("model",))
+AUDIO_SECONDS = REGISTRY.counter(
+    "tts_audio_seconds_total", "Seconds of audio synthesized", labels=("model",))
+REALTIME_FACTOR = REGISTRY.histogram(
+    "tts_realtime_factor", "Seconds of audio produced per wall-clock second of synthesis",
+    labels=("model",), buckets=RTF_BUCKETS)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "tts_queue_wait_seconds", "Time a synthesis waited for a worker slot", labels=("voice",))
+QUEUE_REJECTED = REGISTRY.counter(
+    "tts_queue_rejected_total", "Syntheses turned away with 503", labels=("voice", "reason"))
+ENCODE_SECONDS = REGISTRY.histogram(
+    "tts_encode_seconds", "Time spent compressing one clip", labels=("format",))
+
+
+def observe_synthesis(model, seconds, pcm, sample_rate):
+    """Record one Piper call and its real-time factor"""
+    SYNTHESIS_SECONDS.observe(seconds, model=model)
+    audio_seconds = len(pcm) / (2.0 * sample_rate) if sample_rate else 0.0
+    AUDIO_SECONDS.inc(audio_seconds, model=model)
+    if seconds > 0 and audio_seconds > 0:
+        REALTIME_FACTOR.observe(audio_seconds / seconds, model=model)
+
+
+def register_cache(cache):
+    """Expose an AudioCache's hit/miss counters and hit ratio"""
+    REGISTRY.collected(
+        "tts_cache_lookups_total", "Audio cache lookups by result tier", kind="counter", labels=("result",),
+        fn=lambda: {
+            ("memory",): cache.hits_memory,
+            ("disk",): cache.hits_disk,
+            ("prerendered",): cache.hits_prerendered,
+            ("miss",): cache.misses
+        })
+    REGISTRY.collected(
+        "tts_cache_hit_ratio", "Fraction of audio cache lookups served without synthesis",
+        fn=lambda: {(): cache.stats()["hit_rate"]})
+    REGISTRY.collected(
+        "tts_cache_bytes", "Bytes held per cache tier", labels=("tier",),
+        fn=lambda: {("memory",): cache._memory_size, ("disk",): cache._disk_size})
+    REGISTRY.collected(
+        "tts_coalesced_total", "Requests that attached to an identical in-flight synthesis", kind="counter",
+        fn=lambda: {(): cache.flight.coalesced})
+
+
+def register_scheduler(scheduler):
+    """Expose per-voice queue depth and busy workers"""
+    def per_voice(field):
+        return lambda: {(voice,): stats[field] for voice, stats in scheduler.stats()["voices"].items()}
+    REGISTRY.collected("tts_queue_depth", "Syntheses waiting for a worker slot", labels=("voice",),
+                       fn=per_voice("queue_depth"))
+    REGISTRY.collected("tts_workers_busy", "Worker slots currently synthesizing", labels=("voice",),
+                       fn=per_voice("active"))
@@ -0,0 +1,89 @@
+"""
+Sentence-Parallel Synthesis for the iLearnHow TTS servers
+Long text is cut at sentence boundaries into balanced runs that synthesize concurrently,
+then the PCM and viseme timelines are stitched back together in order
+"""
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_streaming import offset_phonemes, split_sentences
+
+TTS_PARALLEL_WORKERS = int(os.environ.get("TTS_PARALLEL_WORKERS", str(os.cpu_count() or 1)))
+# Below this length one Piper call is faster than fanning out
+TTS_PARALLEL_MIN_CHARS = int(os.environ.get("TTS_PARALLEL_MIN_CHARS", "300"))
+# Pause inserted between runs; 0 matches what a single in-process Piper call produces
+TTS_SENTENCE_SILENCE = float(os.environ.get("TTS_SENTENCE_SILENCE", "0.0"))
+
+SENTENCE_EXECUTOR = ThreadPoolExecutor(max_workers=TTS_PARALLEL_WORKERS, thread_name_prefix="tts-sentence")
+
+
+def sentence_runs(text, parts):
+    """Split text into at most `parts` runs of consecutive sentences with similar character counts"""
+    sentences = split_sentences(text)
+    parts = max(1, min(parts, len(sentences)))
+    target = sum(len(s) for s in sentences) / parts
+
+    runs, current, covered = [], [], 0
+    for index, sentence in enumerate(sentences):
+        current.append(sentence)
+        covered += len(sentence)
+        remaining_sentences = len(sentences) - index - 1
+        remaining_runs = parts - len(runs) - 1
+        if remaining_runs <= 0 or remaining_sentences == 0:
+            continue
+        # Cut at the sentence end nearest the next ideal boundary
+        next_half = len(sentences[index + 1]) / 2
+        if covered + next_half >= target * (len(runs) + 1) or remaining_sentences == remaining_runs:
+            runs.append(" ".join(current))
+            current = []
+    if current:
+        runs.append(" ".join(current))
+    return runs
+
+
+def stitch(results, sample_rate, silence=TTS_SENTENCE_SILENCE):
+    """Join [(PCM, timeline)] in order, with `silence` seconds between runs and timelines shifted to match"""
+    gap = b"\x00\x00" * int(round(sample_rate * silence))
+    gap_seconds = len(gap) / (2.0 * sample_rate)
+
+    chunks, timeline = [], []
+    offset = 0.0
+    for index, (pcm, run_timeline) in enumerate(results):
+        if index and gap:
+            chunks.append(gap)
+            timeline.append({"phoneme": "REST", "start": round(offset, 3), "end": round(offset + gap_seconds, 3)})
+            offset += gap_seconds
+        chunks.append(pcm)
+        timeline += offset_phonemes(run_timeline, offset)
+        offset += len(pcm) / (2.0 * sample_rate)
+    return b"".join(chunks), timeline
+
+
+def parallel_synthesis(engines, model, text, config=None):
+    """(PCM, sample rate, timeline) for text, fanning long input out across cores"""
+    parts = TTS_PARALLEL_WORKERS if len(text) >= TTS_PARALLEL_MIN_CHARS else 1
+    if parts <= 1 or len(split_sentences(text)) == 1:
+        return engines.synthesize_aligned(model, text, config=config)
+
+    def fan_out(slots):
+        runs = sentence_runs(text, slots)
+        if len(runs) == 1:
+            return engines.synthesize_aligned(model, text, config=config)
+        # Each run carries the request's context, so its stage timings land on the request and it
+        # runs on one of the slots the request holds rather than queueing (and maybe failing) alone
+        futures = [
+            SENTENCE_EXECUTOR.submit(contextvars.copy_context().run, engines.synthesize_aligned, model, run,
+                                     config=config)
+            for run in runs
+        ]
+        results = [future.result() for future in futures]
+        sample_rate = results[0][1]
+        pcm, timeline = stitch([(pcm, run_timeline) for pcm, _, run_timeline in results], sample_rate)
+        return pcm, sample_rate, timeline
+
+    if engines.scheduler is None:
+        return fan_out(parts)
+    # One scheduler slot per concurrent run: as many as are free, down to a single run on one slot
+    return engines.scheduler.run_many(model, min(parts, engines.scheduler.workers_per_voice), fan_out)
@@ -0,0 +1,166 @@
+"""
+Per-Request Stage Timing for the iLearnHow TTS servers
+Breaks a request into stages for the Server-Timing header, and profiles it with cProfile on ?profile=1
+"""
+
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# ?profile=1 is a production debugging aid; set to false to ignore it
+TTS_PROFILE_ENABLED = os.environ.get("TTS_PROFILE_ENABLED", "true").lower() in ("1", "true", "yes")
+TTS_PROFILE_LINES = int(os.environ.get("TTS_PROFILE_LINES", "30"))
+
+# Server-Timing names in the order a request passes through them, with the description browsers show
+STAGES = {
+    "validate": "request parsing and validation",
+    "cache": "audio cache lookups",
+    "load": "voice model load",
+    "queue": "waiting for a voice worker slot",
+    "synth": "Piper synthesis",
+    "phonemes": "phoneme and viseme alignment",
+    "wav": "WAV packing and reading",
+    "duration": "WAV duration probe",
+    "envelope": "mouth envelope",
+    "encode": "compressed audio encoding",
+    "serialize": "base64 and JSON serialization"
+}
+
+_current = contextvars.ContextVar("tts_request_timings", default=None)
+# cProfile allows one active profiler per process, so concurrent ?profile=1 requests take turns
+_profile_lock = threading.Lock()
+
+
+class RequestTimings:
+    """Seconds spent per stage during one request
+
+    Stages may overlap: alignment runs inside synthesis, and parallel sentence runs each add their own time.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        # RequestProfile for ?profile=1 requests whose work runs on executor threads
+        self.profile = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Server-Timing header value, ending with the request total"""
+        order = list(STAGES)
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: order.index(item[0]) if item[0] in order else len(order))
+        entries = [f'{name};dur={1000 * seconds:.1f};desc="{STAGES.get(name, name)}"' for name, seconds in stages]
+        entries.append(f'total;dur={1000 * self.elapsed():.1f}')
+        return ", ".join(entries)
+
+
+def start_request():
+    """Begin timing the current request: (timings, token for finish_request)"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Finished from a different context than it started in (e.g. after a streamed body)
+        _current.set(None)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to the current request's `name` stage (no-op outside a request)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def mark(name):
+    """Record the time from request start until now as `name`, for stages with no single call to wrap"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, timings.elapsed())
+
+
+def profile_requested(value):
+    """Whether a ?profile= query value asks for a profile (and profiling is allowed)"""
+    return TTS_PROFILE_ENABLED and str(value).lower() in ("1", "true", "yes")
+
+
+class RequestProfile:
+    """cProfile for one request: the whole handling thread (start), or each blocking call it hands off (call)"""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.active = False
+        self.enabled = False
+
+    def start(self, enable=True):
+        """Claim the process profiler, or return False when another request is already being profiled"""
+        if not _profile_lock.acquire(blocking=False):
+            return False
+        if enable:
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) is attached to the process
+                _profile_lock.release()
+                return False
+            self.enabled = True
+        self.active = True
+        return True
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn under the profiler, for work done on a thread other than the one that called start"""
+        if not self.active:
+            return fn(*args, **kwargs)
+        try:
+            self.profiler.enable()
+        except ValueError:
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+
+    def stop(self, limit=TTS_PROFILE_LINES):
+        """Stop profiling and return the top `limit` functions by cumulative time as pstats text"""
+        if not self.active:
+            return None
+        if self.enabled:
+            self.profiler.disable()
+            self.enabled = False
+        self.active = False
+        _profile_lock.release()
+
+        output = io.StringIO()
+        try:
+            stats = pstats.Stats(self.profiler, stream=output)
+        except TypeError:
+            # Nothing ran under the profiler (e.g. the handler returned before handing work off)
+            return "No calls profiled\n"
+        stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return output.getvalue()
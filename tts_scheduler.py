@@ -0,0 +1,169 @@
+"""
+Synthesis Scheduler for the iLearnHow TTS servers
+Caps concurrent Piper work per voice behind a bounded queue and sheds load once it is full
+"""
+
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from tts_metrics import QUEUE_REJECTED, QUEUE_WAIT_SECONDS
+from tts_profiling import stage
+
+TTS_WORKERS_PER_VOICE = int(os.environ.get("TTS_WORKERS_PER_VOICE", "2"))
+TTS_MAX_QUEUE = int(os.environ.get("TTS_MAX_QUEUE", "16"))
+TTS_QUEUE_TIMEOUT = float(os.environ.get("TTS_QUEUE_TIMEOUT", "30"))
+
+# Recent requests kept per voice for the wait/service time figures in /health
+SAMPLE_WINDOW = 256
+
+# Voices whose slot the current request already holds; work it fans out (in a copied context) runs under it
+_admitted = contextvars.ContextVar("tts_admitted", default=frozenset())
+
+
+class SchedulerBusy(Exception):
+    """Raised instead of queueing when a voice is saturated; maps to 503 + Retry-After"""
+
+    def __init__(self, voice, retry_after, reason="queue full"):
+        super().__init__(f"TTS voice '{voice}' is busy ({reason}), retry in {retry_after}s")
+        self.voice = voice
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def summarize(samples):
+    """avg / p95 / max in milliseconds of a window of durations in seconds"""
+    if not samples:
+        return {"avg_ms": None, "p95_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    return {
+        "avg_ms": round(1000 * sum(ordered) / len(ordered), 1),
+        "p95_ms": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "max_ms": round(1000 * ordered[-1], 1)
+    }
+
+
+class VoiceQueue:
+    """Worker slots and waiting room for one voice"""
+
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.slots = threading.BoundedSemaphore(workers)
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waits = deque(maxlen=SAMPLE_WINDOW)
+        self.services = deque(maxlen=SAMPLE_WINDOW)
+
+    def retry_after(self):
+        """Seconds until the backlog ahead of a new request should have drained"""
+        service = sum(self.services) / len(self.services) if self.services else 1.0
+        return max(1, math.ceil(service * (self.waiting + self.active) / self.workers))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait": summarize(list(self.waits)),
+            "service": summarize(list(self.services))
+        }
+
+
+class SynthesisScheduler:
+    """Runs synthesis calls with at most `workers_per_voice` in flight and `max_queue` waiting per voice"""
+
+    def __init__(self, workers_per_voice=TTS_WORKERS_PER_VOICE, max_queue=TTS_MAX_QUEUE,
+                 queue_timeout=TTS_QUEUE_TIMEOUT):
+        self.workers_per_voice = workers_per_voice
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def queue(self, voice):
+        with self._lock:
+            queue = self._queues.get(voice)
+            if queue is None:
+                queue = self._queues[voice] = VoiceQueue(self.workers_per_voice, self.max_queue)
+            return queue
+
+    def run(self, voice, fn, *args, **kwargs):
+        """Call fn on a worker slot for voice, or raise SchedulerBusy rather than pile up
+
+        Calls made while the request already holds a slot for voice (e.g. the sentence runs of one
+        utterance) go straight through on the parent's admission instead of queueing again.
+        """
+        if voice in _admitted.get():
+            return fn(*args, **kwargs)
+        return self.run_many(voice, 1, lambda slots: fn(*args, **kwargs))
+
+    def run_many(self, voice, want, fn):
+        """Call fn(slots) holding up to `want` worker slots for voice, with 1 <= slots <= want
+
+        The first slot is queued for like run(); the others are only taken if they are free right now,
+        so a request never waits holding a slot. fn may run up to `slots` calls for voice at once, and
+        run() calls it makes for voice go straight through on those slots.
+        """
+        admitted = _admitted.get()
+        if voice in admitted:
+            # Already running on one of the request's slots
+            return fn(1)
+        queue = self.queue(voice)
+        with self._lock:
+            if queue.waiting >= queue.max_queue:
+                queue.rejected += 1
+                QUEUE_REJECTED.inc(voice=voice, reason="queue full")
+                raise SchedulerBusy(voice, queue.retry_after())
+            queue.waiting += 1
+
+        enqueued = time.perf_counter()
+        with stage("queue"):
+            acquired = queue.slots.acquire(timeout=self.queue_timeout)
+        started = time.perf_counter()
+        with self._lock:
+            queue.waiting -= 1
+            if not acquired:
+                queue.timed_out += 1
+                QUEUE_REJECTED.inc(voice=voice, reason="queue timeout")
+                raise SchedulerBusy(voice, queue.retry_after(), reason="queue timeout")
+            slots = 1
+            while slots < want and queue.slots.acquire(blocking=False):
+                slots += 1
+            queue.active += slots
+            queue.waits.append(started - enqueued)
+        QUEUE_WAIT_SECONDS.observe(started - enqueued, voice=voice)
+
+        token = _admitted.set(admitted | {voice})
+        try:
+            return fn(slots)
+        finally:
+            _admitted.reset(token)
+            finished = time.perf_counter()
+            with self._lock:
+                queue.active -= slots
+                queue.completed += 1
+                queue.services.append(finished - started)
+            for _ in range(slots):
+                queue.slots.release()
+
+    def stats(self):
+        with self._lock:
+            voices = {voice: queue.stats() for voice, queue in self._queues.items()}
+        return {
+            "workers_per_voice": self.workers_per_voice,
+            "max_queue": self.max_queue,
+            "queue_depth": sum(v["queue_depth"] for v in voices.values()),
+            "active": sum(v["active"] for v in voices.values()),
+            "voices": voices
+        }
@@ -0,0 +1,114 @@
+"""
+Request Coalescing for the iLearnHow TTS servers
+Identical in-flight syntheses share one Piper run: threads wait on the leader in-process,
+and worker processes on the same host take turns through a per-key lock file
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows - coalescing stays within each process
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive flock on path, yielding the seconds spent waiting for it"""
+    started = time.perf_counter()
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # The previous holder may have unlinked the file while we waited; lock the live one
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+    try:
+        yield time.perf_counter() - started
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class Flight:
+    """One in-progress call that later arrivals attach to"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run fn once per key at a time; concurrent callers with the same key receive its result"""
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = Path(lock_dir) if lock_dir and fcntl else None
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.lock_waits = 0
+
+        if self.lock_dir:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            if self.lock_dir:
+                # fn is expected to re-check the shared cache once it holds the lock
+                with file_lock(self.lock_dir / f"{key}.lock") as waited:
+                    if waited > 0.01:
+                        with self._lock:
+                            self.lock_waits += 1
+                    flight.result = fn()
+            else:
+                flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "cross_process_waits": self.lock_waits,
+            "cross_process": self.lock_dir is not None
+        }
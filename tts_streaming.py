@@ -0,0 +1,138 @@
+"""
+Sentence-by-sentence streaming for the iLearnHow TTS servers
+Emits audio (and the phoneme timeline) as each sentence finishes synthesizing
+"""
+
+import base64
+import json
+import re
+import struct
+
+from tts_alignment import wav_envelope
+from tts_engine import wav_duration, wav_pcm_view
+from tts_scheduler import SchedulerBusy
+
+# Split after terminal punctuation (plus any closing quotes/brackets) followed by whitespace
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+")
+
+
+def split_sentences(text):
+    """Split text into sentences, keeping the terminal punctuation with each one"""
+    sentences = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        sentence = text[start:match.start() + len(match.group(0).rstrip())].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+def streaming_wav_header(sample_rate, channels=1, sample_width=2):
+    """WAV header with unknown length, for audio sent before synthesis has finished"""
+    unknown = 0xFFFFFFFF
+    return b"".join([
+        b"RIFF", struct.pack("<I", unknown), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                             sample_rate * channels * sample_width,
+                             channels * sample_width, sample_width * 8),
+        b"data", struct.pack("<I", unknown)
+    ])
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_sentence_audio(text, synthesize):
+    """Yield (index, sentence, wav bytes, timeline, start offset, duration) as each sentence completes"""
+    offset = 0.0
+    for index, sentence in enumerate(split_sentences(text)):
+        audio_data, timeline = synthesize(sentence)
+        duration = wav_duration(audio_data)
+        yield index, sentence, audio_data, timeline, offset, duration
+        offset += duration
+
+
+def started_synthesis(text, synthesize):
+    """synthesize with the first sentence of text already done, so a request the scheduler refuses
+    outright raises SchedulerBusy here, before a streamed response has started, rather than mid-stream"""
+    sentences = split_sentences(text)
+    if not sentences:
+        return synthesize
+    first = [synthesize(sentences[0])]
+
+    def synthesize_started(sentence):
+        return first.pop() if first else synthesize(sentence)
+    return synthesize_started
+
+
+def offset_phonemes(phonemes, offset):
+    """Shift a sentence-local phoneme timeline onto the utterance timeline"""
+    return [
+        dict(p, start=round(p["start"] + offset, 3), end=round(p["end"] + offset, 3))
+        for p in phonemes
+    ]
+
+
+def sse_stream(text, synthesize, include_phonemes=False, include_envelope=False, meta=None,
+               audio_format="wav", encode=None):
+    """Server-Sent Events: one 'chunk' event per sentence carrying audio and phonemes
+
+    encode(sentence, wav bytes) converts each chunk when audio_format is not WAV.
+    """
+    sentences = split_sentences(text)
+    yield sse_event("start", dict(meta or {}, sentences=len(sentences), audio_format=audio_format))
+
+    total = 0.0
+    try:
+        for index, sentence, audio_data, timeline, offset, duration in iter_sentence_audio(text, synthesize):
+            chunk = {
+                "index": index,
+                "text": sentence,
+                "start": round(offset, 3),
+                "duration": duration,
+                "audio": base64.b64encode(encode(sentence, audio_data) if encode else audio_data).decode("utf-8")
+            }
+            if include_phonemes:
+                chunk["phonemes"] = offset_phonemes(timeline, offset)
+            if include_envelope:
+                chunk["envelope"] = wav_envelope(audio_data)
+            yield sse_event("chunk", chunk)
+            total = offset + duration
+    except SchedulerBusy as e:
+        yield sse_event("error", {"error": str(e), "reason": e.reason, "retry_after": e.retry_after})
+        return
+    except Exception as e:
+        print(f"❌ TTS stream error: {e}")
+        yield sse_event("error", {"error": str(e)})
+        return
+
+    yield sse_event("end", {"duration": total})
+
+
+def pcm_stream(text, synthesize):
+    """(PCM, sample rate) for each sentence as it completes"""
+    for _, _, audio_data, _, _, _ in iter_sentence_audio(text, synthesize):
+        yield wav_pcm_view(audio_data)
+
+
+def wav_stream(text, synthesize):
+    """Chunked WAV: one streaming header, then raw PCM for each sentence as it completes"""
+    header_sent = False
+    for pcm, sample_rate in pcm_stream(text, synthesize):
+        if not header_sent:
+            yield streaming_wav_header(sample_rate)
+            header_sent = True
+        # WSGI servers only accept bytes, not views
+        yield bytes(pcm)
+
+
+def audio_stream(text, synthesize, audio_format="wav", encoders=None):
+    """Chunked audio in audio_format; compressed formats are encoded incrementally as sentences arrive"""
+    if audio_format == "wav":
+        return wav_stream(text, synthesize)
+    return encoders.encode_stream(pcm_stream(text, synthesize), audio_format)
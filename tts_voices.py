@@ -0,0 +1,168 @@
+"""
+Voice Registry for the iLearnHow TTS servers
+Discovers Piper voice models on disk and caches their metadata, re-reading a file only when its mtime changes
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+# Extra directories to discover voices in, besides the ones each server passes
+TTS_VOICE_DIRS = [d for d in os.environ.get("TTS_VOICE_DIRS", "").split(os.pathsep) if d]
+# Requests never stat the disk; the registry re-checks files at most this often
+TTS_VOICE_RESCAN_SECONDS = float(os.environ.get("TTS_VOICE_RESCAN_SECONDS", "10"))
+
+
+def voice_speaker(name):
+    """Avatar a model belongs to, from its file name: ken.onnx, ken_voice.onnx, kelly_model.onnx -> ken / kelly"""
+    return re.split(r"[_\-.]", name, 1)[0].lower()
+
+
+def config_candidates(model_path):
+    """Where a model's Piper config may live: voice.onnx.json (Piper's layout), voice.json, or x_model -> x_config.json"""
+    candidates = [model_path.with_name(model_path.name + ".json"), model_path.with_suffix(".json")]
+    if model_path.stem.endswith("_model"):
+        candidates.append(model_path.with_name(model_path.stem[:-len("_model")] + "_config.json"))
+    return candidates
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None when it is missing"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class VoiceRegistry:
+    """Every *.onnx voice in a set of directories, with file metadata cached until a file's mtime changes"""
+
+    def __init__(self, directories, rescan_seconds=TTS_VOICE_RESCAN_SECONDS, on_change=None):
+        self.directories = [Path(d) for d in list(directories) + TTS_VOICE_DIRS]
+        self.rescan_seconds = rescan_seconds
+        # Called with a model path when its file (or config) changes or disappears, e.g. to unload the old model
+        self.on_change = on_change
+        self._listings = {}
+        self._voices = {}
+        self._scanned_at = None
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.reloads = 0
+
+    def _describe(self, model_path, signature):
+        """Metadata for one model file; reads its config once per change"""
+        config_path = next((c for c in config_candidates(model_path) if c.is_file()), None)
+        voice = {
+            "name": model_path.stem,
+            "speaker": voice_speaker(model_path.stem),
+            "model_path": str(model_path),
+            "config_path": str(config_path) if config_path else None,
+            "size": signature[1],
+            "mtime": signature[0] / 1e9,
+            "config_signature": file_signature(config_path) if config_path else None,
+            "sample_rate": None,
+            "language": None,
+            # Piper cannot run a model without its config
+            "usable": False
+        }
+        if config_path:
+            try:
+                with open(config_path) as f:
+                    config = json.load(f)
+                voice["sample_rate"] = config.get("audio", {}).get("sample_rate")
+                voice["language"] = (config.get("language") or {}).get("code") or config.get("espeak", {}).get("voice")
+                voice["usable"] = True
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Voice registry: unreadable config {config_path}: {e}")
+        return voice
+
+    def _stale(self, voice, signature):
+        if (int(voice["mtime"] * 1e9), voice["size"]) != signature:
+            return True
+        config_path = next((c for c in config_candidates(Path(voice["model_path"])) if c.is_file()), None)
+        current = str(config_path) if config_path else None
+        return current != voice["config_path"] or (config_path and file_signature(config_path) != voice["config_signature"])
+
+    def refresh(self, force=False):
+        """Re-check the directories if the rescan interval has passed; directory listings are redone only on mtime change"""
+        now = time.monotonic()
+        if not force and self._scanned_at is not None and now - self._scanned_at < self.rescan_seconds:
+            return
+        changed = []
+        with self._lock:
+            if not force and self._scanned_at is not None and now - self._scanned_at < self.rescan_seconds:
+                return
+            self._scanned_at = now
+            self.scans += 1
+            seen = set()
+            for directory in self.directories:
+                signature = file_signature(directory)
+                if signature is None:
+                    continue
+                listing = self._listings.get(directory)
+                if listing is None or listing[0] != signature[0]:
+                    listing = self._listings[directory] = (signature[0], sorted(directory.glob("*.onnx")))
+                for model_path in listing[1]:
+                    key = str(model_path)
+                    if key in seen:
+                        continue
+                    model_signature = file_signature(model_path)
+                    if model_signature is None:
+                        continue
+                    seen.add(key)
+                    voice = self._voices.get(key)
+                    if voice is None or self._stale(voice, model_signature):
+                        if voice is not None:
+                            changed.append(key)
+                        self._voices[key] = self._describe(model_path, model_signature)
+            for key in set(self._voices) - seen:
+                del self._voices[key]
+                changed.append(key)
+            self.reloads += len(changed)
+
+        for key in changed:
+            print(f"🔄 Voice registry: {key} changed on disk")
+            if self.on_change:
+                self.on_change(key)
+
+    def voices(self):
+        self.refresh()
+        with self._lock:
+            return [dict(v) for v in self._voices.values()]
+
+    def get(self, name):
+        """A voice by name (file stem) or model path"""
+        self.refresh()
+        with self._lock:
+            voice = self._voices.get(str(name))
+            if voice is None:
+                voice = next((v for v in self._voices.values() if v["name"] == name), None)
+            return dict(voice) if voice else None
+
+    def for_speaker(self, speaker):
+        """Usable voices discovered for an avatar"""
+        return [v for v in self.voices() if v["speaker"] == speaker and v["usable"]]
+
+    def preferred(self, speaker, model_path=None):
+        """The usable voice at model_path if there is one, else the first usable voice discovered for speaker"""
+        if model_path is not None:
+            voice = self.get(str(model_path))
+            if voice and voice["usable"]:
+                return voice
+        voices = self.for_speaker(speaker)
+        return voices[0] if voices else None
+
+    def stats(self):
+        voices = self.voices()
+        return {
+            "directories": [str(d) for d in self.directories],
+            "voices": len(voices),
+            "usable": sum(v["usable"] for v in voices),
+            "scans": self.scans,
+            "reloads": self.reloads,
+            "rescan_seconds": self.rescan_seconds
+        }